@@ -9,12 +9,15 @@ from core import (
     api_key_required,
     autocomplete,
     block_stats,
+    block_stats_history,
     check_api_keys,
     check_api_status,
     convert_uri_to_url,
     cursor_recall_status,
+    distinct_block_counts,
     fun_facts,
     funer_facts,
+    get_block_waves,
     get_blocked_search,
     get_blocking_search,
     get_blocklist,
@@ -536,6 +539,63 @@ async def auth_block_stats() -> jsonify:
         return jsonify({"error": "Internal error"}), 500
 
 
+@api_blueprint.route("/api/v1/auth/lists/block-stats/history", methods=["GET"])
+@check_api_status("/api/v1/auth/lists/block-stats/history")
+@api_key_required("SERVER")
+@rate_limit(30, timedelta(seconds=1))
+async def auth_block_stats_history() -> jsonify:
+    try:
+        return await block_stats_history()
+    except DatabaseConnectionError:
+        logger.error("Database connection error")
+        return jsonify({"error": "Connection error"}), 503
+    except BadRequest:
+        return jsonify({"error": "Invalid request"}), 400
+    except NotFound:
+        return jsonify({"error": "Not found"}), 404
+    except Exception as e:
+        logger.error(f"Error in auth_block_stats_history: {e}")
+        return jsonify({"error": "Internal error"}), 500
+
+
+@api_blueprint.route("/api/v1/auth/lists/block-stats/distinct", methods=["GET"])
+@check_api_status("/api/v1/auth/lists/block-stats/distinct")
+@api_key_required("SERVER")
+@rate_limit(30, timedelta(seconds=1))
+async def auth_distinct_block_counts() -> jsonify:
+    try:
+        return await distinct_block_counts()
+    except DatabaseConnectionError:
+        logger.error("Database connection error")
+        return jsonify({"error": "Connection error"}), 503
+    except BadRequest:
+        return jsonify({"error": "Invalid request"}), 400
+    except NotFound:
+        return jsonify({"error": "Not found"}), 404
+    except Exception as e:
+        logger.error(f"Error in auth_distinct_block_counts: {e}")
+        return jsonify({"error": "Internal error"}), 500
+
+
+@api_blueprint.route("/api/v1/auth/lists/block-waves", methods=["GET"])
+@check_api_status("/api/v1/auth/lists/block-waves")
+@api_key_required("SERVER")
+@rate_limit(30, timedelta(seconds=1))
+async def auth_block_waves() -> jsonify:
+    try:
+        return await get_block_waves()
+    except DatabaseConnectionError:
+        logger.error("Database connection error")
+        return jsonify({"error": "Connection error"}), 503
+    except BadRequest:
+        return jsonify({"error": "Invalid request"}), 400
+    except NotFound:
+        return jsonify({"error": "Not found"}), 404
+    except Exception as e:
+        logger.error(f"Error in auth_block_waves: {e}")
+        return jsonify({"error": "Internal error"}), 500
+
+
 @api_blueprint.route("/api/v1/auth/base/autocomplete/<client_identifier>", methods=["GET"])
 @check_api_status("/api/v1/auth/base/autocomplete")
 @api_key_required("SERVER")
@@ -1286,6 +1346,60 @@ async def anon_block_stats() -> jsonify:
         return jsonify({"error": "Internal error"}), 500
 
 
+@api_blueprint.route("/api/v1/anon/lists/block-stats/history", methods=["GET"])
+@check_api_status("/api/v1/anon/lists/block-stats/history")
+@rate_limit(5, timedelta(seconds=1))
+async def anon_block_stats_history() -> jsonify:
+    try:
+        return await block_stats_history()
+    except DatabaseConnectionError:
+        logger.error("Database connection error")
+        return jsonify({"error": "Connection error"}), 503
+    except BadRequest:
+        return jsonify({"error": "Invalid request"}), 400
+    except NotFound:
+        return jsonify({"error": "Not found"}), 404
+    except Exception as e:
+        logger.error(f"Error in anon_block_stats_history: {e}")
+        return jsonify({"error": "Internal error"}), 500
+
+
+@api_blueprint.route("/api/v1/anon/lists/block-stats/distinct", methods=["GET"])
+@check_api_status("/api/v1/anon/lists/block-stats/distinct")
+@rate_limit(5, timedelta(seconds=1))
+async def anon_distinct_block_counts() -> jsonify:
+    try:
+        return await distinct_block_counts()
+    except DatabaseConnectionError:
+        logger.error("Database connection error")
+        return jsonify({"error": "Connection error"}), 503
+    except BadRequest:
+        return jsonify({"error": "Invalid request"}), 400
+    except NotFound:
+        return jsonify({"error": "Not found"}), 404
+    except Exception as e:
+        logger.error(f"Error in anon_distinct_block_counts: {e}")
+        return jsonify({"error": "Internal error"}), 500
+
+
+@api_blueprint.route("/api/v1/anon/lists/block-waves", methods=["GET"])
+@check_api_status("/api/v1/anon/lists/block-waves")
+@rate_limit(5, timedelta(seconds=1))
+async def anon_block_waves() -> jsonify:
+    try:
+        return await get_block_waves()
+    except DatabaseConnectionError:
+        logger.error("Database connection error")
+        return jsonify({"error": "Connection error"}), 503
+    except BadRequest:
+        return jsonify({"error": "Invalid request"}), 400
+    except NotFound:
+        return jsonify({"error": "Not found"}), 404
+    except Exception as e:
+        logger.error(f"Error in anon_block_waves: {e}")
+        return jsonify({"error": "Internal error"}), 500
+
+
 @api_blueprint.route("/api/v1/anon/base/autocomplete/<client_identifier>", methods=["GET"])
 @check_api_status("/api/v1/anon/base/autocomplete")
 @rate_limit(5, timedelta(seconds=1))
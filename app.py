@@ -13,12 +13,14 @@ from quart_rate_limiter import RateLimiter
 
 import config_helper
 import database_handler
+import schema_migrations
+import stats_history
 import utils
 from apis import api_blueprint
 from config_helper import logger
 from core import db_pool_acquired, initialize, load_api_statuses
 from environment import get_api_var
-from errors import DatabaseConnectionError, NotFound
+from errors import DatabaseConnectionError, InternalServerError, NotFound
 from helpers import (
     blocklist_24_failed,
     blocklist_failed,
@@ -43,6 +45,9 @@ try:
 except OSError:
     username = "Unknown"
 
+refresh_concurrency = config.getint("schedule", "refresh_concurrency", fallback=4)
+replica_probe_interval = config.getint("replicas", "probe_interval_seconds", fallback=10)
+
 app = Quart(__name__)
 app.register_blueprint(api_blueprint)
 rate_limiter = RateLimiter(app)
@@ -94,20 +99,67 @@ async def run_web_server() -> None:
     await app.run_task(host=ip_address, port=int(port_address))
 
 
+async def run_refresh_jobs(*jobs) -> None:
+    # The refresh jobs are independent of each other, they run together with at most refresh_concurrency at a time
+    semaphore = asyncio.Semaphore(refresh_concurrency)
+
+    async def run(job):
+        async with semaphore:
+            return await job()
+
+    results = await asyncio.gather(*(run(job) for job in jobs), return_exceptions=True)
+
+    for job, result in zip(jobs, results, strict=True):
+        if isinstance(result, Exception):
+            logger.error(f"{job.__name__} failed: {result!r}")
+
+
+async def run_schema_migrations() -> None:
+    try:
+        if schema_migrations.apply_on_startup:
+            applied = await schema_migrations.apply_migrations()
+            logger.info(f"Schema migrations applied: {applied}.")
+        else:
+            schema_migrations.migrations_applied.set()
+
+        await schema_migrations.verify_hot_query_plans()
+    except (DatabaseConnectionError, InternalServerError):
+        logger.error("Schema migrations failed, retrying at the next start.")
+
+
 async def first_run() -> None:
     while not db_pool_acquired.is_set():
         logger.info("db connection not acquired, waiting for established connection.")
         await asyncio.sleep(5)
 
+    history_points = await asyncio.to_thread(stats_history.load_history)
+    logger.info(f"Statistics history loaded: {history_points} points.")
+
+    # Index builds of a new migration can take a while on a first deploy, the refresh jobs below wait for them
+    await run_schema_migrations()
+
+    # Serve similarity requests from the last snapshot until the fresh load below completes
+    await database_handler.load_block_snapshot()
+    await database_handler.load_similar_users()
+
     while True:
         if db_pool_acquired.is_set():
             blocklist_24_failed.clear()
             blocklist_failed.clear()
 
-            await database_handler.blocklists_updater()
-            await database_handler.top_24blocklists_updater()
-            await utils.update_block_statistics()
-            await utils.update_total_users()
+            await run_refresh_jobs(
+                database_handler.blocklists_updater,
+                database_handler.top_24blocklists_updater,
+                utils.update_block_statistics,
+                utils.update_total_users,
+            )
+
+            try:
+                await database_handler.load_all_blocks()
+            except DatabaseConnectionError:
+                logger.error("Block cache load failed, retrying at the next scheduled refresh.")
+            else:
+                await database_handler.precompute_similar_users()
 
             break
 
@@ -115,29 +167,41 @@ async def first_run() -> None:
         await asyncio.sleep(30)
 
 
-@aiocron.crontab("0 */12 * * *")  # Every 12 hours
-async def schedule_stats_update() -> None:
-    logger.info("Starting scheduled stats update.")
+async def run_replica_probes() -> None:
+    # Read replica health checks, more often than a crontab allows so an ejected replica comes back quickly
+    await db_pool_acquired.wait()
 
-    if database_handler.blocklist_updater_status.is_set():
-        logger.warning("Blocklist updater is already running.")
-    else:
-        await database_handler.blocklists_updater()
+    while True:
+        await database_handler.probe_read_replicas()
+        await asyncio.sleep(replica_probe_interval)
 
-    if database_handler.blocklist_24_updater_status.is_set():
-        logger.warning("Top 24 blocklist updater is already running.")
-    else:
-        await database_handler.top_24blocklists_updater()
 
-    if utils.block_stats_status.is_set():
-        logger.warning("Block stats updater is already running.")
-    else:
-        await utils.update_block_statistics()
+@aiocron.crontab("0 */12 * * *")  # Every 12 hours
+async def schedule_stats_update() -> None:
+    logger.info("Starting scheduled stats update.")
 
-    if utils.total_users_status.is_set():
-        logger.warning("Total users updater is already running.")
-    else:
-        await utils.update_total_users()
+    jobs = []
+    for status, job, name in (
+        (database_handler.blocklist_updater_status, database_handler.blocklists_updater, "Blocklist updater"),
+        (
+            database_handler.blocklist_24_updater_status,
+            database_handler.top_24blocklists_updater,
+            "Top 24 blocklist updater",
+        ),
+        (
+            database_handler.similar_users_precompute_status,
+            database_handler.precompute_similar_users,
+            "Similar users precompute",
+        ),
+        (utils.block_stats_status, utils.update_block_statistics, "Block stats updater"),
+        (utils.total_users_status, utils.update_total_users, "Total users updater"),
+    ):
+        if status.is_set():
+            logger.warning(f"{name} is already running.")
+        else:
+            jobs.append(job)
+
+    await run_refresh_jobs(*jobs)
 
     logger.info("Scheduled stats update complete.")
 
@@ -156,11 +220,97 @@ async def schedule_total_users_update() -> None:
     logger.info("Scheduled total users update complete.")
 
 
+@aiocron.crontab("0 0 * * *")  # Every 24 hours
+async def schedule_block_cache_refresh() -> None:
+    if database_handler.block_cache_status.is_set():
+        logger.warning("Block cache is already being refreshed.")
+
+        return
+
+    logger.info("Starting scheduled block cache refresh.")
+
+    try:
+        await database_handler.load_all_blocks()
+    except (DatabaseConnectionError, InternalServerError):
+        logger.error("Block cache refresh failed, the block cache is kept until the next scheduled refresh.")
+
+        return
+
+    logger.info("Scheduled block cache refresh complete.")
+
+
+@aiocron.crontab("*/5 * * * *")  # Every 5 mins
+async def schedule_block_cache_update() -> None:
+    if database_handler.all_blocks_graph is None or database_handler.all_blocks_lock.locked():
+        return
+
+    try:
+        await database_handler.update_all_blocks()
+    except (DatabaseConnectionError, InternalServerError):
+        logger.error("Block cache update failed, retrying at the next scheduled update.")
+
+
+@aiocron.crontab("*/5 * * * *")  # Every 5 mins
+async def schedule_top_24_blocks_update() -> None:
+    # The 12 hour stats update reloads the window, in between only new blocks are added and expired hours dropped
+    if database_handler.top_24_window is None or database_handler.blocklist_24_updater_status.is_set():
+        return
+
+    try:
+        await database_handler.top_24blocklists_updater(reload=False)
+    except (DatabaseConnectionError, InternalServerError):
+        logger.error("Top 24 blocks update failed, retrying at the next scheduled update.")
+
+
+@aiocron.crontab("*/5 * * * *")  # Every 5 mins
+async def schedule_block_counts_update() -> None:
+    # The block counts tables are created by migration 0001
+    if database_handler.block_counts_status.is_set() or not schema_migrations.migrations_applied.is_set():
+        return
+
+    try:
+        await database_handler.update_block_counts()
+        await utils.update_trending_windows()
+    except (DatabaseConnectionError, InternalServerError):
+        logger.error("Block counts update failed, retrying at the next scheduled update.")
+
+
+@aiocron.crontab("32 3 * * *")  # Every 24 hours, between the 5 min updates
+async def schedule_block_counts_rebuild() -> None:
+    # Recounts the recent buckets from blocklists, in case a change was never seen in blocklists_transaction
+    if not schema_migrations.migrations_applied.is_set():
+        return
+
+    if database_handler.block_counts_status.is_set():
+        logger.warning("Block counts update is already running, rebuild skipped.")
+
+        return
+
+    try:
+        await database_handler.update_block_counts(rebuild=True)
+    except (DatabaseConnectionError, InternalServerError):
+        logger.error("Block counts rebuild failed, retrying at the next scheduled rebuild.")
+
+
+@aiocron.crontab("* * * * *")  # Every minute
+async def schedule_block_waves_update() -> None:
+    if database_handler.block_waves_status.is_set():
+        return
+
+    try:
+        await database_handler.update_block_waves()
+    except DatabaseConnectionError:
+        logger.error("Block waves update failed, retrying at the next scheduled update.")
+
+
 @aiocron.crontab("*/10 * * * *")  # Every 10 mins
 async def refresh_cache():
     logger.info("Refreshing API cache.")
     await load_api_statuses()
 
+    # Picks up a changed override setting without a restart
+    database_handler.route_pools()
+
 
 def api_key_required(key_type) -> callable:
     def decorator(func) -> callable:
@@ -222,7 +372,7 @@ async def main():
 
     await initialize_task
 
-    await asyncio.gather(run_web_server_task, first_run())
+    await asyncio.gather(run_web_server_task, first_run(), run_replica_probes())
 
 
 if __name__ == "__main__":
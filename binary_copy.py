@@ -0,0 +1,85 @@
+# binary_copy.py
+
+from struct import Struct
+
+# ======================================================================================================================
+# ========================================= COPY (FORMAT binary) decoding ==============================================
+# Stream layout: 11 byte signature, int32 flags, int32 header extension length and extension, then one tuple per row
+# (int16 field count, per field an int32 length, -1 for NULL, and the raw value), ended by a field count of -1.
+# Only text columns are decoded, their binary form is the UTF-8 bytes.
+
+SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+HEADER_SIZE = len(SIGNATURE) + 8
+
+int16 = Struct(">h")
+int32 = Struct(">i")
+
+
+class BinaryCopyParser:
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.header_read = False
+        self.finished = False
+        self.bytes_read = 0
+        self.row_count = 0
+
+    def feed(self, data: bytes) -> list[list[str | None]]:
+        # Decodes every complete row in the buffered data, a partial row is kept for the next chunk
+        buffer = self.buffer
+        buffer += data
+        self.bytes_read += len(data)
+
+        position = 0
+        if not self.header_read:
+            if len(buffer) < HEADER_SIZE:
+                return []
+
+            if buffer[: len(SIGNATURE)] != SIGNATURE:
+                raise ValueError("Invalid COPY binary signature.")
+
+            extension_length = int32.unpack_from(buffer, HEADER_SIZE - 4)[0]
+            if len(buffer) < HEADER_SIZE + extension_length:
+                return []
+
+            position = HEADER_SIZE + extension_length
+            self.header_read = True
+
+        rows = []
+        end = len(buffer)
+        while not self.finished and position + 2 <= end:
+            row_start = position
+            field_count = int16.unpack_from(buffer, position)[0]
+            position += 2
+
+            if field_count == -1:
+                self.finished = True
+                break
+
+            row = []
+            for _ in range(field_count):
+                if position + 4 > end:
+                    break
+
+                length = int32.unpack_from(buffer, position)[0]
+                position += 4
+
+                if length == -1:
+                    row.append(None)
+                    continue
+
+                if position + length > end:
+                    break
+
+                row.append(buffer[position : position + length].decode())
+                position += length
+
+            if len(row) < field_count:
+                position = row_start
+                break
+
+            rows.append(row)
+
+        del buffer[:position]
+        self.row_count += len(rows)
+
+        return rows
@@ -0,0 +1,109 @@
+# block_distribution.py
+
+import math
+from collections import Counter
+
+# ======================================================================================================================
+# ============================================ Block count distributions ===============================================
+# A distribution maps a block count to the number of users with exactly that count (blocks per user or blocked-by per
+# user). Distinct counts are few compared to users, so every summary is a walk over the sorted counts.
+
+percentile_levels = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p99.9", 0.999))
+
+# The published buckets, (name, lowest count, highest count or None)
+count_buckets = (
+    ("1", 1, 1),
+    ("2_and_100", 2, 100),
+    ("101_and_1000", 101, 1000),
+    ("greater_than_1000", 1001, None),
+)
+
+
+class BlockCountDistribution:
+    def __init__(self, counts=None) -> None:
+        self.counts = Counter()  # block count: users
+
+        if counts is not None:
+            self.update(counts)
+
+    def update(self, counts) -> None:
+        # Adds another distribution or (count, users) changes, counts that drop to zero users are removed
+        items = counts.items() if hasattr(counts, "items") else counts
+
+        for count, users in items:
+            if count <= 0 or not users:
+                continue
+
+            total = self.counts[count] + users
+
+            if total:
+                self.counts[count] = total
+            else:
+                del self.counts[count]
+
+    def copy(self) -> "BlockCountDistribution":
+        return BlockCountDistribution(self.counts)
+
+    def move(self, previous_count, count) -> None:
+        # One user's block count changed, a count of 0 means the user is not in the distribution
+        self.update(((previous_count, -1), (count, 1)))
+
+    @property
+    def users(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def total(self) -> int:
+        return sum(count * users for count, users in self.counts.items())
+
+    def average(self) -> float:
+        users = self.users
+
+        return self.total / users if users else 0.0
+
+    def range_users(self, low, high=None) -> int:
+        return sum(users for count, users in self.counts.items() if count >= low and (high is None or count <= high))
+
+    def percentiles(self, levels=percentile_levels) -> dict:
+        # Nearest rank: the lowest count at or below which at least the level's share of users fall
+        users = self.users
+        sorted_counts = sorted(self.counts.items())
+        result = {}
+
+        for name, level in levels:
+            rank = max(1, math.ceil(users * level))
+            cumulative = 0
+            value = None
+
+            for count, count_users in sorted_counts:
+                cumulative += count_users
+
+                if cumulative >= rank:
+                    value = count
+                    break
+
+            result[name] = value
+
+        return result
+
+    def log_histogram(self, base=2) -> list[dict]:
+        # Buckets [1, base), [base, base^2), ... , empty buckets between populated ones are included
+        buckets = Counter()
+
+        for count, users in self.counts.items():
+            exponent = 0
+            while base ** (exponent + 1) <= count:
+                exponent += 1
+
+            buckets[exponent] += users
+
+        if not buckets:
+            return []
+
+        return [
+            {"min": base**exponent, "max": base ** (exponent + 1) - 1, "users": buckets[exponent]}
+            for exponent in range(max(buckets) + 1)
+        ]
+
+    def bucket_users(self) -> dict:
+        return {name: self.range_users(low, high) for name, low, high in count_buckets}
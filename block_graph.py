@@ -0,0 +1,553 @@
+# block_graph.py
+
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from heapq import nlargest
+from itertools import chain
+from operator import itemgetter
+from struct import Struct
+
+# ======================================================================================================================
+# ================================================ Block graph store ===================================================
+# DIDs are interned to int32 ids assigned in sorted DID order, so the id table doubles as a sorted lookup table.
+# Adjacency is kept in CSR form: the targets of node i are targets[offsets[i]:offsets[i + 1]], sorted and unique.
+# A graph loaded from a snapshot file holds memoryviews over a read-only mmap instead of arrays.
+
+SNAPSHOT_MAGIC = b"CSBLOCKG"
+SNAPSHOT_VERSION = 1
+# magic, version, flags, last applied blocklists_transaction serial_id, node count, edge count, DID data size
+snapshot_header = Struct("<8sIIqqqq")
+graph_arrays = (
+    "did_offsets",
+    "did_data",
+    "blocking_offsets",
+    "blocking_targets",
+    "blocked_by_offsets",
+    "blocked_by_targets",
+)
+
+
+class BlockGraph:
+    def __init__(
+        self,
+        did_offsets: array,
+        did_data: bytes,
+        blocking_offsets: array,
+        blocking_targets: array,
+        blocked_by_offsets: array,
+        blocked_by_targets: array,
+        snapshot_path: str | None = None,
+    ) -> None:
+        self.did_offsets = did_offsets
+        self.did_data = did_data
+        self.blocking_offsets = blocking_offsets
+        self.blocking_targets = blocking_targets
+        self.blocked_by_offsets = blocked_by_offsets
+        self.blocked_by_targets = blocked_by_targets
+        self.snapshot_path = snapshot_path
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+
+        if self.snapshot_path is not None:
+            # Processes receiving a snapshot backed graph map the file themselves instead of getting a copy
+            for name in graph_arrays:
+                del state[name]
+
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+
+        if self.snapshot_path is not None and "did_data" not in state:
+            arrays, _last_serial = map_snapshot(self.snapshot_path)
+            self.__dict__.update(arrays)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.did_offsets) - 1
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.blocking_targets)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (
+            self.did_offsets,
+            self.blocking_offsets,
+            self.blocking_targets,
+            self.blocked_by_offsets,
+            self.blocked_by_targets,
+        )
+
+        return len(self.did_data) + sum(len(item) * item.itemsize for item in arrays)
+
+    def did(self, node: int) -> str:
+        return str(self.did_data[self.did_offsets[node] : self.did_offsets[node + 1]], "utf-8")
+
+    def lookup(self, did: str) -> int | None:
+        key = did.encode()
+        stored_count = len(self.did_offsets) - 1
+        node = bisect_left(range(stored_count), key, key=self._did_bytes)
+
+        if node < stored_count and self._did_bytes(node) == key:
+            return node
+
+        return None
+
+    def blocking(self, node: int) -> array:
+        return self.blocking_targets[self.blocking_offsets[node] : self.blocking_offsets[node + 1]]
+
+    def blocked_by(self, node: int) -> array:
+        return self.blocked_by_targets[self.blocked_by_offsets[node] : self.blocked_by_offsets[node + 1]]
+
+    def blocking_count(self, node: int) -> int:
+        return self.blocking_offsets[node + 1] - self.blocking_offsets[node]
+
+    def blocked_by_count(self, node: int) -> int:
+        return self.blocked_by_offsets[node + 1] - self.blocked_by_offsets[node]
+
+    def blockers(self, min_blocks: int = 1) -> list[str]:
+        return [self.did(node) for node in range(self.node_count) if self.blocking_count(node) >= min_blocks]
+
+    def similar_blockers(self, did: str, limit: int = 20, threshold: float = 1) -> list[tuple[str, float]] | None:
+        # Users whose blocklists contain the largest share of this user's blocklist, as (did, match %).
+        # Only blockers that share at least one blocked account are ever touched, via the blocked_by index.
+        node = self.lookup(did)
+
+        if node is None:
+            return None
+
+        blocked = self.blocking(node)
+
+        if not blocked:
+            return None
+
+        common_counts = Counter(chain.from_iterable(map(self.blocked_by, blocked)))
+        common_counts.pop(node, None)
+
+        return self.rank(common_counts, len(blocked), limit, threshold)
+
+    def similar_blocked(self, did: str, limit: int = 20, threshold: float = 1) -> list[tuple[str, float]] | None:
+        # Users blocked by the largest share of the accounts blocking this user, as (did, match %).
+        # Only accounts that share at least one blocker are ever touched, via the blocking index of each blocker.
+        node = self.lookup(did)
+
+        if node is None:
+            return None
+
+        blockers = self.blocked_by(node)
+
+        if not blockers:
+            return None
+
+        common_counts = Counter(chain.from_iterable(map(self.blocking, blockers)))
+        common_counts.pop(node, None)
+
+        return self.rank(common_counts, len(blockers), limit, threshold)
+
+    def rank(self, common_counts: Counter, total: int, limit: int, threshold: float) -> list[tuple[str, float]]:
+        ranked = []
+
+        for other, common_count in nlargest(limit, common_counts.items(), key=itemgetter(1)):
+            match_percentage = (common_count / total) * 100
+
+            if match_percentage > threshold:
+                ranked.append((self.did(other), match_percentage))
+
+        return ranked
+
+    def _did_bytes(self, node: int) -> bytes:
+        return bytes(self.did_data[self.did_offsets[node] : self.did_offsets[node + 1]])
+
+
+class BlockGraphBuilder:
+    def __init__(self) -> None:
+        self.ids = {}
+        self.dids = []
+        self.sources = array("i")
+        self.destinations = array("i")
+
+    def intern(self, did: str) -> int:
+        node = self.ids.get(did)
+
+        if node is None:
+            node = len(self.dids)
+            self.ids[did] = node
+            self.dids.append(did)
+
+        return node
+
+    def add(self, user_did: str, blocked_did: str) -> None:
+        if user_did is None or blocked_did is None:
+            return
+
+        self.sources.append(self.intern(user_did))
+        self.destinations.append(self.intern(blocked_did))
+
+    def add_rows(self, rows) -> None:
+        # Columns after the first two are ignored
+        for row in rows:
+            self.add(row[0], row[1])
+
+    def build(self) -> BlockGraph:
+        dids = self.dids
+        sources = self.sources
+        destinations = self.destinations
+
+        # The builder is single use, release the interning table before the CSR arrays are allocated
+        self.ids = {}
+        self.dids = []
+        self.sources = array("i")
+        self.destinations = array("i")
+
+        return build_graph(dids, sources, destinations)
+
+
+class BlockGraphOverlay(BlockGraph):
+    # Block changes applied on top of a built graph until it is compacted. DIDs first seen after the build get ids
+    # from the base node count upwards. Added targets are never in the base row, removed targets always are.
+    def __init__(self, graph: BlockGraph, did_serials: dict | None = None) -> None:
+        super().__init__(
+            graph.did_offsets,
+            graph.did_data,
+            graph.blocking_offsets,
+            graph.blocking_targets,
+            graph.blocked_by_offsets,
+            graph.blocked_by_targets,
+            graph.snapshot_path,
+        )
+        self.base_count = graph.node_count
+        self.new_ids = {}
+        self.new_dids = []
+        self.blocking_changes = {}  # node: (added targets, removed targets)
+        self.blocked_by_changes = {}
+        # node: base row merged with its changes, kept until the next change to that node
+        self.blocking_rows = {}
+        self.blocked_by_rows = {}
+        self.change_count = 0
+        self.edge_delta = 0
+        # did: serial_id of the last change to its blocks, kept by DID so it carries over compactions
+        self.did_serials = {} if did_serials is None else did_serials
+
+    @property
+    def node_count(self) -> int:
+        return self.base_count + len(self.new_dids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.blocking_targets) + self.edge_delta
+
+    def did(self, node: int) -> str:
+        if node < self.base_count:
+            return super().did(node)
+
+        return self.new_dids[node - self.base_count]
+
+    def lookup(self, did: str) -> int | None:
+        node = super().lookup(did)
+
+        return self.new_ids.get(did) if node is None else node
+
+    def blocking(self, node: int) -> array:
+        changes = self.blocking_changes.get(node)
+
+        if changes is None:
+            return super().blocking(node) if node < self.base_count else array("i")
+
+        row = self.blocking_rows.get(node)
+
+        if row is None:
+            targets = super().blocking(node) if node < self.base_count else array("i")
+            row = self.blocking_rows[node] = apply_changes(targets, changes)
+
+        return row
+
+    def blocked_by(self, node: int) -> array:
+        changes = self.blocked_by_changes.get(node)
+
+        if changes is None:
+            return super().blocked_by(node) if node < self.base_count else array("i")
+
+        row = self.blocked_by_rows.get(node)
+
+        if row is None:
+            targets = super().blocked_by(node) if node < self.base_count else array("i")
+            row = self.blocked_by_rows[node] = apply_changes(targets, changes)
+
+        return row
+
+    def blocking_count(self, node: int) -> int:
+        count = super().blocking_count(node) if node < self.base_count else 0
+        added, removed = self.blocking_changes.get(node, ((), ()))
+
+        return count + len(added) - len(removed)
+
+    def blocked_by_count(self, node: int) -> int:
+        count = super().blocked_by_count(node) if node < self.base_count else 0
+        added, removed = self.blocked_by_changes.get(node, ((), ()))
+
+        return count + len(added) - len(removed)
+
+    def intern(self, did: str) -> int:
+        node = self.lookup(did)
+
+        if node is None:
+            node = self.node_count
+            self.new_ids[did] = node
+            self.new_dids.append(did)
+
+        return node
+
+    def apply(self, user_did: str, blocked_did: str, delete: bool, serial: int = 0) -> bool:
+        # Returns whether the edge set changed. A delete removes the edge even if the same block is still stored
+        # under another uri, the periodic full rebuild corrects that.
+        if user_did is None or blocked_did is None:
+            return False
+
+        if delete:
+            user = self.lookup(user_did)
+            blocked = self.lookup(blocked_did)
+
+            if user is None or blocked is None or not self.remove_edge(user, blocked):
+                return False
+
+            self.edge_delta -= 1
+        else:
+            user = self.intern(user_did)
+            blocked = self.intern(blocked_did)
+
+            if not self.add_edge(user, blocked):
+                return False
+
+            self.edge_delta += 1
+
+        self.change_count += 1
+        self.did_serials[user_did] = serial
+        self.did_serials[blocked_did] = serial
+
+        return True
+
+    def add_edge(self, user: int, blocked: int) -> bool:
+        added, removed = self.blocking_changes.get(user, ((), ()))
+
+        if blocked in removed:
+            self.change_edge(user, blocked, restore=True)
+
+            return True
+
+        if blocked in added or self.has_base_edge(user, blocked):
+            return False
+
+        self.change_edge(user, blocked, add=True)
+
+        return True
+
+    def remove_edge(self, user: int, blocked: int) -> bool:
+        added, removed = self.blocking_changes.get(user, ((), ()))
+
+        if blocked in added:
+            self.change_edge(user, blocked, restore=True)
+
+            return True
+
+        if blocked in removed or not self.has_base_edge(user, blocked):
+            return False
+
+        self.change_edge(user, blocked, add=False)
+
+        return True
+
+    def change_edge(self, user: int, blocked: int, add: bool = False, restore: bool = False) -> None:
+        update_changes(self.blocking_changes, user, blocked, add, restore)
+        update_changes(self.blocked_by_changes, blocked, user, add, restore)
+
+        self.blocking_rows.pop(user, None)
+        self.blocked_by_rows.pop(blocked, None)
+
+    def has_base_edge(self, user: int, blocked: int) -> bool:
+        if user >= self.base_count or blocked >= self.base_count:
+            return False
+
+        start = self.blocking_offsets[user]
+        end = self.blocking_offsets[user + 1]
+        position = bisect_left(self.blocking_targets, blocked, start, end)
+
+        return position < end and self.blocking_targets[position] == blocked
+
+    def compact(self) -> BlockGraph:
+        dids = list(map(self.did, range(self.node_count)))
+        sources = array("i")
+        destinations = array("i")
+
+        for node in range(self.node_count):
+            targets = self.blocking(node)
+            sources.extend([node] * len(targets))
+            destinations.extend(targets)
+
+        return build_graph(dids, sources, destinations)
+
+
+def apply_changes(targets: array, changes: tuple[set, set] | None) -> array:
+    if changes is None:
+        return targets
+
+    added, removed = changes
+
+    return array("i", sorted(set(targets).difference(removed).union(added)))
+
+
+def update_changes(changes: dict, node: int, target: int, add: bool = False, restore: bool = False) -> None:
+    added, removed = changes.setdefault(node, (set(), set()))
+
+    if restore:
+        # Undo an earlier change back to the base row
+        added.discard(target)
+        removed.discard(target)
+    elif add:
+        added.add(target)
+    else:
+        removed.add(target)
+
+    if not added and not removed:
+        del changes[node]
+
+
+def build_graph(dids: list[str], sources: array, destinations: array) -> BlockGraph:
+    # Re-number provisional ids so that ids follow sorted DID order
+    order = sorted(range(len(dids)), key=dids.__getitem__)
+    remap = array("i", bytes(4 * len(order)))
+    for node, provisional in enumerate(order):
+        remap[provisional] = node
+
+    did_offsets = array("q", [0])
+    did_data = bytearray()
+    for provisional in order:
+        did_data += dids[provisional].encode()
+        did_offsets.append(len(did_data))
+
+    node_count = len(order)
+    del dids, order
+
+    sources = array("i", map(remap.__getitem__, sources))
+    destinations = array("i", map(remap.__getitem__, destinations))
+    del remap
+
+    blocking_offsets, blocking_targets = build_csr(node_count, sources, destinations)
+    del sources, destinations
+
+    reverse_sources = array("i")
+    for node in range(node_count):
+        reverse_sources.extend([node] * (blocking_offsets[node + 1] - blocking_offsets[node]))
+    blocked_by_offsets, blocked_by_targets = build_csr(node_count, blocking_targets, reverse_sources)
+
+    return BlockGraph(
+        did_offsets,
+        bytes(did_data),
+        blocking_offsets,
+        blocking_targets,
+        blocked_by_offsets,
+        blocked_by_targets,
+    )
+
+
+def write_snapshot(graph: BlockGraph, path: str, last_serial: int) -> None:
+    # Every section starts on an 8 byte boundary so it can be cast in place once mapped
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+
+    with open(temp_path, "wb") as file:
+        file.write(
+            snapshot_header.pack(
+                SNAPSHOT_MAGIC,
+                SNAPSHOT_VERSION,
+                0,
+                last_serial,
+                graph.node_count,
+                graph.edge_count,
+                len(graph.did_data),
+            )
+        )
+
+        for name in graph_arrays:
+            data = getattr(graph, name)
+            file.write(data)
+            file.write(bytes(-len(memoryview(data).cast("B")) % 8))
+
+        file.flush()
+        os.fsync(file.fileno())
+
+    # Readers keep their mapping of the previous file, the replace is atomic for new readers
+    os.replace(temp_path, path)
+
+
+def map_snapshot(path: str) -> tuple[dict, int]:
+    if sys.byteorder != "little":
+        raise ValueError("Block graph snapshots are little endian.")
+
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)
+    magic, version, _flags, last_serial, node_count, edge_count, did_data_size = snapshot_header.unpack_from(view)
+
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported block graph snapshot: {path}")
+
+    sizes = {
+        "did_offsets": ("q", node_count + 1),
+        "did_data": ("B", did_data_size),
+        "blocking_offsets": ("q", node_count + 1),
+        "blocking_targets": ("i", edge_count),
+        "blocked_by_offsets": ("q", node_count + 1),
+        "blocked_by_targets": ("i", edge_count),
+    }
+
+    arrays = {}
+    position = snapshot_header.size
+    for name in graph_arrays:
+        typecode, count = sizes[name]
+        size = count * array(typecode).itemsize
+
+        if position + size > len(view):
+            raise ValueError(f"Truncated block graph snapshot: {path}")
+
+        section = view[position : position + size]
+        arrays[name] = section if typecode == "B" else section.cast(typecode)
+        position += size + (-size % 8)
+
+    return arrays, last_serial
+
+
+def load_snapshot(path: str) -> tuple[BlockGraph, int]:
+    arrays, last_serial = map_snapshot(path)
+
+    return BlockGraph(**arrays, snapshot_path=path), last_serial
+
+
+def build_csr(node_count: int, sources: array, destinations: array) -> tuple[array, array]:
+    degrees = Counter(sources)
+
+    offsets = array("q", bytes(8 * (node_count + 1)))
+    for node in range(node_count):
+        offsets[node + 1] = offsets[node] + degrees.get(node, 0)
+
+    targets = array("i", bytes(4 * len(sources)))
+    positions = offsets[:-1]
+    for source, destination in zip(sources, destinations, strict=True):
+        targets[positions[source]] = destination
+        positions[source] += 1
+
+    # Sort each row and drop duplicate edges (the same block can be stored under several uris)
+    unique_offsets = array("q", [0])
+    unique_targets = array("i")
+    for node in range(node_count):
+        unique_targets.extend(sorted(set(targets[offsets[node] : offsets[node + 1]])))
+        unique_offsets.append(len(unique_targets))
+
+    return unique_offsets, unique_targets
@@ -0,0 +1,118 @@
+# block_window.py
+
+import heapq
+from collections import Counter
+from datetime import datetime, timezone
+
+# ======================================================================================================================
+# ============================================ Sliding window of blocks ================================================
+# Blocks of the last hours kept as per hour counts of blocked and blocking dids, plus their running sums over the
+# window. Moving the window drops whole expired hours from the sums, so the top lists never rescan blocklists.
+# Hours are counted since the epoch in UTC, the window is the current (partial) hour and the hours - 1 before it.
+
+
+def epoch_hour(value: datetime) -> int:
+    return int(value.timestamp() // 3600)
+
+
+def hour_start(hour: int) -> datetime:
+    return datetime.fromtimestamp(hour * 3600, timezone.utc)
+
+
+class HourlyBlockWindow:
+    def __init__(self, hours: int = 24) -> None:
+        self.hours = hours
+        self.buckets = {}  # hour: (blocked counts, blocker counts)
+        self.blocked = Counter()  # blocked did: blocks within the window
+        self.blockers = Counter()  # user did: blocks within the window
+        self.first_hour = None
+
+    def start(self, now: datetime | None = None) -> datetime:
+        # Oldest moment still inside the window
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        return hour_start(epoch_hour(now) - self.hours + 1)
+
+    def bucket(self, hour: int) -> tuple[Counter, Counter]:
+        bucket = self.buckets.get(hour)
+
+        if bucket is None:
+            bucket = self.buckets[hour] = (Counter(), Counter())
+
+        return bucket
+
+    def add_counts(self, hour: int, blocked_counts, blocker_counts) -> None:
+        if self.first_hour is not None and hour < self.first_hour:
+            return
+
+        blocked_bucket, blocker_bucket = self.bucket(hour)
+        for counts, bucket, total in (
+            (blocked_counts, blocked_bucket, self.blocked),
+            (blocker_counts, blocker_bucket, self.blockers),
+        ):
+            for did, count in counts:
+                bucket[did] += count
+                total[did] += count
+
+    def apply(self, block_date: datetime | None, user_did: str, blocked_did: str, delete: bool) -> None:
+        if block_date is None or user_did is None or blocked_did is None:
+            return
+
+        hour = epoch_hour(block_date)
+
+        if self.first_hour is not None and hour < self.first_hour:
+            return
+
+        blocked_bucket, blocker_bucket = self.bucket(hour)
+
+        if not delete:
+            for did, bucket, total in (
+                (blocked_did, blocked_bucket, self.blocked),
+                (user_did, blocker_bucket, self.blockers),
+            ):
+                bucket[did] += 1
+                total[did] += 1
+
+            return
+
+        # A delete of a block that was never counted (counted before a reload, or dated outside the window) is ignored
+        if blocked_bucket[blocked_did] <= 0 or blocker_bucket[user_did] <= 0:
+            return
+
+        for did, bucket, total in (
+            (blocked_did, blocked_bucket, self.blocked),
+            (user_did, blocker_bucket, self.blockers),
+        ):
+            for counts in (bucket, total):
+                counts[did] -= 1
+
+                if counts[did] <= 0:
+                    del counts[did]
+
+    def advance(self, now: datetime | None = None) -> int:
+        # Expires the hours that left the window, returns how many were dropped
+        first_hour = epoch_hour(self.start(now))
+        self.first_hour = first_hour
+
+        expired = [hour for hour in self.buckets if hour < first_hour]
+
+        for hour in expired:
+            for bucket, total in zip(self.buckets.pop(hour), (self.blocked, self.blockers), strict=True):
+                total.subtract(bucket)
+
+                for did in bucket:
+                    if total[did] <= 0:
+                        del total[did]
+
+        return len(expired)
+
+    def top(self, list_type: str, count: int) -> list[tuple[str, int]]:
+        # Largest window counts, ties broken by did for a stable order
+        totals = self.blocked if list_type == "blocked" else self.blockers
+
+        return heapq.nlargest(count, totals.items(), key=lambda item: (item[1], item[0]))
+
+    @property
+    def block_count(self) -> int:
+        return sum(self.blocked.values())
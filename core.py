@@ -4,7 +4,7 @@ import csv
 import functools
 import io
 import os
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from functools import wraps
 
 import aiofiles
@@ -16,6 +16,8 @@ from quart import jsonify, request, session
 import database_handler
 import helpers
 import on_wire
+import schema_migrations
+import stats_history
 import utils
 from config_helper import logger, upload_limit_mb
 from environment import get_api_var
@@ -32,6 +34,7 @@ from helpers import (
     blocklist_failed,
     get_ip,
     get_ip_address,
+    get_time_left,
     get_time_since,
     runtime,
     version,
@@ -333,6 +336,21 @@ async def load_api_statuses():
 
 # ======================================================================================================================
 # ============================================ API Services Functions ==================================================
+def page_cursor(page, key_count=1):
+    # Keyset paging when the request has ?cursor=, an empty cursor is the first page. Not combined with a page number.
+    cursor = request.args.get("cursor")
+
+    if cursor is None:
+        return None
+
+    after = utils.decode_page_cursor(cursor, key_count)
+
+    if after is None or page != 1:
+        raise BadRequest
+
+    return after
+
+
 async def get_blocklist(client_identifier, page):
     session_ip = await get_ip()
     api_key = request.headers.get("X-API-Key")
@@ -379,6 +397,8 @@ async def get_single_blocklist(client_identifier, page):
 
     logger.info(f"<< {session_ip} - {api_key} - single blocklist request: {identifier}")
 
+    after = page_cursor(page)
+
     if identifier:
         did_identifier, handle_identifier = await pre_process_identifier(identifier)
         status = await preprocess_status(did_identifier)
@@ -388,12 +408,16 @@ async def get_single_blocklist(client_identifier, page):
             offset = (page - 1) * items_per_page
 
             blocklist = await database_handler.get_single_user_blocks(
-                did_identifier, limit=items_per_page, offset=offset
+                did_identifier, limit=items_per_page, offset=offset, after=after
             )
 
             blocklist_data = {
                 "blocklist": blocklist,
             }
+            if after is not None:
+                blocklist_data["next_cursor"] = utils.next_page_cursor(
+                    blocklist, "blocked_date", items_per_page, keys=("did",)
+                )
         else:
             blocklist_data = None
 
@@ -481,6 +505,19 @@ async def get_in_common_blocklist(client_identifier):
 
     logger.info(f"<< {session_ip} - {api_key} - in-common blocklist request: {identifier}")
 
+    if database_handler.all_blocks_graph is None:
+        logger.info("Block cache not loaded yet.")
+
+        remaining_time = await get_time_left(
+            database_handler.all_blocks_start_time, database_handler.all_blocks_process_time
+        )
+        timing = {"timeLeft": remaining_time}
+        data = {"data": timing}
+
+        logger.info(f">> {session_ip} - {api_key} - in-common blocklist result returned: {identifier}")
+
+        return jsonify(data)
+
     if identifier:
         did_identifier, handle_identifier = await pre_process_identifier(identifier)
         status = await preprocess_status(did_identifier)
@@ -505,9 +542,6 @@ async def get_in_common_blocklist(client_identifier):
 
 
 async def get_in_common_blocked(client_identifier):
-    not_implemented = True
-    common_list = None
-
     session_ip = await get_ip()
     api_key = request.headers.get("X-API-Key")
 
@@ -515,20 +549,31 @@ async def get_in_common_blocked(client_identifier):
 
     logger.info(f"<< {session_ip} - {api_key} - in-common blocked request: {identifier}")
 
+    if database_handler.all_blocks_graph is None:
+        logger.info("Block cache not loaded yet.")
+
+        remaining_time = await get_time_left(
+            database_handler.all_blocks_start_time, database_handler.all_blocks_process_time
+        )
+        timing = {"timeLeft": remaining_time}
+        data = {"data": timing}
+
+        logger.info(f">> {session_ip} - {api_key} - in-common blocked result returned: {identifier}")
+
+        return jsonify(data)
+
     if identifier:
         did_identifier, handle_identifier = await pre_process_identifier(identifier)
         status = await preprocess_status(did_identifier)
 
-        if not not_implemented:
-            if did_identifier and handle_identifier and status:
-                blocklist_data = await database_handler.get_similar_blocked_by(did_identifier)
-
-            else:
-                blocklist_data = None
+        if did_identifier and handle_identifier and status:
+            blocklist_data = await database_handler.get_similar_blocked_by(did_identifier)
+        else:
+            blocklist_data = None
 
-            common_list = {"inCommonList": blocklist_data}
+        common_list = {"inCommonList": blocklist_data}
 
-        data = {"error": "API not Implemented."} if not_implemented else {"identity": identifier, "data": common_list}
+        data = {"identity": identifier, "data": common_list}
     else:
         identifier = "Missing parameter"
         result = "Missing parameter"
@@ -750,6 +795,8 @@ async def get_list_info(client_identifier, page):
 
     logger.info(f"<< {session_ip} - {api_key} - get mute/block list request: {identifier}")
 
+    after = page_cursor(page)
+
     if identifier:
         did_identifier, handle_identifier = await pre_process_identifier(identifier)
         status = await preprocess_status(did_identifier)
@@ -759,10 +806,12 @@ async def get_list_info(client_identifier, page):
             offset = (page - 1) * items_per_page
 
             mute_lists, count, pages = await database_handler.get_mutelists(
-                did_identifier, limit=items_per_page, offset=offset
+                did_identifier, limit=items_per_page, offset=offset, after=after
             )
 
             list_data = {"identifier": identifier, "lists": mute_lists, "count": count, "pages": pages}
+            if after is not None:
+                list_data["next_cursor"] = utils.next_page_cursor(mute_lists, "date_added", items_per_page)
         else:
             list_data = None
 
@@ -815,15 +864,21 @@ async def get_moderation_lists(input_name, page) -> jsonify:
 
     logger.info(f"<< {session_ip} - {api_key} - get moderation list request: {input_name}")
 
+    after = page_cursor(page)
+
     if input_name:
         items_per_page = 100
         offset = (page - 1) * items_per_page
 
         name = input_name.lower()
 
-        list_data, pages = await database_handler.get_moderation_list(name, limit=items_per_page, offset=offset)
+        list_data, pages = await database_handler.get_moderation_list(
+            name, limit=items_per_page, offset=offset, after=after
+        )
 
         sub_data = {"lists": list_data, "pages": pages}
+        if after is not None:
+            sub_data["next_cursor"] = utils.next_page_cursor(list_data, "created_date", items_per_page)
 
         data = {"input": name, "data": sub_data}
     else:
@@ -940,6 +995,21 @@ async def fun_facts() -> jsonify:
 
         return jsonify(data)
 
+    window = request.args.get("window")
+
+    if window and window != "all":
+        # Top lists of a time window, merged from the hourly or daily block counts
+        if utils.parse_block_window(window) is None:
+            raise BadRequest
+
+        data_lists, as_of_time = await utils.get_windowed_top_blocks(window)
+
+        data = {"data": data_lists, "window": window, "as of": as_of_time}
+
+        logger.info(f">> Fun facts result returned: {session_ip} - {api_key}")
+
+        return jsonify(data)
+
     if database_handler.blocklist_updater_status.is_set():
         logger.info("Updating top blocks in progress.")
 
@@ -1094,6 +1164,36 @@ async def funer_facts() -> jsonify:
     return jsonify(data)
 
 
+async def get_block_waves() -> jsonify:
+    session_ip = await get_ip()
+    api_key = request.headers.get("X-API-Key")
+
+    logger.info(f"<< Block waves requested: {session_ip} - {api_key}")
+
+    blocked = [
+        {
+            "did": did,
+            "Handle": handle,
+            "block_count": estimate,
+            "ProfileURL": f"https://bsky.app/profile/{did}",
+        }
+        for did, handle, estimate in database_handler.block_waves
+    ]
+
+    data = {
+        "data": {
+            "blocked": blocked,
+            "windowMinutes": database_handler.block_waves_window_minutes,
+            "minBlocks": database_handler.block_waves_min_blocks,
+        },
+        "as of": database_handler.block_waves_as_of_time,
+    }
+
+    logger.info(f">> Block waves result returned: {session_ip} - {api_key}")
+
+    return jsonify(data)
+
+
 async def block_stats() -> jsonify:
     global block_stats_app_start_time
 
@@ -1246,6 +1346,14 @@ async def block_stats() -> jsonify:
         "averageNumberOfBlocked": average_number_of_blocked_round,
     }
 
+    blocking_distribution = utils.block_count_distribution_cache.get("blocking")
+    blocked_distribution = utils.block_count_distribution_cache.get("blocked")
+
+    if blocking_distribution is not None and blocked_distribution is not None:
+        # Percentiles and log2 histogram of blocks per blocking user and blocks per blocked user
+        stats_data["blockingDistribution"] = blocking_distribution
+        stats_data["blockedDistribution"] = blocked_distribution
+
     data = {"data": stats_data, "as of": utils.block_stats_as_of_time}
 
     logger.info(f">> block stats result returned: {session_ip} - {api_key}")
@@ -1253,6 +1361,102 @@ async def block_stats() -> jsonify:
     return jsonify(data)
 
 
+def parse_history_time(value) -> float | None:
+    if not value:
+        return None
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise BadRequest
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed.timestamp()
+
+
+async def block_stats_history() -> jsonify:
+    session_ip = await get_ip()
+    api_key = request.headers.get("X-API-Key")
+
+    series = request.args.get("series", "block_stats")
+    start = parse_history_time(request.args.get("start"))
+    end = parse_history_time(request.args.get("end"))
+    points = request.args.get("points")
+
+    logger.info(f"<< Requesting statistics history: {session_ip} - {api_key}: {series} {start} {end} {points}")
+
+    if series not in stats_history.series_names:
+        raise BadRequest
+
+    if points is not None:
+        try:
+            points = min(int(points), stats_history.history_max_points)
+        except ValueError:
+            raise BadRequest
+
+        if points < 1:
+            raise BadRequest
+
+    history = stats_history.get_range(series, start, end, points)
+
+    data = {"data": {"series": series, "points": history}}
+
+    logger.info(f">> Statistics history result returned: {session_ip} - {api_key}")
+
+    return jsonify(data)
+
+
+def parse_stats_day(value, default) -> date:
+    if not value:
+        return default
+
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest
+
+
+async def distinct_block_counts() -> jsonify:
+    session_ip = await get_ip()
+    api_key = request.headers.get("X-API-Key")
+
+    # Without a range the counts are over every block, from the overall sketches
+    start = end = None
+    if request.args.get("start") or request.args.get("end"):
+        end = parse_stats_day(request.args.get("end"), datetime.now(timezone.utc).date())
+        start = parse_stats_day(request.args.get("start"), end - timedelta(days=29))
+
+    logger.info(f"<< Requesting distinct block counts: {session_ip} - {api_key}: {start} {end}")
+
+    if start is not None and (start > end or (end - start).days + 1 > utils.distinct_max_days):
+        raise BadRequest
+
+    counts = utils.distinct_block_counts_cache.get((start, end))
+
+    if counts is None:
+        unique_blocking, unique_blocked, error_bounds = await database_handler.get_distinct_block_counts(start, end)
+
+        # HyperLogLog estimates, about 95% fall within the error bound of the real count
+        counts = {
+            "start": start.isoformat() if start is not None else None,
+            "end": end.isoformat() if end is not None else None,
+            "numberOfUniqueUsersBlocking": unique_blocking,
+            "numberOfUniqueUsersBlockingErrorBound": error_bounds[0],
+            "numberOfUniqueUsersBlocked": unique_blocked,
+            "numberOfUniqueUsersBlockedErrorBound": error_bounds[1],
+            "approximate": True,
+        }
+        utils.distinct_block_counts_cache[(start, end)] = counts
+
+    data = {"data": counts}
+
+    logger.info(f">> Distinct block counts result returned: {session_ip} - {api_key}")
+
+    return jsonify(data)
+
+
 async def autocomplete(client_identifier) -> jsonify:
     session_ip = await get_ip()
     api_key = request.headers.get("X-API-Key")
@@ -1311,7 +1515,7 @@ async def get_internal_status() -> jsonify:
     if database_handler.block_cache_status.is_set():
         block_cache_status = "processing"
     else:
-        block_cache_status = "not initialized" if len(database_handler.all_blocks_cache) == 0 else "In memory"
+        block_cache_status = "not initialized" if database_handler.all_blocks_graph is None else "In memory"
 
     if dbs_connected:
         for db in dbs_connected:
@@ -1339,6 +1543,31 @@ async def get_internal_status() -> jsonify:
     status["block cache status"] = block_cache_status
     status["block stats last process time"] = str(utils.block_stats_process_time)
     status["block cache status"] = str(database_handler.all_blocks_process_time)
+    if database_handler.all_blocks_graph is not None:
+        status["block cache size"] = (
+            f"{database_handler.all_blocks_graph.node_count} dids, "
+            f"{database_handler.all_blocks_graph.edge_count} blocks, "
+            f"{database_handler.all_blocks_graph.nbytes / 1024 / 1024:.1f} MiB"
+        )
+        if database_handler.all_blocks_load_rate is not None:
+            rows_per_second, bytes_per_second = database_handler.all_blocks_load_rate
+            status["block cache load throughput"] = (
+                f"{rows_per_second:.0f} rows/s, {bytes_per_second / 1024 / 1024:.1f} MiB/s"
+            )
+        status["block cache changes since rebuild"] = database_handler.all_blocks_graph.change_count
+        status["block cache last serial id"] = database_handler.all_blocks_last_serial
+    status["similarity result cache"] = (
+        f"{database_handler.similarity_results_cache.currsize}/{database_handler.similarity_results_cache.maxsize}"
+    )
+    status["similar users precomputed"] = len(database_handler.similar_users_precomputed)
+    status["similar users precompute as of"] = await get_time_since(
+        database_handler.similar_users_precompute_as_of_time
+    )
+    status["similar users precompute process time"] = str(database_handler.similar_users_precompute_process_time)
+    status["block cache similarity mode"] = "approximate" if database_handler.all_blocks_index else "exact"
+    status["read replicas"] = database_handler.read_balancer.status()
+    status["schema migrations"] = sorted(schema_migrations.applied_migrations)
+    status["hot query plans"] = schema_migrations.hot_query_plans
 
     logger.info(f">> System status result returned: {session_ip} - {api_key}")
 
@@ -1395,6 +1624,9 @@ async def retrieve_subscribe_blocks_blocklist(client_identifier: str, page: int)
 
     logger.info(f"<< {session_ip} - {api_key} - blocklist request: {identifier}")
 
+    # Keyed by subscription, then by list item within it
+    after = page_cursor(page, key_count=2)
+
     if identifier:
         did_identifier, handle_identifier = await pre_process_identifier(identifier)
         status = await preprocess_status(did_identifier)
@@ -1403,11 +1635,17 @@ async def retrieve_subscribe_blocks_blocklist(client_identifier: str, page: int)
             items_per_page = 100
             offset = (page - 1) * items_per_page
 
-            blocklist = await utils.process_subscribe_blocks(did_identifier, limit=items_per_page, offset=offset)
+            blocklist = await utils.process_subscribe_blocks(
+                did_identifier, limit=items_per_page, offset=offset, after=after
+            )
 
             blocklist_data = {
                 "blocklist": blocklist,
             }
+            if after is not None:
+                blocklist_data["next_cursor"] = utils.next_page_cursor(
+                    blocklist, "date_added", items_per_page, keys=("uri", "listitem_uri")
+                )
         else:
             blocklist = None
 
@@ -1764,6 +2002,8 @@ async def retrieve_starter_packs(ident, page):
 
     logger.info(f"<< {session_ip} - {api_key} - starter pack request: {identifier}")
 
+    after = page_cursor(page)
+
     if identifier:
         did_identifier, handle_identifier = await pre_process_identifier(identifier)
         status = await preprocess_status(did_identifier)
@@ -1773,10 +2013,12 @@ async def retrieve_starter_packs(ident, page):
             offset = (page - 1) * items_per_page
 
             starter_packs = await database_handler.get_starter_packs(
-                did_identifier, limit=items_per_page, offset=offset
+                did_identifier, limit=items_per_page, offset=offset, after=after
             )
 
             starter_pack_data = {"starter_packs": starter_packs}
+            if after is not None:
+                starter_pack_data["next_cursor"] = utils.next_page_cursor(starter_packs, "created_date", items_per_page)
 
         else:
             starter_packs = None
@@ -1834,6 +2076,8 @@ async def retrieve_single_starter_packs(ident, page):
 
     logger.info(f"<< {session_ip} - {api_key} - starter pack request: {identifier}")
 
+    after = page_cursor(page)
+
     if identifier:
         did_identifier, handle_identifier = await pre_process_identifier(identifier)
         status = await preprocess_status(did_identifier)
@@ -1843,10 +2087,12 @@ async def retrieve_single_starter_packs(ident, page):
             offset = (page - 1) * items_per_page
 
             starter_packs = await database_handler.get_single_starter_packs(
-                did_identifier, limit=items_per_page, offset=offset
+                did_identifier, limit=items_per_page, offset=offset, after=after
             )
 
             starter_pack_data = {"starter_packs": starter_packs}
+            if after is not None:
+                starter_pack_data["next_cursor"] = utils.next_page_cursor(starter_packs, "date_added", items_per_page)
 
         else:
             starter_packs = None
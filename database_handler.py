@@ -1,19 +1,31 @@
 # database_handler.py
 
 import asyncio
+import contextlib
+import contextvars
 import functools
-import itertools
+import json
 import math
 import os
-from datetime import datetime, timezone
+from datetime import datetime, time, timedelta, timezone
 
+import aiofiles.os
 import asyncpg
-from cachetools import TTLCache
+from cachetools import LRUCache
 
 import config_helper
+import stats_history
 import utils
-from config_helper import check_override, logger
+import workers
+from binary_copy import BinaryCopyParser
+from block_graph import BlockGraphBuilder, BlockGraphOverlay, load_snapshot, write_snapshot
+from block_window import HourlyBlockWindow
+from config_helper import check_override, config, logger
 from errors import DatabaseConnectionError, InternalServerError, NotFound
+from heavy_hitters import WindowedHeavyHitters
+from hyperloglog import BlockCountSketches
+from pool_router import PoolRouter
+from replica_balancer import ReplicaBalancer
 
 # ======================================================================================================================
 # ===================================================  global variables ================================================
@@ -23,22 +35,65 @@ db_lock = asyncio.Lock()
 once = None
 no_tables = asyncio.Event()
 
-all_blocks_cache = TTLCache(maxsize=5000000, ttl=86400)  # every 24 hours
+all_blocks_graph = None  # Loaded at startup, kept current from blocklists_transaction and rebuilt every 24 hours
+all_blocks_index = None  # MinHash/LSH index over all_blocks_graph, only built in approximate similarity mode
+all_blocks_lock = asyncio.Lock()
+all_blocks_last_serial = 0  # Last blocklists_transaction serial_id applied to all_blocks_graph
+all_blocks_published_serial = 0  # Last serial_id the similarity workers have seen
+all_blocks_published_time = None  # When the similarity workers were last started on a new base graph
+all_blocks_generation = 0  # Bumped whenever all_blocks_graph is replaced by a full load or snapshot
+all_blocks_tail_batch_size = config.getint("similarity", "tail_batch_size", fallback=10000)
+all_blocks_compact_threshold = config.getint("similarity", "compact_threshold", fallback=500000)
+# The similarity workers serve the base graph, it is compacted at least this often so their results stay recent
+all_blocks_refresh_minutes = config.getint("similarity", "worker_refresh_minutes", fallback=60)
+all_blocks_load_partitions = config.getint("similarity", "load_partitions", fallback=8)
+max_block_number = 4294967295  # InvalidBlockNumber, above every heap page
+all_blocks_snapshot_path = config.get("similarity", "snapshot_path", fallback="")
+all_blocks_snapshot_serial = None  # last_serial of the snapshot file on disk, None while none was written or loaded
+similar_users_snapshot_path = f"{all_blocks_snapshot_path}.similar" if all_blocks_snapshot_path else ""
+similar_users_precomputed = {}  # did: (tag, top similar blockers), for blockers of precompute_min_blocks or more
+block_count_sketches = (
+    None  # Daily HyperLogLog distinct blocker/blocked sketches, only kept in approximate statistics mode
+)
+similarity_results_cache = LRUCache(maxsize=config.getint("similarity", "result_cache_size", fallback=10000))
+top_24_window = None  # Hourly sliding window of the last 24 hours of blocks, source of the top 24 hour lists
+top_24_window_serial = 0  # Last blocklists_transaction serial_id included in top_24_window
+block_counts_hourly_retention = config.getint("trending", "hourly_retention_hours", fallback=48)
+block_counts_daily_retention = config.getint("trending", "daily_retention_days", fallback=30)
+block_counts_gap_serials = config.getint("trending", "gap_serials", fallback=100000)  # How long gaps are waited for
+# Recent buckets the daily rebuild recounts from blocklists, in hours and days
+block_counts_rebuild_length = {
+    "hour": config.getint("trending", "rebuild_hours", fallback=48),
+    "day": config.getint("trending", "rebuild_days", fallback=2),
+}
+block_waves_detector = None  # Count-Min Sketch heavy hitters of blocked dids over the last window_minutes
+block_waves_serial = None  # Last blocklists_transaction serial_id counted by block_waves_detector
+block_waves = []  # Active dids currently being mass blocked, (did, handle, estimated blocks in the window)
+block_waves_window_minutes = config.getint("block_waves", "window_minutes", fallback=15)
+block_waves_min_blocks = config.getint("block_waves", "min_blocks", fallback=50)
 
 blocklist_updater_status = asyncio.Event()
 blocklist_24_updater_status = asyncio.Event()
 block_cache_status = asyncio.Event()
+similar_users_precompute_status = asyncio.Event()
+block_counts_status = asyncio.Event()
+block_waves_status = asyncio.Event()
 
 last_update_top_block = None
 last_update_top_24_block = None
+all_blocks_start_time = None
 all_blocks_process_time = None
 all_blocks_last_update = None
+all_blocks_load_rate = None  # (rows per second, bytes per second) of the last full load
+similar_users_precompute_process_time = None
+similar_users_precompute_as_of_time = None
 top_blocks_start_time = None
 top_24_blocks_start_time = None
 top_blocks_process_time = None
 top_24_blocks_process_time = None
 top_blocked_as_of_time = None
 top_24_blocked_as_of_time = None
+block_waves_as_of_time = None
 total_users_as_of_time = None
 
 users_table = "users"
@@ -48,62 +103,298 @@ top_24_blocks_table = "top_twentyfour_hour_block"
 mute_lists_table = "mutelists"
 mute_lists_users_table = "mutelists_users"
 last_created_table = "last_did_created_date"
+block_counts_hourly_table = "block_counts_hourly"
+block_counts_daily_table = "block_counts_daily"
+block_counts_progress_table = "block_counts_progress"
+
+# Pre-aggregated block counts per (list type, time bucket, did): table, bucket column, bucket expression of block_date
+block_counts_buckets = {
+    "hour": (block_counts_hourly_table, "hour", "date_trunc('hour', block_date AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'"),
+    "day": (block_counts_daily_table, "day", "(block_date AT TIME ZONE 'UTC')::date"),
+}
+block_counts_list_columns = {"blocked": "blocked_did", "blocker": "user_did"}
 
 database_config = None
+pool_router = None  # Resolved pool names per role, rebuilt by route_pools
+read_balancer = None  # Picks the read replica of each read from latency, load, replication lag and health probes
+replica_probe_timeout = config.getint("replicas", "probe_timeout_seconds", fallback=5)
+# False while an analytics scan holds its connection and in the block cache load tasks, their query times are not fed
+# to read_balancer
+replica_scored = contextvars.ContextVar("replica_scored", default=True)
+analytics_db = None  # database_config entry the analytics pool connects to, None routes analytics to the read pools
+analytics_pool_name = "analytics"
+analytics_min_size = config.getint("analytics", "min_size", fallback=2)
+analytics_max_size = config.getint("analytics", "max_size", fallback=10)
+
+# PostgreSQL settings of the pool connections, statement_timeout in ms. Lookups on the read pools fail fast, the
+# analytics pool is sized and tuned for the long aggregate scans of the statistics jobs. Empty values are left unset.
+lookup_server_settings = {
+    "statement_timeout": config.get("lookups", "statement_timeout", fallback="30000"),
+    "jit": config.get("lookups", "jit", fallback="off"),
+}
+analytics_server_settings = {
+    "statement_timeout": config.get("analytics", "statement_timeout", fallback="900000"),
+    "work_mem": config.get("analytics", "work_mem", fallback="256MB"),
+    "jit": config.get("analytics", "jit", fallback="on"),
+}
+
+# Failures that count towards ejecting a read replica, query errors such as a bad statement do not
+replica_connection_errors = (
+    OSError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.InterfaceError,
+)
+
+# Hot lookup queries, kept here so schema_migrations checks the plans of the statements the handlers execute
+blocklist_query = """SELECT DISTINCT blocked_did, block_date
+FROM blocklists
+WHERE user_did = $1
+ORDER BY block_date DESC
+LIMIT $2
+OFFSET $3"""
+
+# Keyed on the distinct (block_date, user_did) pairs, repeated blocks of one user still show once
+single_user_blocks_keyset_query = """SELECT DISTINCT user_did, block_date
+FROM blocklists
+WHERE blocked_did = $1 AND (block_date, user_did) < ($2::timestamptz, $3::text)
+ORDER BY block_date DESC, user_did DESC
+LIMIT $4"""
+
+blocklist_search_blocking_query = """SELECT b.user_did, b.blocked_did, b.block_date
+FROM blocklists AS b
+WHERE user_did = $1
+  AND blocked_did = $2"""
+
+blocklist_search_blocked_query = """SELECT b.user_did, b.blocked_did, b.block_date
+FROM blocklists AS b
+WHERE user_did = $2
+  AND blocked_did = $1"""
+
+block_row_query = """SELECT user_did, blocked_did, block_date, cid, uri
+FROM blocklists
+WHERE uri = $1"""
+
+# Keyed on the subscription's (date_added, uri), the list item uri only orders the rows of one subscription, so the
+# outer scan stays on the subscribe_blocklists index
+subscribe_blocks_keyset_query = """SELECT mu.subject_did, mu.owner_did, s.date_added, s.list_uri, m.url, s.uri,
+    mu.listitem_uri
+FROM subscribe_blocklists AS s
+INNER JOIN mutelists_users AS mu ON s.list_uri = mu.list_uri
+INNER JOIN mutelists AS m ON s.list_uri = m.uri
+WHERE s.did = $1 AND (s.date_added, s.uri) <= ($2::timestamptz, $3::text)
+    AND ((s.date_added, s.uri) < ($2::timestamptz, $3::text) OR mu.listitem_uri < $4::text)
+ORDER BY s.date_added DESC, s.uri DESC, mu.listitem_uri DESC
+LIMIT $5"""
+
+mutelists_keyset_query = """SELECT ml.url, ml.name, ml.did, ml.description, ml.created_date, mu.date_added,
+    mc.user_count, mu.listitem_uri AS uri
+FROM mutelists AS ml
+INNER JOIN mutelists_users AS mu ON ml.uri = mu.list_uri
+LEFT JOIN mutelists_user_count AS mc ON ml.uri = mc.list_uri
+WHERE mu.subject_did = $1 AND (mu.date_added, mu.listitem_uri) < ($2::timestamptz, $3::text)
+ORDER BY mu.date_added DESC, mu.listitem_uri DESC
+LIMIT $4"""
+
+moderation_list_keyset_query = """SELECT ml.url, ml.did, ml.name, ml.description, ml.created_date, ml.uri,
+    mc.user_count
+FROM mutelists AS ml
+LEFT JOIN mutelists_user_count AS mc ON ml.uri = mc.list_uri
+WHERE (ml.name ILIKE $1 OR ml.description ILIKE $1)
+    AND (ml.created_date, ml.uri) < ($2::timestamptz, $3::text)
+ORDER BY ml.created_date DESC, ml.uri DESC
+LIMIT $4"""
+
+starter_packs_keyset_query = """SELECT name, description, did, created_date, url, uri
+FROM starter_packs
+WHERE did = $1 AND (created_date, uri) < ($2::timestamptz, $3::text)
+ORDER BY created_date DESC, uri DESC
+LIMIT $4"""
+
+# Keyed on the list item adding the user to each pack, read in order from the mutelists_users index
+single_starter_packs_keyset_query = """SELECT s.name, s.description, s.did, s.created_date, s.url, mu.date_added,
+    mu.listitem_uri
+FROM mutelists_users AS mu
+JOIN starter_packs AS s ON s.list_uri = mu.list_uri
+WHERE mu.subject_did = $1 AND (mu.date_added, mu.listitem_uri) < ($2::timestamptz, $3::text)
+ORDER BY mu.date_added DESC, mu.listitem_uri DESC
+LIMIT $4"""
+
+user_did_query = "SELECT did FROM users WHERE handle = $1 AND status is True"
 
 
 # ======================================================================================================================
 # ========================================= database handling functions ================================================
 def get_connection_pool(db_type="read"):
-    override = config_helper.check_override()
-    if os.getenv("CLEAR_SKY") and override is False:
-        if db_type == "read":
-            return next(read_db_iterator)
-        elif db_type == "cursor":
-            for db, _configg in database_config.items():
-                if "cursor" in db.lower():
-                    return db
-        else:
-            for db, _configg in database_config.items():
-                use_local_db = database_config.get("use_local_db")
+    pool_name = pool_router.route(db_type)
 
-                if use_local_db is None:
-                    continue
-                if "use_local_db" in db.lower() and "none" in use_local_db.lower():
-                    continue
-                if db.lower() == "write_keyword":
-                    continue
-                if db.startswith("CLEARSKY_DATABASE") and database_config.get("write_keyword") in db.lower():
-                    write = db
+    if pool_name is None or pool_name not in connection_pools:
+        logger.error(f"No connection pool available for {db_type}.")
 
-                    return write
+        raise DatabaseConnectionError
 
-                continue
+    return pool_name
 
-    if not os.getenv("CLEAR_SKY") or override is True:
-        if db_type == "read":
-            return next(read_db_iterator)
-        elif db_type == "cursor":
-            for db, _configg in database_config.items():
-                if "cursor" in db.lower():
-                    return db
-        else:
-            for db, _configg in database_config.items():
-                use_local_db = database_config.get("use_local_db")
 
-                if use_local_db is None:
-                    continue
-                if "use_local_db" in db.lower() and "none" in use_local_db.lower():
-                    continue
-                if db.lower() == "write_keyword":
-                    continue
-                if "write" in db.lower():
-                    return db
+def build_pool_router() -> PoolRouter:
+    # Resolves the pool names of every role from database_config, called at import and again by route_pools
+    from_environment = bool(os.getenv("CLEAR_SKY")) and check_override() is False
+    write_keyword = database_config.get("write_keyword") or "write"
 
-                continue
+    write_dbs = []
+    cursor_dbs = []
+    for db in database_config:
+        if db.lower() in ("write_keyword", "read_keyword", "use_local_db"):
+            continue
 
+        if from_environment:
+            if db.startswith("CLEARSKY_DATABASE") and write_keyword in db.lower():
+                write_dbs.append(db)
+        elif "write" in db.lower():
+            write_dbs.append(db)
+
+        if "cursor" in db.lower():
+            cursor_dbs.append(db)
+
+    if not write_dbs:
         logger.error("No write db found.")
 
+    return PoolRouter(
+        {
+            "read": read_dbs,
+            "write": write_dbs[:1],
+            "cursor": cursor_dbs[:1],
+            "analytics": [analytics_pool_name] if analytics_db else read_dbs,
+        },
+        pickers={"read": read_balancer.choose, "analytics": choose_analytics_pool},
+    )
+
+
+def get_analytics_db() -> str | None:
+    db = config.get("analytics", "database", fallback="") or (read_dbs[0] if read_dbs else None)
+
+    if db is not None and db not in database_config:
+        logger.error(f"Analytics database {db} not configured, analytics queries use the read pools.")
+
+        return None
+
+    return db
+
+
+def choose_analytics_pool() -> str | None:
+    # Until the analytics pool exists (not configured, or its creation failed) the read replicas take the scans
+    if analytics_pool_name in connection_pools:
+        return analytics_pool_name
+
+    return read_balancer.choose()
+
+
+@contextlib.asynccontextmanager
+async def acquire_analytics_connection(scored):
+    # Scans that fall back to a read replica would mark it slow, scored decides whether read_balancer gets their query
+    # times while this connection is held
+    pool_name = get_connection_pool("analytics")
+    token = replica_scored.set(scored)
+
+    try:
+        async with connection_pools[pool_name].acquire() as connection:
+            if pool_name != analytics_pool_name:
+                # A read replica standing in for the analytics pool would cancel the scans at its lookup
+                # statement_timeout, RESET ALL on release restores it
+                await connection.execute("SET statement_timeout = 0")
+
+            yield connection
+    finally:
+        replica_scored.reset(token)
+
+
+def route_pools() -> None:
+    global pool_router
+
+    pool_router = build_pool_router()
+    logger.info(f"Connection pool routing: {pool_router.describe()}")
+
+
+def replica_connection_init(db):
+    # Reports the time or connection failure of every query on a read replica connection to read_balancer
+    async def init(connection) -> None:
+        reset_query = connection.get_reset_query()
+
+        def log_query(record) -> None:
+            if record.query == reset_query:
+                return
+
+            if record.exception is None:
+                if not replica_scored.get():
+                    return
+
+                read_balancer.record_query(db, record.elapsed)
+            elif isinstance(record.exception, replica_connection_errors) and read_balancer.record_failure(db):
+                logger.warning(f"Read replica {db} ejected after {read_balancer.eject_failures} failures.")
+
+        connection.add_query_logger(log_query)
+
+    return init
+
+
+async def probe_read_replica(db) -> None:
+    pool = connection_pools.get(db)
+
+    if pool is None or not read_balancer.probe_due(db):
+        return
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    try:
+        async with asyncio.timeout(replica_probe_timeout), pool.acquire() as connection:
+            acquire_wait = loop.time() - start
+
+            # 0 on a primary, or on a replica that has replayed everything it received
+            lag = await connection.fetchval(
+                """SELECT CASE
+                    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END"""
+            )
+    except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+        logger.error(f"Read replica {db} health check failed: {e!r}")
+
+        if read_balancer.record_failure(db):
+            logger.warning(f"Read replica {db} ejected after {read_balancer.eject_failures} failures.")
+    else:
+        if read_balancer.record_probe(db, acquire_wait, float(lag)):
+            logger.info(f"Read replica {db} back in rotation.")
+
+
+async def probe_read_replicas() -> None:
+    await asyncio.gather(*(probe_read_replica(db) for db in read_dbs))
+
+
+async def open_connection_pool(db, configg, min_size=20, max_size=100, **options) -> None:
+    try:
+        connection_pool = await asyncpg.create_pool(
+            user=configg["user"],
+            password=configg["password"],
+            host=configg.get("host", "localhost"),
+            port=configg.get("port", "5432"),
+            database=configg["database"],
+            min_size=min_size,
+            max_size=max_size,
+            **options,
+        )
+        connection_pools[db] = connection_pool
+        logger.info(f"Connection pool created for {db}")
+    except OSError:
+        logger.error(f"Network connection issue. db connection not established for {db}.")
+    except (
+        asyncpg.exceptions.InvalidAuthorizationSpecificationError,
+        asyncpg.exceptions.CannotConnectNowError,
+    ):
+        logger.error(f"db connection issue for {db}.")
+    except asyncpg.InvalidAuthorizationSpecificationError:
+        logger.error(f"db connection issue for {db}.")
+
 
 async def create_connection_pools(database_configg):
     global connection_pools
@@ -113,27 +404,24 @@ async def create_connection_pools(database_configg):
             if "clearsky_database" in db.lower() and "db" not in db.lower():
                 continue
             if "database" in db.lower() and db not in connection_pools:
-                try:
-                    connection_pool = await asyncpg.create_pool(
-                        user=configg["user"],
-                        password=configg["password"],
-                        host=configg.get("host", "localhost"),
-                        port=configg.get("port", "5432"),
-                        database=configg["database"],
-                        min_size=20,
-                        max_size=100,
+                if db in read_dbs:
+                    await open_connection_pool(
+                        db,
+                        configg,
+                        init=replica_connection_init(db),
+                        server_settings={key: value for key, value in lookup_server_settings.items() if value},
                     )
-                    connection_pools[db] = connection_pool
-                    logger.info(f"Connection pool created for {db}")
-                except OSError:
-                    logger.error(f"Network connection issue. db connection not established for {db}.")
-                except (
-                    asyncpg.exceptions.InvalidAuthorizationSpecificationError,
-                    asyncpg.exceptions.CannotConnectNowError,
-                ):
-                    logger.error(f"db connection issue for {db}.")
-                except asyncpg.InvalidAuthorizationSpecificationError:
-                    logger.error(f"db connection issue for {db}.")
+                else:
+                    await open_connection_pool(db, configg)
+
+        if analytics_db is not None and analytics_pool_name not in connection_pools:
+            await open_connection_pool(
+                analytics_pool_name,
+                database_configg[analytics_db],
+                min_size=analytics_min_size,
+                max_size=analytics_max_size,
+                server_settings={key: value for key, value in analytics_server_settings.items() if value},
+            )
 
     return connection_pools
 
@@ -218,23 +506,17 @@ async def get_blocklist(ident, limit=100, offset=0):
     try:
         pool_name = get_connection_pool("read")
         async with connection_pools[pool_name].acquire() as connection:
-            query = """SELECT DISTINCT blocked_did, block_date
-            FROM blocklists
-            WHERE user_did = $1
-            ORDER BY block_date DESC
-            LIMIT $2
-            OFFSET $3"""
-            result = await connection.fetch(query, ident, limit, offset)
+            result = await connection.fetch(blocklist_query, ident, limit, offset)
 
             if result:
                 # Iterate over blocked_users and extract handle and status
-                for blocked_did, block_date in result:
-                    block_list.append(
-                        {
-                            "did": blocked_did,
-                            "blocked_date": block_date.isoformat(),
-                        }
-                    )
+                for record in result:
+                    block = {
+                        "did": record["blocked_did"],
+                        "blocked_date": record["block_date"].isoformat(),
+                    }
+
+                    block_list.append(block)
 
                 return block_list
             else:
@@ -305,35 +587,41 @@ async def get_user_blocks_count(did_identifier):
         raise InternalServerError
 
 
-async def get_subscribe_blocks(ident, limit=100, offset=0):
+async def get_subscribe_blocks(ident, limit=100, offset=0, after=None):
     data_list = []
 
     try:
         pool_name = get_connection_pool("read")
         async with connection_pools[pool_name].acquire() as connection:
-            query_1 = """SELECT mu.subject_did, mu.owner_did, s.date_added, s.list_uri, m.url
-                            FROM subscribe_blocklists AS s
-                            INNER JOIN mutelists_users AS mu ON s.list_uri = mu.list_uri
-                            INNER JOIN mutelists AS m ON s.list_uri = m.uri
-                            WHERE s.did = $1
-                            ORDER BY s.date_added DESC
-                            LIMIT $2
-                            OFFSET $3"""
-
-            sub_list = await connection.fetch(query_1, ident, limit, offset)
+            if after is None:
+                query_1 = """SELECT mu.subject_did, mu.owner_did, s.date_added, s.list_uri, m.url
+                                FROM subscribe_blocklists AS s
+                                INNER JOIN mutelists_users AS mu ON s.list_uri = mu.list_uri
+                                INNER JOIN mutelists AS m ON s.list_uri = m.uri
+                                WHERE s.did = $1
+                                ORDER BY s.date_added DESC
+                                LIMIT $2
+                                OFFSET $3"""
+
+                sub_list = await connection.fetch(query_1, ident, limit, offset)
+            else:
+                sub_list = await connection.fetch(subscribe_blocks_keyset_query, ident, *after, limit)
 
             if not sub_list:
                 return None, 0
 
             for record in sub_list:
                 list_dict = {
-                    "did": record["ident"],
+                    "did": ident,
                     "subject_did": record["subject_did"],
                     "date_added": record["date_added"].isoformat(),
                     "list owner": record["owner_did"],
                     "list_uri": record["list_uri"],
                     "list_url": record["url"],
                 }
+                if after is not None:
+                    list_dict["uri"] = record["uri"]
+                    list_dict["listitem_uri"] = record["listitem_uri"]
 
                 data_list.append(list_dict)
 
@@ -445,15 +733,34 @@ async def get_listitem_url(uri):
         raise InternalServerError
 
 
-async def get_moderation_list(name, limit=100, offset=0):
+async def get_moderation_list(name, limit=100, offset=0, after=None):
     try:
         pool_name = get_connection_pool("read")
         async with connection_pools[pool_name].acquire() as connection:
             search_string = f"%{name}%"
 
+            if after is not None:
+                # Keyset pages walk the name and description matches as one list, without the page count
+                mod_lists = await connection.fetch(moderation_list_keyset_query, search_string, *after, limit)
+
+                lists = [
+                    {
+                        "url": record["url"],
+                        "did": record["did"],
+                        "name": record["name"],
+                        "description": record["description"],
+                        "created_date": record["created_date"].isoformat(),
+                        "list count": record["user_count"],
+                        "uri": record["uri"],
+                    }
+                    for record in mod_lists
+                ]
+
+                return lists or None, None
+
             name_query = """SELECT ml.url, ml.did, ml.name, ml.description, ml.created_date, mc.user_count
             FROM mutelists AS ml
-            LEFT mutelists_user_count AS mc ON ml.uri = mc.list_uri
+            LEFT JOIN mutelists_user_count AS mc ON ml.uri = mc.list_uri
             WHERE ml.name ILIKE $1
             ORDER BY ml.created_date DESC
             LIMIT $2
@@ -464,7 +771,7 @@ async def get_moderation_list(name, limit=100, offset=0):
             description_query = """SELECT ml.url, ml.did, ml.name, ml.description, ml.created_date,
             mc.user_count
             FROM mutelists AS ml
-            LEFT mutelists_user_count AS mc ON ml.uri = mc.list_uri
+            LEFT JOIN mutelists_user_count AS mc ON ml.uri = mc.list_uri
             WHERE ml.description ILIKE $1
             ORDER BY ml.created_date DESC
             LIMIT $2
@@ -556,18 +863,11 @@ async def get_listblock_url(uri):
 
 
 async def blocklist_search(search_list, lookup, switch):
-    pool_name = get_connection_pool("write")
-    async with connection_pools[pool_name].acquire() as connection, connection.transaction():
+    pool_name = get_connection_pool("read")
+    async with connection_pools[pool_name].acquire() as connection:
         try:
-            blocking = """SELECT b.user_did, b.blocked_did, b.block_date
-                                FROM blocklists AS b
-                                WHERE user_did = $1
-                                  AND blocked_did = $2"""
-
-            blocked = """SELECT b.user_did, b.blocked_did, b.block_date
-                                FROM blocklists AS b
-                                WHERE user_did = $2
-                                  AND blocked_did = $1"""
+            blocking = blocklist_search_blocking_query
+            blocked = blocklist_search_blocked_query
 
             if "blocking" in switch:
                 query = blocking
@@ -625,17 +925,20 @@ async def blocklist_search(search_list, lookup, switch):
             raise InternalServerError
 
 
-async def update_24_hour_block_list_table(entries, list_type):
+async def replace_top_block_table(table, blocked_entries, blockers_entries):
+    # Old rows are deleted and the new ones inserted in one transaction, readers keep seeing the previous complete
+    # list until it commits and a failure leaves it in place. DELETE rather than TRUNCATE, so readers are not blocked.
+    records = [(did, count, "blocked") for did, count in blocked_entries]
+    records += [(did, count, "blocker") for did, count in blockers_entries]
+
     try:
         pool_name = get_connection_pool("write")
         async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            data = [(did, count, list_type) for did, count in entries]
-            # Insert the new row with the given last_processed_did
-            query = "INSERT INTO top_twentyfour_hour_block (did, count, list_type) VALUES ($1, $2, $3)"
-            await connection.executemany(query, data)
-            logger.info("Updated top 24 block table.")
+            await connection.execute(f"DELETE FROM {table}")
+            await connection.copy_records_to_table(table, records=records, columns=("did", "count", "list_type"))
+            logger.info(f"Replaced {table} table: {len(records)} entries.")
     except asyncpg.exceptions.UniqueViolationError:
-        logger.warning("Attempted to insert duplicate entry into top block table")
+        logger.warning(f"Attempted to insert duplicate entry into {table} table")
         raise InternalServerError
     except asyncpg.exceptions.UndefinedTableError:
         logger.warning("table doesn't exist")
@@ -654,13 +957,16 @@ async def update_24_hour_block_list_table(entries, list_type):
         raise InternalServerError
 
 
-async def truncate_top_blocks_table():
+async def get_top_blocks_list() -> tuple[list[tuple[str, int]], list[tuple[str, int]]]:
     try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            # Delete the existing rows if it exists
-            await connection.execute("TRUNCATE top_block")
-            logger.info("Truncated block table.")
+        pool_name = get_connection_pool("read")
+        async with connection_pools[pool_name].acquire() as connection:
+            query1 = "SELECT distinct did, count FROM top_block WHERE list_type = 'blocked'"
+            query2 = "SELECT distinct did, count FROM top_block WHERE list_type = 'blocker'"
+            blocked_rows = await connection.fetch(query1)
+            blocker_rows = await connection.fetch(query2)
+
+            return blocked_rows, blocker_rows
     except asyncpg.PostgresError as e:
         logger.error(f"Postgres error: {e}")
         raise DatabaseConnectionError
@@ -675,13 +981,16 @@ async def truncate_top_blocks_table():
         raise InternalServerError
 
 
-async def truncate_top24_blocks_table():
+async def get_24_hour_block_list():
     try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            # Delete the existing row if it exists
-            await connection.execute("TRUNCATE top_twentyfour_hour_block")
-            logger.info("Truncated top 24 block table.")
+        pool_name = get_connection_pool("read")
+        async with connection_pools[pool_name].acquire() as connection:
+            query1 = "SELECT distinct did, count FROM top_twentyfour_hour_block WHERE list_type = 'blocked'"
+            query2 = "SELECT distinct did, count FROM top_twentyfour_hour_block WHERE list_type = 'blocker'"
+            blocked_rows = await connection.fetch(query1)
+            blocker_rows = await connection.fetch(query2)
+
+            return blocked_rows, blocker_rows
     except asyncpg.PostgresError as e:
         logger.error(f"Postgres error: {e}")
         raise DatabaseConnectionError
@@ -696,18 +1005,391 @@ async def truncate_top24_blocks_table():
         raise InternalServerError
 
 
-async def update_top_block_list_table(entries, list_type):
+async def get_top_blocks():
+    blocked_results = []
+    blockers_results = []
+
+    logger.info("Getting top blocks from db.")
     try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            data = [(did, count, list_type) for did, count in entries]
+        async with acquire_analytics_connection(scored=False) as connection:
             # Insert the new row with the given last_processed_did
-            query = "INSERT INTO top_block (did, count, list_type) VALUES ($1, $2, $3)"
-            await connection.executemany(query, data)
-            logger.info("Updated top block table")
-    except asyncpg.exceptions.UniqueViolationError:
-        logger.warning("Attempted to insert duplicate entry into top block table")
+            blocked_query = """SELECT b.blocked_did, COUNT(*) AS block_count
+                                    FROM blocklists AS b
+                                    WHERE b.blocked_did IN (
+                                    SELECT u.did
+                                    FROM users AS u
+                                    WHERE u.status = TRUE
+                                )
+                                    GROUP BY b.blocked_did
+                                    ORDER BY block_count DESC
+                                    LIMIT 25"""
+
+            blocked_data = await connection.fetch(blocked_query)
+            blocked_results.append(blocked_data)
+
+            blockers_query = """SELECT b.user_did, COUNT(*) AS block_count
+                                    FROM blocklists AS b
+                                    WHERE b.user_did IN (
+                                    SELECT u.did
+                                    FROM users AS u
+                                    WHERE u.status = TRUE
+                                )
+                                    GROUP BY b.user_did
+                                    ORDER BY block_count DESC
+                                    LIMIT 25"""
+
+            blockers_data = await connection.fetch(blockers_query)
+            blockers_results.append(blockers_data)
+
+            return blocked_data, blockers_data
+    except asyncpg.exceptions.UndefinedTableError:
+        logger.warning("table doesn't exist")
         raise InternalServerError
+    except asyncpg.PostgresError as e:
+        logger.error(f"Postgres error: {e}")
+        raise DatabaseConnectionError
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except AttributeError:
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        raise InternalServerError
+
+
+async def fetch_block_stats_passes(*queries):
+    # Both passes and the serial_id they include come from one snapshot, changes with a higher serial_id are the
+    # ones the maintained statistics add on top of the recount
+    async with (
+        acquire_analytics_connection(scored=False) as connection,
+        connection.transaction(isolation="repeatable_read", readonly=True),
+    ):
+        serial = await connection.fetchval("SELECT COALESCE(MAX(serial_id), 0) FROM blocklists_transaction")
+
+        return serial, [await connection.fetch(query) for query in queries]
+
+
+async def get_block_stats():
+    # One grouped pass per direction returns the block count distribution (users per distinct block count), every
+    # published statistic is derived from the two distributions. Groups with a NULL did only add to the total blocks.
+    blocking_query = """SELECT block_count, COUNT(user_did) AS users, SUM(row_count)::bigint AS row_count
+                        FROM (
+                            SELECT user_did, COUNT(blocked_did) AS row_count, COUNT(DISTINCT blocked_did) AS block_count
+                            FROM blocklists
+                            GROUP BY user_did
+                        ) AS subquery
+                        GROUP BY block_count"""
+    blocked_query = """SELECT block_count, COUNT(blocked_did) AS users
+                        FROM (
+                            SELECT blocked_did, COUNT(DISTINCT user_did) AS block_count
+                            FROM blocklists
+                            GROUP BY blocked_did
+                        ) AS subquery
+                        GROUP BY block_count"""
+
+    try:
+        logger.info("Getting block statistics.")
+
+        (serial, (blocking, blocked)), total_users = await asyncio.gather(
+            fetch_block_stats_passes(blocking_query, blocked_query),
+            get_user_count(get_active=False),
+        )
+
+        logger.info("All blocklist queries complete.")
+
+        total_blocks = sum(row["row_count"] for row in blocking)
+        blocking_counts = {row["block_count"]: row["users"] for row in blocking}
+        blocked_counts = {row["block_count"]: row["users"] for row in blocked}
+
+        return serial, total_blocks, blocking_counts, blocked_counts, total_users
+    except asyncpg.PostgresError as e:
+        logger.error(f"Postgres error: {e}")
+        raise DatabaseConnectionError
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except AttributeError:
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        raise InternalServerError
+
+
+async def get_distinct_block_counts(first_day=None, last_day=None):
+    # Distinct blockers and blocked accounts as HyperLogLog estimates (blocking, blocked, error bounds), overall or
+    # with blocks made on the days from first_day to last_day inclusive. Never falls back to a COUNT(DISTINCT) scan,
+    # without sketches (exact statistics mode or before the block cache is loaded) the counts are unavailable.
+    sketches = block_count_sketches
+
+    if sketches is None:
+        logger.warning("Distinct block counts requested without block count sketches.")
+        raise DatabaseConnectionError
+
+    if first_day is None:
+        blocking, blocked = sketches.blocking, sketches.blocked
+    else:
+        blocking, blocked = await asyncio.to_thread(sketches.window, first_day.isoformat(), last_day.isoformat())
+
+    return blocking.count(), blocked.count(), (blocking.error_bound(), blocked.error_bound())
+
+
+async def get_active_dids(dids) -> set[str]:
+    pool_name = get_connection_pool("read")
+    async with connection_pools[pool_name].acquire() as connection:
+        rows = await connection.fetch("SELECT did FROM users WHERE did = ANY($1::text[]) AND status = TRUE", dids)
+
+    return {row["did"] for row in rows}
+
+
+async def load_top_24_window():
+    global top_24_window
+    global top_24_window_serial
+
+    # Per hour counts of the last 24 hours in one snapshot with the serial_id they include, the tail continues from it
+    blocked_query = """SELECT FLOOR(EXTRACT(EPOCH FROM block_date) / 3600)::bigint AS hour, blocked_did AS did,
+                            COUNT(*) AS block_count
+                        FROM blocklists
+                        WHERE block_date >= $1 AND blocked_did IS NOT NULL
+                        GROUP BY 1, 2"""
+    blockers_query = """SELECT FLOOR(EXTRACT(EPOCH FROM block_date) / 3600)::bigint AS hour, user_did AS did,
+                            COUNT(*) AS block_count
+                        FROM blocklists
+                        WHERE block_date >= $1 AND user_did IS NOT NULL
+                        GROUP BY 1, 2"""
+
+    window = HourlyBlockWindow(24)
+    window.advance()
+    window_start = window.start()
+
+    logger.info("Loading top 24 hour blocks window from db.")
+    try:
+        async with (
+            acquire_analytics_connection(scored=False) as connection,
+            connection.transaction(isolation="repeatable_read", readonly=True),
+        ):
+            last_serial = await connection.fetchval("SELECT COALESCE(MAX(serial_id), 0) FROM blocklists_transaction")
+            blocked_rows = await connection.fetch(blocked_query, window_start)
+            blocker_rows = await connection.fetch(blockers_query, window_start)
+    except asyncpg.exceptions.UndefinedTableError:
+        logger.warning("table doesn't exist")
+        raise InternalServerError
+    except asyncpg.PostgresError as e:
+        logger.error(f"Postgres error: {e}")
+        raise DatabaseConnectionError
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except AttributeError:
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+
+    for rows, blocked in ((blocked_rows, True), (blocker_rows, False)):
+        hours = {}
+        for row in rows:
+            hours.setdefault(row["hour"], []).append((row["did"], row["block_count"]))
+
+        for hour, counts in hours.items():
+            window.add_counts(hour, counts if blocked else (), () if blocked else counts)
+
+    top_24_window = window
+    top_24_window_serial = last_serial
+
+    logger.info(f"Top 24 hour blocks window loaded: {window.block_count} blocks up to serial_id {last_serial}.")
+
+
+async def update_top_24_window():
+    global top_24_window_serial
+
+    applied = 0
+
+    try:
+        pool_name = get_connection_pool("read")
+        async with connection_pools[pool_name].acquire() as connection:
+            while True:
+                rows = await connection.fetch(
+                    """SELECT serial_id, user_did, blocked_did, block_date, delete
+                    FROM blocklists_transaction
+                    WHERE serial_id > $1
+                    ORDER BY serial_id
+                    LIMIT $2""",
+                    top_24_window_serial,
+                    all_blocks_tail_batch_size,
+                )
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    top_24_window.apply(row["block_date"], row["user_did"], row["blocked_did"], bool(row["delete"]))
+
+                applied += len(rows)
+                top_24_window_serial = rows[-1]["serial_id"]
+
+                if len(rows) < all_blocks_tail_batch_size:
+                    break
+    except asyncpg.PostgresError as e:
+        logger.error(f"Postgres error: {e}")
+        raise DatabaseConnectionError
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except AttributeError:
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+
+    expired = top_24_window.advance()
+
+    logger.info(f"Top 24 hour blocks window updated: {applied} changes, {expired} hours expired.")
+
+
+def block_counts_start(unit, length, now=None):
+    # First bucket of a window of length units, the window always covers at least that long
+    if now is None:
+        now = datetime.now(timezone.utc)
+
+    if unit == "hour":
+        return (now - timedelta(hours=length)).replace(minute=0, second=0, microsecond=0)
+
+    return (now - timedelta(days=length)).date()
+
+
+async def update_block_counts(rebuild=False):
+    # Adds the blocklists_transaction rows since the last run to the hourly and daily counts, in the same transaction
+    # as the serial_id it got to, so every row is counted once. The first run backfills the retention from blocklists.
+    # A transaction can commit a lower serial_id after the marker passed it, the serial_ids missing below the marker
+    # are kept as gaps and counted when they show up. rebuild recounts the recent buckets from blocklists as well.
+    retention = {"hour": block_counts_hourly_retention, "day": block_counts_daily_retention}
+
+    block_counts_status.set()
+
+    try:
+        pool_name = get_connection_pool("write")
+        async with (
+            connection_pools[pool_name].acquire() as connection,
+            connection.transaction(isolation="repeatable_read"),
+        ):
+            progress = await connection.fetchrow(
+                f"SELECT last_serial, gaps FROM {block_counts_progress_table} WHERE name = 'blocklists' FOR UPDATE"
+            )
+            last_serial = progress["last_serial"] if progress else None
+            gaps = list(progress["gaps"]) if progress else []
+            max_serial = await connection.fetchval("SELECT COALESCE(MAX(serial_id), 0) FROM blocklists_transaction")
+
+            for unit, (table, column, expression) in block_counts_buckets.items():
+                start = block_counts_start(unit, retention[unit])
+
+                if last_serial is None:
+                    await connection.execute(f"DELETE FROM {table}")
+                    await backfill_block_counts(connection, unit, start)
+
+                    continue
+
+                await connection.execute(f"DELETE FROM {table} WHERE {column} < $1", start)
+
+                start_time = start if unit == "hour" else datetime.combine(start, time.min, timezone.utc)
+                for list_type, did_column in block_counts_list_columns.items():
+                    await connection.execute(
+                        f"""INSERT INTO {table} (list_type, {column}, did, count)
+                        SELECT $1::text, {expression}, {did_column}, SUM(CASE WHEN delete THEN -1 ELSE 1 END)
+                        FROM blocklists_transaction
+                        WHERE ((serial_id > $2 AND serial_id <= $3) OR serial_id = ANY($5::bigint[]))
+                            AND block_date >= $4 AND {did_column} IS NOT NULL
+                        GROUP BY 2, 3
+                        ON CONFLICT (list_type, {column}, did)
+                        DO UPDATE SET count = {table}.count + EXCLUDED.count""",
+                        list_type,
+                        last_serial,
+                        max_serial,
+                        start_time,
+                        gaps,
+                    )
+
+                if rebuild:
+                    rebuild_start = max(start, block_counts_start(unit, block_counts_rebuild_length[unit]))
+                    await connection.execute(f"DELETE FROM {table} WHERE {column} >= $1", rebuild_start)
+                    await backfill_block_counts(connection, unit, rebuild_start)
+
+            # Gaps still missing from this snapshot, and the new ones up to max_serial. Gaps further than
+            # block_counts_gap_serials behind are rolled back serial_ids, the daily rebuild covers anything else.
+            gaps = await connection.fetchval(
+                """SELECT COALESCE(array_agg(expected.serial_id ORDER BY expected.serial_id), '{}')
+                FROM (
+                    SELECT unnest($1::bigint[]) AS serial_id
+                    UNION ALL
+                    SELECT generate_series(GREATEST($2, $3 - $4) + 1, $3)
+                ) AS expected
+                WHERE expected.serial_id > $3 - $4
+                    AND NOT EXISTS (
+                        SELECT 1 FROM blocklists_transaction AS t WHERE t.serial_id = expected.serial_id
+                    )""",
+                gaps if last_serial is not None else [],
+                last_serial if last_serial is not None else max_serial - block_counts_gap_serials,
+                max_serial,
+                block_counts_gap_serials,
+            )
+
+            await connection.execute(
+                f"""INSERT INTO {block_counts_progress_table} (name, last_serial, gaps) VALUES ('blocklists', $1, $2)
+                ON CONFLICT (name) DO UPDATE SET last_serial = EXCLUDED.last_serial, gaps = EXCLUDED.gaps""",
+                max_serial,
+                gaps,
+            )
+    except asyncpg.PostgresError as e:
+        logger.error(f"Postgres error: {e}")
+        raise DatabaseConnectionError
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except AttributeError:
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+    finally:
+        block_counts_status.clear()
+
+    action = "backfilled" if last_serial is None else f"updated from serial_id {last_serial}"
+    if rebuild:
+        action += ", recent buckets rebuilt,"
+    logger.info(f"Block counts {action} up to serial_id {max_serial}, {len(gaps)} serial_ids pending.")
+
+
+async def backfill_block_counts(connection, unit, start):
+    # Counts of the blocks in blocklists dated from start on, into the empty buckets from start on
+    table, column, expression = block_counts_buckets[unit]
+    start_time = start if unit == "hour" else datetime.combine(start, time.min, timezone.utc)
+
+    for list_type, did_column in block_counts_list_columns.items():
+        await connection.execute(
+            f"""INSERT INTO {table} (list_type, {column}, did, count)
+            SELECT $1::text, {expression}, {did_column}, COUNT(*)
+            FROM blocklists
+            WHERE block_date >= $2 AND {did_column} IS NOT NULL
+            GROUP BY 2, 3""",
+            list_type,
+            start_time,
+        )
+
+
+async def get_windowed_top_blocks(unit, length, limit=25):
+    table, column, _expression = block_counts_buckets[unit]
+    start = block_counts_start(unit, length)
+    query = f"""SELECT c.did, SUM(c.count) AS block_count
+                FROM {table} AS c
+                JOIN users AS u ON c.did = u.did AND u.status = TRUE
+                WHERE c.list_type = $1 AND c.{column} >= $2
+                GROUP BY c.did
+                HAVING SUM(c.count) > 0
+                ORDER BY block_count DESC, c.did DESC
+                LIMIT $3"""
+
+    try:
+        async with acquire_analytics_connection(scored=False) as connection:
+            blocked_data = await connection.fetch(query, "blocked", start, limit)
+            blockers_data = await connection.fetch(query, "blocker", start, limit)
+
+            return blocked_data, blockers_data
     except asyncpg.exceptions.UndefinedTableError:
         logger.warning("table doesn't exist")
         raise InternalServerError
@@ -725,356 +1407,644 @@ async def update_top_block_list_table(entries, list_type):
         raise InternalServerError
 
 
-async def get_top_blocks_list() -> tuple[list[tuple[str, int]], list[tuple[str, int]]]:
+async def update_block_waves():
+    global block_waves_detector
+    global block_waves_serial
+    global block_waves
+    global block_waves_as_of_time
+
+    # Blocks are counted by their block_date, rows dated before the window (late or replayed) are skipped, so the first
+    # run can start a batch before the end of the table and only the recent rows count
+    if block_waves_detector is None:
+        block_waves_detector = WindowedHeavyHitters(
+            window_slots=block_waves_window_minutes,
+            slot_seconds=60,
+            width=config.getint("block_waves", "sketch_width", fallback=2048),
+            depth=config.getint("block_waves", "sketch_depth", fallback=4),
+            top_k=config.getint("block_waves", "top_k", fallback=100),
+        )
+
+    block_waves_status.set()
+    now = datetime.now(timezone.utc)
+    block_waves_detector.advance(now.timestamp())
+    counted = 0
+
+    try:
+        pool_name = get_connection_pool("read")
+        async with connection_pools[pool_name].acquire() as connection:
+            if block_waves_serial is None:
+                max_serial = await connection.fetchval("SELECT COALESCE(MAX(serial_id), 0) FROM blocklists_transaction")
+                block_waves_serial = max(max_serial - all_blocks_tail_batch_size, 0)
+
+            while True:
+                rows = await connection.fetch(
+                    """SELECT serial_id, blocked_did, block_date
+                    FROM blocklists_transaction
+                    WHERE serial_id > $1 AND delete IS NOT TRUE
+                    ORDER BY serial_id
+                    LIMIT $2""",
+                    block_waves_serial,
+                    all_blocks_tail_batch_size,
+                )
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    if row["blocked_did"] is not None and row["block_date"] is not None:
+                        counted += block_waves_detector.add(row["blocked_did"], row["block_date"].timestamp())
+
+                block_waves_serial = rows[-1]["serial_id"]
+
+                if len(rows) < all_blocks_tail_batch_size:
+                    break
+
+            candidates = block_waves_detector.top(block_waves_detector.top_k, block_waves_min_blocks)
+            handles = {}
+
+            if candidates:
+                handle_rows = await connection.fetch(
+                    "SELECT did, handle FROM users WHERE did = ANY($1::text[]) AND status = TRUE",
+                    [did for did, _estimate in candidates],
+                )
+                handles = {row["did"]: row["handle"] for row in handle_rows}
+    except asyncpg.PostgresError as e:
+        logger.error(f"Postgres error: {e}")
+        raise DatabaseConnectionError
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except AttributeError:
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+    finally:
+        block_waves_status.clear()
+
+    block_waves = [(did, handles[did], estimate) for did, estimate in candidates if did in handles][:20]
+    block_waves_as_of_time = now.isoformat()
+
+    logger.info(f"Block waves updated: {counted} blocks counted, {len(block_waves)} dids over the threshold.")
+
+
+async def get_top24_blocks():
+    # Top 25 active accounts of the window, inactive ones are skipped by widening the candidate list until 25 are found
+    results = []
+
+    try:
+        for list_type in ("blocked", "blocker"):
+            candidate_count = 100
+
+            while True:
+                candidates = top_24_window.top(list_type, candidate_count)
+                active_dids = await get_active_dids([did for did, _count in candidates])
+                entries = [(did, count) for did, count in candidates if did in active_dids][:25]
+
+                if len(entries) == 25 or len(candidates) < candidate_count:
+                    break
+
+                candidate_count *= 4
+
+            results.append(entries)
+    except asyncpg.PostgresError as e:
+        logger.error(f"Postgres error: {e}")
+        raise DatabaseConnectionError
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except AttributeError:
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        raise InternalServerError
+
+    blocked_data, blockers_data = results
+
+    return blocked_data, blockers_data
+
+
+async def copy_rows(connection, query, consume, *args) -> BinaryCopyParser:
+    # Streams a full query result with COPY (FORMAT binary). consume gets each chunk of decoded rows, so no Record
+    # objects are created and only one network chunk is buffered at a time.
+    parser = BinaryCopyParser()
+
+    async def output(data):
+        rows = parser.feed(data)
+
+        if rows:
+            consume(rows)
+
+    await connection.copy_from_query(query, *args, output=output, format="binary")
+
+    return parser
+
+
+async def block_page_ranges(pool_name) -> list[tuple[int, int]]:
+    # Splits blocklists into load_partitions ranges of heap pages. Replicas are physical copies of the primary, so a
+    # page range holds the same rows on every replica. The last range is open ended for pages added during the load.
+    async with connection_pools[pool_name].acquire() as connection:
+        pages = await connection.fetchval(
+            "SELECT pg_relation_size('blocklists') / current_setting('block_size')::bigint"
+        )
+
+    size = max(math.ceil(pages / all_blocks_load_partitions), 1)
+    ranges = [(start, start + size) for start in range(0, size * all_blocks_load_partitions, size)]
+    ranges[-1] = (ranges[-1][0], max_block_number)
+
+    return ranges
+
+
+async def copy_block_partitions(pool_name, page_ranges, builder, sketches=None) -> tuple[int, list[BinaryCopyParser]]:
+    # Each partition is a ctid range read with a TID range scan, so it reads only its own pages instead of the table.
+    # Each replica streams its share of partitions one after another.
+    parsers = []
+
+    # Runs in its own task under asyncio.gather, the load's queries stay out of the replica latency scores
+    replica_scored.set(False)
+
+    if sketches is None:
+        query = "SELECT user_did, blocked_did FROM blocklists WHERE ctid >= $1::text::tid AND ctid < $2::text::tid"
+    else:
+        query = """SELECT user_did, blocked_did, (block_date AT TIME ZONE 'UTC')::date::text
+                FROM blocklists
+                WHERE ctid >= $1::text::tid AND ctid < $2::text::tid"""
+
+    def consume(rows):
+        builder.add_rows(rows)
+
+        if sketches is not None:
+            sketches.add_rows(rows)
+
+    async with connection_pools[pool_name].acquire() as connection:
+        # The full load outlasts the lookup statement_timeout of the read pools, RESET ALL on release restores it
+        await connection.execute("SET statement_timeout = 0")
+
+        last_serial = await connection.fetchval("SELECT COALESCE(MAX(serial_id), 0) FROM blocklists_transaction")
+
+        for start, end in page_ranges:
+            parser = await copy_rows(connection, query, consume, f"({start},0)", f"({end},0)")
+            parsers.append(parser)
+
+    return last_serial, parsers
+
+
+def create_block_count_sketches():
+    if utils.statistics_mode != "approximate":
+        return None
+
+    return BlockCountSketches(utils.hll_precision)
+
+
+async def save_block_snapshot(graph, last_serial):
+    # Returns the graph mapped from the written snapshot, so workers share the page cache instead of heap copies
+    global all_blocks_snapshot_serial
+
+    if not all_blocks_snapshot_path:
+        return graph
+
+    try:
+        await asyncio.to_thread(write_snapshot, graph, all_blocks_snapshot_path, last_serial)
+        mapped_graph, _last_serial = await asyncio.to_thread(load_snapshot, all_blocks_snapshot_path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error writing block cache snapshot: {e}")
+
+        return graph
+
+    all_blocks_snapshot_serial = last_serial
+
+    logger.info(f"Block cache snapshot written: {all_blocks_snapshot_path}")
+
+    return mapped_graph
+
+
+async def load_block_snapshot():
+    global all_blocks_graph
+    global all_blocks_index
+    global all_blocks_last_serial
+    global all_blocks_published_time
+    global all_blocks_published_serial
+    global all_blocks_generation
+    global all_blocks_last_update
+    global all_blocks_snapshot_serial
+
+    if all_blocks_graph is not None or not all_blocks_snapshot_path:
+        return
+
+    if not await aiofiles.os.path.exists(all_blocks_snapshot_path):
+        return
+
+    async with all_blocks_lock:
+        try:
+            graph, last_serial = await asyncio.to_thread(load_snapshot, all_blocks_snapshot_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Block cache snapshot not usable: {e}")
+
+            return
+
+        all_blocks_index = await asyncio.to_thread(workers.build_similarity_index, graph)
+        all_blocks_graph = BlockGraphOverlay(graph)
+        all_blocks_last_serial = last_serial
+        all_blocks_snapshot_serial = last_serial
+        all_blocks_published_serial = last_serial
+        all_blocks_published_time = datetime.now(timezone.utc)
+        all_blocks_generation += 1
+        similarity_results_cache.clear()
+        snapshot_time = await aiofiles.os.path.getmtime(all_blocks_snapshot_path)
+        all_blocks_last_update = datetime.fromtimestamp(snapshot_time, timezone.utc)
+        workers.start_workers(graph, all_blocks_index)
+
+    logger.info(
+        f"Block cache warm started from snapshot: {all_blocks_graph.node_count} dids, "
+        f"{all_blocks_graph.edge_count} blocks, serial_id {all_blocks_last_serial}"
+    )
+
+
+async def load_all_blocks():
+    global all_blocks_graph
+    global all_blocks_index
+    global all_blocks_last_serial
+    global all_blocks_published_time
+    global all_blocks_published_serial
+    global all_blocks_generation
+    global all_blocks_start_time
+    global all_blocks_process_time
+    global all_blocks_last_update
+    global all_blocks_load_rate
+    global block_count_sketches
+
+    async with all_blocks_lock:
+        logger.info("Caching all blocklists.")
+        all_blocks_start_time = datetime.now(timezone.utc)
+
+        block_cache_status.set()
+
+        builder = BlockGraphBuilder()
+
+        try:
+            pool_names = [pool_name for pool_name in read_dbs if pool_name in connection_pools]
+            if not pool_names:
+                pool_names = [get_connection_pool("read")]
+
+            page_ranges = await block_page_ranges(pool_names[0])
+
+            # One sketch set per replica, merged once every partition is loaded
+            replica_sketches = [create_block_count_sketches() for _pool_name in pool_names]
+
+            copy_start_time = datetime.now(timezone.utc)
+            results = await asyncio.gather(
+                *(
+                    copy_block_partitions(
+                        pool_name,
+                        page_ranges[index :: len(pool_names)],
+                        builder,
+                        replica_sketches[index],
+                    )
+                    for index, pool_name in enumerate(pool_names)
+                )
+            )
+            copy_seconds = max((datetime.now(timezone.utc) - copy_start_time).total_seconds(), 0.001)
+
+            # Each replica read its MAX(serial_id) before its partitions, so tailing from the lowest one replays
+            # every change a partition may have missed; applying a change twice is a no-op
+            last_serial = min(replica_serial for replica_serial, _parsers in results)
+            parsers = [parser for _replica_serial, replica_parsers in results for parser in replica_parsers]
+
+            # Building the CSR arrays is CPU bound, keep it off the event loop
+            graph = await asyncio.to_thread(builder.build)
+            graph = await save_block_snapshot(graph, last_serial)
+            all_blocks_index = await asyncio.to_thread(workers.build_similarity_index, graph)
+            all_blocks_graph = BlockGraphOverlay(graph)
+            all_blocks_last_serial = last_serial
+            all_blocks_published_serial = last_serial
+            all_blocks_published_time = datetime.now(timezone.utc)
+            all_blocks_generation += 1
+            similarity_results_cache.clear()
+            block_count_sketches = replica_sketches[0]
+            for sketches in replica_sketches[1:]:
+                block_count_sketches.merge(sketches)
+            all_blocks_load_rate = (
+                sum(parser.row_count for parser in parsers) / copy_seconds,
+                sum(parser.bytes_read for parser in parsers) / copy_seconds,
+            )
+            workers.start_workers(graph, all_blocks_index)
+        except asyncpg.PostgresError as e:
+            logger.error(f"Postgres error: {e}")
+            raise DatabaseConnectionError
+        except asyncpg.InterfaceError as e:
+            logger.error(f"interface error: {e}")
+            raise DatabaseConnectionError
+        except AttributeError:
+            logger.error("db connection issue.")
+            raise DatabaseConnectionError
+        finally:
+            block_cache_status.clear()
+
+        end_time = datetime.now(timezone.utc)
+        all_blocks_process_time = end_time - all_blocks_start_time
+        all_blocks_last_update = end_time
+
+        logger.info(
+            f"Block cache loaded: {all_blocks_graph.node_count} dids, {all_blocks_graph.edge_count} blocks, "
+            f"{all_blocks_graph.nbytes / 1024 / 1024:.1f} MiB in {all_blocks_process_time} "
+            f"({all_blocks_load_rate[0]:.0f} rows/s, {all_blocks_load_rate[1] / 1024 / 1024:.1f} MiB/s)"
+        )
+
+        if all_blocks_index is not None:
+            logger.info(
+                f"Similarity index built: {all_blocks_index.indexed_count} blockers, "
+                f"{all_blocks_index.nbytes / 1024 / 1024:.1f} MiB"
+            )
+
+        return all_blocks_graph
+
+
+def apply_block_changes(rows) -> int:
+    # Feeds the block graph, the block count sketches and the block stats deltas from the blocklists_transaction rows,
+    # in serial_id order. The 24 hour window, the block counts and the block waves tail the stream on their own.
+    applied = 0
+
+    for row in rows:
+        delete = bool(row["delete"])
+
+        # Sketches only grow, deletes are accounted for at the next full load
+        if block_count_sketches is not None and not delete:
+            block_date = row["block_date"]
+            day = block_date.astimezone(timezone.utc).date().isoformat() if block_date is not None else None
+            block_count_sketches.add(row["user_did"], row["blocked_did"], day)
+
+        if all_blocks_graph.apply(row["user_did"], row["blocked_did"], delete, row["serial_id"]):
+            applied += 1
+
+            utils.apply_block_stats_change(
+                row["serial_id"],
+                all_blocks_graph.blocking_count(all_blocks_graph.lookup(row["user_did"])),
+                all_blocks_graph.blocked_by_count(all_blocks_graph.lookup(row["blocked_did"])),
+                delete,
+            )
+
+    return applied
+
+
+async def update_all_blocks():
+    global all_blocks_graph
+    global all_blocks_index
+    global all_blocks_last_serial
+    global all_blocks_published_time
+    global all_blocks_published_serial
+    global all_blocks_last_update
+
+    if all_blocks_graph is None or all_blocks_lock.locked():
+        return
+
+    async with all_blocks_lock:
+        applied = 0
+
+        # Rows committed out of serial_id order can be skipped here, the 24 hour rebuild corrects that drift
+        try:
+            pool_name = get_connection_pool("read")
+            async with connection_pools[pool_name].acquire() as connection:
+                while True:
+                    rows = await connection.fetch(
+                        """SELECT serial_id, user_did, blocked_did, block_date, delete
+                        FROM blocklists_transaction
+                        WHERE serial_id > $1
+                        ORDER BY serial_id
+                        LIMIT $2""",
+                        all_blocks_last_serial,
+                        all_blocks_tail_batch_size,
+                    )
+
+                    if not rows:
+                        break
+
+                    applied += apply_block_changes(rows)
+                    all_blocks_last_serial = rows[-1]["serial_id"]
+
+                    if len(rows) < all_blocks_tail_batch_size:
+                        break
+
+            utils.publish_block_statistics()
+        except asyncpg.PostgresError as e:
+            logger.error(f"Postgres error: {e}")
+            raise DatabaseConnectionError
+        except asyncpg.InterfaceError as e:
+            logger.error(f"interface error: {e}")
+            raise DatabaseConnectionError
+        except AttributeError:
+            logger.error("db connection issue.")
+            raise DatabaseConnectionError
+
+        all_blocks_last_update = datetime.now(timezone.utc)
+
+        if all_blocks_graph.change_count == 0:
+            # Only rows without effect were read, the base graph the workers serve is still current
+            all_blocks_published_serial = all_blocks_last_serial
+
+            return
+
+        published_age = all_blocks_last_update - all_blocks_published_time
+
+        if all_blocks_graph.change_count < all_blocks_compact_threshold and published_age < timedelta(
+            minutes=all_blocks_refresh_minutes
+        ):
+            logger.info(
+                f"Block cache updated: {applied} changes applied up to serial_id {all_blocks_last_serial}, "
+                f"similarity workers at serial_id {all_blocks_published_serial}."
+            )
+
+            return
+
+        logger.info(f"Compacting block cache: {all_blocks_graph.change_count} changes.")
+
+        graph = await asyncio.to_thread(all_blocks_graph.compact)
+        graph = await save_block_snapshot(graph, all_blocks_last_serial)
+        all_blocks_index = await asyncio.to_thread(workers.build_similarity_index, graph)
+        all_blocks_graph = BlockGraphOverlay(graph, all_blocks_graph.did_serials)
+
+        # Workers only ever get a base graph, the overlay keeps changing under the lock while they run
+        workers.start_workers(graph, all_blocks_index)
+        all_blocks_published_serial = all_blocks_last_serial
+        all_blocks_published_time = all_blocks_last_update
+
+        # The precomputed results still valid for the new snapshot go with it
+        await save_similar_users()
+
+        logger.info(f"Block cache compacted: similarity workers restarted at serial_id {all_blocks_last_serial}.")
+
+
+async def precompute_similar_users():
+    global similar_users_precomputed
+    global similar_users_precompute_process_time
+    global similar_users_precompute_as_of_time
+
+    if all_blocks_graph is None:
+        logger.warning("Block cache not loaded, skipping similar users precompute.")
+
+        return
+
+    logger.info("Precomputing similar users.")
+    start_time = datetime.now(timezone.utc)
+
+    similar_users_precompute_status.set()
+
+    precomputed = {}
+
     try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            query1 = "SELECT distinct did, count FROM top_block WHERE list_type = 'blocked'"
-            query2 = "SELECT distinct did, count FROM top_block WHERE list_type = 'blocker'"
-            blocked_rows = await connection.fetch(query1)
-            blocker_rows = await connection.fetch(query2)
+        dids = await asyncio.to_thread(all_blocks_graph.blockers, workers.precompute_min_blocks)
 
-            return blocked_rows, blocker_rows
-    except asyncpg.PostgresError as e:
-        logger.error(f"Postgres error: {e}")
-        raise DatabaseConnectionError
-    except asyncpg.InterfaceError as e:
-        logger.error(f"interface error: {e}")
-        raise DatabaseConnectionError
-    except AttributeError:
-        logger.error("db connection issue.")
-        raise DatabaseConnectionError
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        raise InternalServerError
+        # One batch at a time, so interactive requests keep the other worker slots
+        for start in range(0, len(dids), workers.precompute_batch_size):
+            batch = dids[start : start + workers.precompute_batch_size]
+            tags = [similarity_cache_tag(did) for did in batch]
+            results = await workers.run_similarity(workers.similar_blockers_batch, batch, 20)
 
+            for tag, (did, result) in zip(tags, results, strict=True):
+                if tag is not None:
+                    precomputed[did] = (tag, result)
+    except InternalServerError:
+        logger.error("Similar users precompute failed, keeping previous results.")
 
-async def get_24_hour_block_list():
-    try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            query1 = "SELECT distinct did, count FROM top_twentyfour_hour_block WHERE list_type = 'blocked'"
-            query2 = "SELECT distinct did, count FROM top_twentyfour_hour_block WHERE list_type = 'blocker'"
-            blocked_rows = await connection.fetch(query1)
-            blocker_rows = await connection.fetch(query2)
+        return
+    finally:
+        similar_users_precompute_status.clear()
 
-            return blocked_rows, blocker_rows
-    except asyncpg.PostgresError as e:
-        logger.error(f"Postgres error: {e}")
-        raise DatabaseConnectionError
-    except asyncpg.InterfaceError as e:
-        logger.error(f"interface error: {e}")
-        raise DatabaseConnectionError
-    except AttributeError:
-        logger.error("db connection issue.")
-        raise DatabaseConnectionError
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        raise InternalServerError
+    similar_users_precomputed = precomputed
+    similar_users_precompute_as_of_time = start_time
+    similar_users_precompute_process_time = datetime.now(timezone.utc) - start_time
 
+    logger.info(f"Similar users precomputed for {len(precomputed)} blockers in {similar_users_precompute_process_time}")
 
-async def get_top_blocks():
-    blocked_results = []
-    blockers_results = []
+    await save_similar_users()
 
-    logger.info("Getting top blocks from db.")
-    try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            # Insert the new row with the given last_processed_did
-            blocked_query = """SELECT b.blocked_did, COUNT(*) AS block_count
-                                    FROM blocklists AS b
-                                    WHERE b.blocked_did IN (
-                                    SELECT u.did
-                                    FROM users AS u
-                                    WHERE u.status = TRUE
-                                )
-                                    GROUP BY b.blocked_did
-                                    ORDER BY block_count DESC
-                                    LIMIT 25"""
 
-            blocked_data = await connection.fetch(blocked_query)
-            blocked_results.append(blocked_data)
+def write_similar_users(path, snapshot_serial, as_of_time, results) -> None:
+    temp_path = f"{path}.tmp"
 
-            blockers_query = """SELECT b.user_did, COUNT(*) AS block_count
-                                    FROM blocklists AS b
-                                    WHERE b.user_did IN (
-                                    SELECT u.did
-                                    FROM users AS u
-                                    WHERE u.status = TRUE
-                                )
-                                    GROUP BY b.user_did
-                                    ORDER BY block_count DESC
-                                    LIMIT 25"""
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump({"serial": snapshot_serial, "as_of": as_of_time.isoformat(), "results": results}, file)
+        file.flush()
+        os.fsync(file.fileno())
 
-            blockers_data = await connection.fetch(blockers_query)
-            blockers_results.append(blockers_data)
+    os.replace(temp_path, path)
 
-            return blocked_data, blockers_data
-    except asyncpg.exceptions.UndefinedTableError:
-        logger.warning("table doesn't exist")
-        raise InternalServerError
-    except asyncpg.PostgresError as e:
-        logger.error(f"Postgres error: {e}")
-        raise DatabaseConnectionError
-    except asyncpg.InterfaceError as e:
-        logger.error(f"interface error: {e}")
-        raise DatabaseConnectionError
-    except AttributeError:
-        logger.error("db connection issue.")
-        raise DatabaseConnectionError
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        raise InternalServerError
 
+def read_similar_users(path) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+async def save_similar_users():
+    # Written next to the block graph snapshot, only results of DIDs whose blocks are the same in the snapshot as when
+    # they were computed, so they are valid for a graph loaded from it
+    if not similar_users_snapshot_path or all_blocks_snapshot_serial is None or not similar_users_precomputed:
+        return
+
+    results = {}
+    for did, ((generation, did_serial), result) in similar_users_precomputed.items():
+        if (
+            generation == all_blocks_generation
+            and did_serial == all_blocks_graph.did_serials.get(did, 0)
+            and did_serial <= all_blocks_snapshot_serial
+        ):
+            results[did] = result
 
-async def get_block_stats():
     try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            logger.info("Getting block statistics.")
-
-            query_1 = """SELECT COUNT(blocked_did) from blocklists"""
-            query_2 = """select count(distinct blocked_did) from blocklists"""
-            query_3 = """select count(distinct user_did) from blocklists"""
-            query_4 = """SELECT COUNT(*) AS user_count
-                                FROM (
-                                SELECT user_did
-                                FROM blocklists
-                                GROUP BY user_did
-                                HAVING COUNT(DISTINCT blocked_did) = 1
-                            ) AS subquery"""
-            query_5 = """SELECT COUNT(DISTINCT user_did) AS user_count
-                                FROM (
-                                    SELECT user_did
-                                    FROM blocklists
-                                    GROUP BY user_did
-                                    HAVING COUNT(DISTINCT blocked_did) BETWEEN 2 AND 100
-                                ) AS subquery"""
-            query_6 = """SELECT COUNT(DISTINCT user_did) AS user_count
-                                FROM (
-                                    SELECT user_did
-                                    FROM blocklists
-                                    GROUP BY user_did
-                                    HAVING COUNT(DISTINCT blocked_did) BETWEEN 101 AND 1000
-                                ) AS subquery"""
-            query_7 = """SELECT COUNT(DISTINCT user_did) AS user_count
-                                FROM (
-                                    SELECT user_did
-                                    FROM blocklists
-                                    GROUP BY user_did
-                                    HAVING COUNT(DISTINCT blocked_did) > 1000
-                                ) AS subquery"""
-            query_8 = """SELECT AVG(block_count) AS mean_blocks
-                                FROM (
-                                    SELECT user_did, COUNT(DISTINCT blocked_did) AS block_count
-                                    FROM blocklists
-                                    GROUP BY user_did
-                                ) AS subquery"""
-            query_9 = """SELECT COUNT(*) AS user_count
-                                FROM (
-                                    SELECT blocked_did
-                                    FROM blocklists
-                                    GROUP BY blocked_did
-                                    HAVING COUNT(DISTINCT user_did) = 1
-                                ) AS subquery"""
-            query_10 = """SELECT COUNT(*) AS user_count
-                                FROM (
-                                    SELECT blocked_did
-                                    FROM blocklists
-                                    GROUP BY blocked_did
-                                    HAVING COUNT(DISTINCT user_did) BETWEEN 2 AND 100
-                                ) AS subquery"""
-            query_11 = """SELECT COUNT(*) AS user_count
-                                FROM (
-                                    SELECT blocked_did
-                                    FROM blocklists
-                                    GROUP BY blocked_did
-                                    HAVING COUNT(DISTINCT user_did) BETWEEN 101 AND 1000
-                                ) AS subquery"""
-            query_12 = """SELECT COUNT(*) AS user_count
-                                FROM (
-                                    SELECT blocked_did
-                                    FROM blocklists
-                                    GROUP BY blocked_did
-                                    HAVING COUNT(DISTINCT user_did) > 1000
-                                ) AS subquery"""
-            query_13 = """SELECT AVG(block_count) AS mean_blocks
-                                FROM (
-                                    SELECT blocked_did, COUNT(DISTINCT user_did) AS block_count
-                                    FROM blocklists
-                                    GROUP BY blocked_did
-                                ) AS subquery"""
-
-            number_of_total_blocks = await connection.fetchval(query_1)
-            logger.info("Completed query 1")
-            number_of_unique_users_blocked = await connection.fetchval(query_2)
-            logger.info("Completed query 2")
-            number_of_unique_users_blocking = await connection.fetchval(query_3)
-            logger.info("Completed query 3")
-            number_block_1 = await connection.fetchval(query_4)
-            logger.info("Completed query 4")
-            number_blocking_2_and_100 = await connection.fetchval(query_5)
-            logger.info("Completed query 5")
-            number_blocking_101_and_1000 = await connection.fetchval(query_6)
-            logger.info("Completed query 6")
-            number_blocking_greater_than_1000 = await connection.fetchval(query_7)
-            logger.info("Completed query 7")
-            average_number_of_blocks = await connection.fetchval(query_8)
-            logger.info("Completed query 8")
-            number_blocked_1 = await connection.fetchval(query_9)
-            logger.info("Completed query 9")
-            number_blocked_2_and_100 = await connection.fetchval(query_10)
-            logger.info("Completed query 10")
-            number_blocked_101_and_1000 = await connection.fetchval(query_11)
-            logger.info("Completed query 11")
-            number_blocked_greater_than_1000 = await connection.fetchval(query_12)
-            logger.info("Completed query 12")
-            average_number_blocked = await connection.fetchval(query_13)
-            logger.info("Completed query 13")
-            total_users = await get_user_count(get_active=False)
-            logger.info("Completed query 14")
-
-            logger.info("All blocklist queries complete.")
-
-            return (
-                number_of_total_blocks,
-                number_of_unique_users_blocked,
-                number_of_unique_users_blocking,
-                number_block_1,
-                number_blocking_2_and_100,
-                number_blocking_101_and_1000,
-                number_blocking_greater_than_1000,
-                average_number_of_blocks,
-                number_blocked_1,
-                number_blocked_2_and_100,
-                number_blocked_101_and_1000,
-                number_blocked_greater_than_1000,
-                average_number_blocked,
-                total_users,
-            )
-    except asyncpg.PostgresError as e:
-        logger.error(f"Postgres error: {e}")
-        raise DatabaseConnectionError
-    except asyncpg.InterfaceError as e:
-        logger.error(f"interface error: {e}")
-        raise DatabaseConnectionError
-    except AttributeError:
-        logger.error("db connection issue.")
-        raise DatabaseConnectionError
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        raise InternalServerError
+        await asyncio.to_thread(
+            write_similar_users,
+            similar_users_snapshot_path,
+            all_blocks_snapshot_serial,
+            similar_users_precompute_as_of_time,
+            results,
+        )
+    except (OSError, TypeError, ValueError) as e:
+        logger.error(f"Error writing similar users snapshot: {e}")
+
+        return
 
+    logger.info(f"Similar users snapshot written: {len(results)} blockers.")
 
-async def get_top24_blocks():
-    blocked_results = []
-    blockers_results = []
 
-    logger.info("Getting top 24 blocks from db.")
+async def load_similar_users():
+    # Serves the precomputed results of the last run with the graph from the block cache snapshot until they are
+    # computed again
+    global similar_users_precomputed
+    global similar_users_precompute_as_of_time
+
+    if all_blocks_graph is None or all_blocks_snapshot_serial is None or similar_users_precomputed:
+        return
+
+    if not await aiofiles.os.path.exists(similar_users_snapshot_path):
+        return
+
     try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            # Insert the new row with the given last_processed_did
-            blocked_query = """SELECT b.blocked_did, COUNT(*) AS block_count
-                                    FROM blocklists AS b
-                                    JOIN users AS u ON b.blocked_did = u.did AND u.status = TRUE
-                                    WHERE b.block_date >= now() - INTERVAL '1 day'
-                                    GROUP BY b.blocked_did
-                                    ORDER BY block_count DESC
-                                    LIMIT 25"""
+        snapshot = await asyncio.to_thread(read_similar_users, similar_users_snapshot_path)
+        snapshot_serial = snapshot["serial"]
+        as_of_time = datetime.fromisoformat(snapshot["as_of"])
+        results = snapshot["results"]
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Similar users snapshot not usable: {e}")
 
-            blocked_data = await connection.fetch(blocked_query)
-            blocked_results.append(blocked_data)
+        return
 
-            blockers_query = """SELECT b.user_did, COUNT(*) AS block_count
-                                    FROM blocklists as b
-                                    JOIN users AS u ON b.user_did = u.did AND u.status = TRUE
-                                    WHERE b.block_date >= now() - INTERVAL '1 day'
-                                    GROUP BY user_did
-                                    ORDER BY block_count DESC
-                                    LIMIT 25"""
+    if snapshot_serial != all_blocks_snapshot_serial:
+        logger.warning("Similar users snapshot is for another block cache snapshot, not loaded.")
 
-            blockers_data = await connection.fetch(blockers_query)
-            blockers_results.append(blockers_data)
+        return
 
-            return blocked_data, blockers_data
-    except asyncpg.exceptions.UndefinedTableError:
-        logger.warning("table doesn't exist")
-        raise InternalServerError
-    except asyncpg.PostgresError as e:
-        logger.error(f"Postgres error: {e}")
-        raise DatabaseConnectionError
-    except asyncpg.InterfaceError as e:
-        logger.error(f"interface error: {e}")
-        raise DatabaseConnectionError
-    except AttributeError:
-        logger.error("db connection issue.")
-        raise DatabaseConnectionError
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        raise InternalServerError
+    similar_users_precomputed = {
+        did: (
+            (all_blocks_generation, 0),
+            None if result is None else [(other, percentage) for other, percentage in result],
+        )
+        for did, result in results.items()
+    }
+    similar_users_precompute_as_of_time = as_of_time
 
+    logger.info(f"Similar users loaded from snapshot for {len(similar_users_precomputed)} blockers.")
 
-async def get_similar_blocked_by(user_did):
-    global all_blocks_cache
 
-    pool_name = get_connection_pool("read")
-    async with connection_pools[pool_name].acquire() as connection:
-        blocked_by_users = await connection.fetch("SELECT user_did FROM blocklists WHERE blocked_did = $1", user_did)
+def similarity_cache_tag(did):
+    # Version of a DID's blocks, None while the similarity workers have not been started with its latest change
+    did_serial = all_blocks_graph.did_serials.get(did, 0)
 
-    # Extract the values from the records
-    blocked_by_users_ids = [record["user_did"] for record in blocked_by_users]
+    if did_serial > all_blocks_published_serial:
+        return None
 
-    if not all_blocks_cache:
-        logger.info("Caching all blocklists.")
+    return all_blocks_generation, did_serial
 
-        block_cache_status.set()
 
-        pool_name = get_connection_pool("read")
-        async with connection_pools[pool_name].acquire() as connection:
-            # Fetch all blocklists except for the specified user's blocklist
-            all_blocklists_rows = await connection.fetch("SELECT user_did, blocked_did FROM blocklists")
-            all_blocks_cache = all_blocklists_rows
+async def get_similarity_result(kind, func, did):
+    tag = similarity_cache_tag(did)
+    cached = similarity_results_cache.get((kind, did))
 
-            block_cache_status.clear()
-    else:
-        all_blocklists_rows = all_blocks_cache
+    if tag is not None and cached is not None and cached[0] == tag:
+        return cached[1]
 
-    # Create a dictionary to store blocklists as sets
-    blocklists = {}
-    for row in all_blocklists_rows:
-        user_id = row["user_did"]
-        blocked_id = row["blocked_did"]
-        if user_id not in blocklists:
-            blocklists[user_id] = set()
-        blocklists[user_id].add(blocked_id)
+    if kind == "blocklist" and tag is not None and did in similar_users_precomputed:
+        precomputed_tag, result = similar_users_precomputed[did]
 
-    # Calculate match percentages for each person's block list
-    user_match_percentages = {}
-    for blocked_by_user_id in blocked_by_users_ids:
-        if blocked_by_user_id != user_did:
-            common_blocked = set(blocklists.get(blocked_by_user_id, set())) & set(blocklists.get(user_did, set()))
-            common_count = len(common_blocked)
-            person_blocked_count = len(blocklists.get(blocked_by_user_id, set()))
+        if precomputed_tag == tag:
+            return result
+
+    result = await workers.run_similarity(func, did, 20)
 
-            # Check for division by zero
-            if person_blocked_count == 0:
-                continue  # Skip this comparison
+    if tag is not None:
+        similarity_results_cache[(kind, did)] = (tag, result)
 
-            match_percentage = (common_count / person_blocked_count) * 100
+    return result
 
-            # Only include matches with a match_percentage greater than 1
-            if match_percentage > 1:
-                user_match_percentages[blocked_by_user_id] = match_percentage
 
-    # Sort users by match percentage
-    sorted_users = sorted(user_match_percentages.items(), key=lambda x: x[1], reverse=True)
+async def get_similar_blocked_by(user_did):
+    top_similar_users = await get_similarity_result("blocked_by", workers.similar_blocked, user_did)
+
+    if top_similar_users is None:
+        users = "no blocks"
+        percentages = 0
+        status = None
 
-    # Select top 20 users
-    top_similar_users = sorted_users[:20]
+        return users, percentages, status
 
-    logger.info(top_similar_users)
+    logger.info(f"Similar blocked by: {await get_user_handle(user_did)} | {top_similar_users}")
 
     users = [user for user, percentage in top_similar_users]
     percentages = [percentage for user, percentage in top_similar_users]
@@ -1082,7 +2052,7 @@ async def get_similar_blocked_by(user_did):
     for user, _percentage in top_similar_users:
         pool_name = get_connection_pool("read")
         async with connection_pools[pool_name].acquire() as connection:
-            status = await connection.fetch("SELECT status FROM users WHERE did = $1", user)
+            status = await connection.fetchval("SELECT status FROM users WHERE did = $1", user)
             status_list.append(status)
 
     # Return the sorted list of users and their match percentages
@@ -1090,78 +2060,15 @@ async def get_similar_blocked_by(user_did):
 
 
 async def get_similar_users(user_did):
-    global all_blocks_cache
-    global all_blocks_process_time
-    global all_blocks_last_update
-
-    all_blocks = all_blocks_cache.get("blocks")
+    top_similar_users = await get_similarity_result("blocklist", workers.similar_blockers, user_did)
 
-    if not all_blocks:
-        logger.info("Caching all blocklists.")
-        start_time = datetime.now(timezone.utc)
-
-        block_cache_status.set()
-
-        pool_name = get_connection_pool("read")
-        async with connection_pools[pool_name].acquire() as connection:
-            # Fetch all blocklists except for the specified user's blocklist
-            all_blocklists_rows = await connection.fetch("SELECT user_did, blocked_did FROM blocklists")
-            all_blocks_cache["blocks"] = all_blocklists_rows
-
-            block_cache_status.clear()
-            end_time = datetime.now(timezone.utc)
-            if start_time is not None:
-                all_blocks_process_time = end_time - start_time
-            all_blocks_last_update = end_time
-    else:
-        all_blocklists_rows = all_blocks
-
-    # Create a dictionary to store blocklists as sets
-    blocklists = {}
-    specific_user_blocklist = set()
-
-    for row in all_blocklists_rows:
-        user_id = row["user_did"]
-        blocked_id = row["blocked_did"]
-        if user_id != user_did:
-            if user_id not in blocklists:
-                blocklists[user_id] = set()
-            blocklists[user_id].add(blocked_id)
-        else:
-            # Get the specific user's blocklist
-            specific_user_blocklist.add(blocked_id)
-
-    if not len(specific_user_blocklist):
+    if top_similar_users is None:
         users = "no blocks"
         percentages = 0
         status = None
 
         return users, percentages, status
 
-    # Calculate match percentage for each user
-    user_match_percentages = {}
-
-    for other_user_did, other_user_blocklist in blocklists.items():
-        common_blocked_users = specific_user_blocklist & other_user_blocklist
-        common_count = len(common_blocked_users)
-        specific_count = len(specific_user_blocklist)
-        other_count = len(other_user_blocklist)
-
-        # Check for division by zero
-        if specific_count == 0 or other_count == 0:
-            continue  # Skip this comparison
-
-        match_percentage = (common_count / specific_count) * 100
-
-        if match_percentage > 1:  # set threshold for results
-            user_match_percentages[other_user_did] = match_percentage
-
-    # Sort users by match percentage
-    sorted_users = sorted(user_match_percentages.items(), key=lambda x: x[1], reverse=True)
-
-    # Select top 20 users
-    top_similar_users = sorted_users[:20]
-
     logger.info(f"Similar blocks: {await get_user_handle(user_did)} | {top_similar_users}")
 
     users = [user for user, percentage in top_similar_users]
@@ -1183,29 +2090,22 @@ async def blocklists_updater():
     global top_blocks_process_time
     global top_blocked_as_of_time
 
-    blocked_list = "blocked"
-    blocker_list = "blocker"
-
     top_blocks_start_time = datetime.now(timezone.utc)
     blocklist_updater_status.set()
 
     logger.info("Updating top blocks lists requested.")
 
     try:
-        await truncate_top_blocks_table()
+        blocked_results, blockers_results = await get_top_blocks()  # Get blocks for db
+        logger.debug(f"blocked count: {len(blocked_results)} blockers count: {len(blockers_results)}")
+
+        await replace_top_block_table(top_blocks_table, blocked_results, blockers_results)
     except Exception as e:
-        logger.error(f"Error truncating top blocks table: {e}")
+        logger.error(f"Error updating top blocks table, previous lists kept: {e}")
+        blocklist_updater_status.clear()
         return
 
-    blocked_results, blockers_results = await get_top_blocks()  # Get blocks for db
-    logger.debug(f"blocked count: {len(blocked_results)} blockers count: {len(blockers_results)}")
-
-    # Update blocked entries
-    await update_top_block_list_table(blocked_results, blocked_list)  # add blocked to top blocks table
-    logger.info("Updated top blocked db.")
-
-    await update_top_block_list_table(blockers_results, blocker_list)  # add blocker to top blocks table
-    logger.info("Updated top blockers db.")
+    logger.info("Updated top blocked and blockers db.")
 
     top_blocked, top_blockers, blocked_aid, blocker_aid = await utils.resolve_top_block_lists()
     logger.info("Top blocks lists page updated.")
@@ -1222,49 +2122,58 @@ async def blocklists_updater():
 
     top_blocked_as_of_time = datetime.now(timezone.utc).isoformat()
 
+    await stats_history.record_point(
+        "top_blocks",
+        {"blocked": [list(row) for row in blocked_results], "blockers": [list(row) for row in blockers_results]},
+    )
+
     return top_blocked, top_blockers, blocked_aid, blocker_aid
 
 
-async def top_24blocklists_updater():
+async def top_24blocklists_updater(reload=True):
     global last_update_top_24_block
     global blocklist_24_updater_status
     global top_24_blocks_start_time
     global top_24_blocks_process_time
     global top_24_blocked_as_of_time
 
-    blocked_list_24 = "blocked"
-    blocker_list_24 = "blocker"
-
     top_24_blocks_start_time = datetime.now(timezone.utc)
     blocklist_24_updater_status.set()
 
     logger.info("Updating top 24 blocks lists requested.")
 
+    # A reload recounts the window from blocklists, otherwise only the changes since the last refresh are read
+    reloaded = reload or top_24_window is None
+
     try:
-        await truncate_top24_blocks_table()
+        if reloaded:
+            await load_top_24_window()
+        else:
+            await update_top_24_window()
     except Exception as e:
-        logger.error(f"Error truncating top 24 blocks table: {e}")
+        logger.error(f"Error updating top 24 blocks window: {e}")
+        blocklist_24_updater_status.clear()
         return
 
-    blocked_results_24, blockers_results_24 = await get_top24_blocks()  # Get blocks for db
-
-    logger.debug(f"blocked count: {len(blocked_results_24)} blockers count: {len(blockers_results_24)}")
-
-    # Update blocked entries
-    await update_24_hour_block_list_table(blocked_results_24, blocked_list_24)  # add blocked to top blocks table
-
-    logger.info("Updated top blocked db.")
+    try:
+        blocked_results_24, blockers_results_24 = await get_top24_blocks()  # Get blocks for db
+        logger.debug(f"blocked count: {len(blocked_results_24)} blockers count: {len(blockers_results_24)}")
 
-    await update_24_hour_block_list_table(blockers_results_24, blocker_list_24)  # add blocker to top blocks table
+        await replace_top_block_table(top_24_blocks_table, blocked_results_24, blockers_results_24)
+    except Exception as e:
+        logger.error(f"Error updating top 24 blocks table, previous lists kept: {e}")
+        blocklist_24_updater_status.clear()
+        return
 
-    logger.info("Updated top blockers db.")
+    logger.info("Updated top 24 blocked and blockers db.")
 
-    top_blocked_24, top_blockers_24, blocked_aid_24, blocker_aid_24 = await utils.resolve_top24_block_lists()
+    try:
+        top_blocked_24, top_blockers_24, blocked_aid_24, blocker_aid_24 = await utils.resolve_top24_block_lists()
+    finally:
+        blocklist_24_updater_status.clear()
 
     logger.info("Top 24 hour blocks lists page updated.")
 
-    blocklist_24_updater_status.clear()
-
     last_update_top_24_block = datetime.now(timezone.utc)
     end_time = datetime.now(timezone.utc)
 
@@ -1275,10 +2184,20 @@ async def top_24blocklists_updater():
 
     top_24_blocked_as_of_time = datetime.now(timezone.utc).isoformat()
 
+    # The windowed refresh runs every 5 minutes, the history keeps the lists of the full reloads
+    if reloaded:
+        await stats_history.record_point(
+            "top_24_blocks",
+            {
+                "blocked": [list(row) for row in blocked_results_24],
+                "blockers": [list(row) for row in blockers_results_24],
+            },
+        )
+
     return top_blocked_24, top_blockers_24, blocked_aid_24, blocker_aid_24
 
 
-async def get_mutelists(ident, limit=100, offset=0):
+async def get_mutelists(ident, limit=100, offset=0, after=None):
     count = 0
     pages = 0
 
@@ -1294,7 +2213,10 @@ async def get_mutelists(ident, limit=100, offset=0):
         LIMIT $2 OFFSET $3
         """
         try:
-            mute_lists = await connection.fetch(query, ident, limit, offset)
+            if after is None:
+                mute_lists = await connection.fetch(query, ident, limit, offset)
+            else:
+                mute_lists = await connection.fetch(mutelists_keyset_query, ident, *after, limit)
         except asyncpg.PostgresError as e:
             logger.error(f"Postgres error: {e}")
             raise DatabaseConnectionError
@@ -1319,6 +2241,9 @@ async def get_mutelists(ident, limit=100, offset=0):
                 "date_added": record["date_added"].isoformat(),
                 "list user count": record["user_count"],
             }
+            if after is not None:
+                data["uri"] = record["uri"]
+
             lists.append(data)
 
         return lists, count, pages
@@ -1372,9 +2297,9 @@ async def check_api_key(api_environment, key_type, key_value) -> bool:
 
 
 async def tables_exists() -> bool:
-    pool_name = get_connection_pool("write")
+    pool_name = get_connection_pool("read")
 
-    async with connection_pools[pool_name].acquire() as connection, connection.transaction():
+    async with connection_pools[pool_name].acquire() as connection:
         try:
             query1 = """SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = $1)"""
             query2 = """SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = $1)"""
@@ -1411,8 +2336,8 @@ async def get_api_keys(environment, key_type, key) -> dict | None:
 
         return None
 
-    pool_name = get_connection_pool("write")
-    async with connection_pools[pool_name].acquire() as connection, connection.transaction():
+    pool_name = get_connection_pool("read")
+    async with connection_pools[pool_name].acquire() as connection:
         try:
             query = """SELECT a.key as key, a.valid, aa.*
                             FROM api AS a
@@ -1447,8 +2372,7 @@ async def get_dids_per_pds() -> dict | None:
     data_dict = {}
 
     try:
-        pool_name = get_connection_pool("read")
-        async with connection_pools[pool_name].acquire() as connection:
+        async with acquire_analytics_connection(scored=False) as connection:
             query = """SELECT users.pds, COUNT(did) AS did_count, pds.status
                         FROM users
                         join pds on users.pds = pds.pds
@@ -1480,13 +2404,9 @@ async def get_dids_per_pds() -> dict | None:
 
 async def get_block_row(uri) -> dict | None:
     try:
-        pool_name = get_connection_pool("write")
-        async with connection_pools[pool_name].acquire() as connection, connection.transaction():
-            query = """SELECT user_did, blocked_did, block_date, cid, uri
-                            FROM blocklists
-                            WHERE uri = $1"""
-
-            record = await connection.fetch(query, uri)
+        pool_name = get_connection_pool("read")
+        async with connection_pools[pool_name].acquire() as connection:
+            record = await connection.fetch(block_row_query, uri)
 
             if record:
                 result = record[0]
@@ -1567,7 +2487,7 @@ async def get_user_did(handle) -> str | None:
     pool_name = get_connection_pool("read")
     async with connection_pools[pool_name].acquire() as connection:
         try:
-            did = await connection.fetchval("SELECT did FROM users WHERE handle = $1 AND status is True", handle)
+            did = await connection.fetchval(user_did_query, handle)
         except asyncpg.PostgresError as e:
             logger.error(f"Postgres error: {e}")
             raise DatabaseConnectionError
@@ -1606,8 +2526,7 @@ async def get_user_handle(did) -> str | None:
 
 
 async def get_user_count(get_active=True) -> int:
-    pool_name = get_connection_pool("read")
-    async with connection_pools[pool_name].acquire() as connection:
+    async with acquire_analytics_connection(scored=False) as connection:
         try:
             if get_active:
                 count = await connection.fetchval(
@@ -1641,8 +2560,7 @@ async def get_user_count(get_active=True) -> int:
 
 
 async def get_deleted_users_count() -> int:
-    pool_name = get_connection_pool("read")
-    async with connection_pools[pool_name].acquire() as connection:
+    async with acquire_analytics_connection(scored=False) as connection:
         try:
             count = await connection.fetchval(
                 "SELECT COUNT(*) FROM USERS JOIN pds ON users.pds = pds.pds WHERE pds.status is TRUE AND "
@@ -1664,34 +2582,37 @@ async def get_deleted_users_count() -> int:
         return count
 
 
-async def get_single_user_blocks(ident, limit=100, offset=0):
+async def get_single_user_blocks(ident, limit=100, offset=0, after=None):
     try:
         # Execute the SQL query to get all the user_dids that have the specified did/ident in their blocklist
         pool_name = get_connection_pool("read")
         async with connection_pools[pool_name].acquire() as connection:
-            result = await connection.fetch(
-                """SELECT DISTINCT user_did, block_date
-                                                FROM blocklists
-                                                WHERE blocked_did = $1
-                                                ORDER BY block_date DESC
-                                                LIMIT $2
-                                                OFFSET $3""",
-                ident,
-                limit,
-                offset,
-            )
+            if after is None:
+                result = await connection.fetch(
+                    """SELECT DISTINCT user_did, block_date
+                                                    FROM blocklists
+                                                    WHERE blocked_did = $1
+                                                    ORDER BY block_date DESC
+                                                    LIMIT $2
+                                                    OFFSET $3""",
+                    ident,
+                    limit,
+                    offset,
+                )
+            else:
+                result = await connection.fetch(single_user_blocks_keyset_query, ident, *after, limit)
 
             block_list = []
 
             if result:
                 # Iterate over blocked_users and extract handle and status
-                for user_did, block_date in result:
-                    block_list.append(
-                        {
-                            "did": user_did,
-                            "blocked_date": block_date.isoformat(),
-                        }
-                    )
+                for record in result:
+                    block = {
+                        "did": record["user_did"],
+                        "blocked_date": record["block_date"].isoformat(),
+                    }
+
+                    block_list.append(block)
 
                 return block_list
             else:
@@ -1747,34 +2668,39 @@ async def get_did_web_handle_history(identifier) -> list | None:
         raise InternalServerError
 
 
-async def get_starter_packs(ident, limit=100, offset=0) -> list:
+async def get_starter_packs(ident, limit=100, offset=0, after=None) -> list:
     starter_packs = []
     try:
         pool_name = get_connection_pool("read")
         async with connection_pools[pool_name].acquire() as connection:
-            result = await connection.fetch(
-                """SELECT name, description, did, created_date, url
-                                                FROM starter_packs
-                                                WHERE did = $1
-                                                ORDER BY created_date DESC
-                                                LIMIT $2
-                                                OFFSET $3""",
-                ident,
-                limit,
-                offset,
-            )
+            if after is None:
+                result = await connection.fetch(
+                    """SELECT name, description, did, created_date, url
+                                                    FROM starter_packs
+                                                    WHERE did = $1
+                                                    ORDER BY created_date DESC
+                                                    LIMIT $2
+                                                    OFFSET $3""",
+                    ident,
+                    limit,
+                    offset,
+                )
+            else:
+                result = await connection.fetch(starter_packs_keyset_query, ident, *after, limit)
 
             if result:
                 for record in result:
-                    starter_packs.append(
-                        {
-                            "name": record["name"],
-                            "description": record["description"],
-                            "did": record["did"],
-                            "created_date": record["created_date"].isoformat(),
-                            "url": record["url"],
-                        }
-                    )
+                    starter_pack = {
+                        "name": record["name"],
+                        "description": record["description"],
+                        "did": record["did"],
+                        "created_date": record["created_date"].isoformat(),
+                        "url": record["url"],
+                    }
+                    if after is not None:
+                        starter_pack["uri"] = record["uri"]
+
+                    starter_packs.append(starter_pack)
 
                 return starter_packs
             else:
@@ -1814,36 +2740,42 @@ async def get_starter_packs_count(ident) -> int:
         raise InternalServerError
 
 
-async def get_single_starter_packs(ident, limit=100, offset=0):
+async def get_single_starter_packs(ident, limit=100, offset=0, after=None):
     try:
         pool_name = get_connection_pool("read")
         async with connection_pools[pool_name].acquire() as connection:
-            result = await connection.fetch(
-                """SELECT s.name, s.description, s.did, s.created_date, s.url
-                                                FROM starter_packs AS s
-                                                JOIN mutelists_users AS mu ON s.list_uri = mu.list_uri
-                                                WHERE mu.subject_did = $1
-                                                ORDER BY s.created_date DESC
-                                                LIMIT $2
-                                                OFFSET $3""",
-                ident,
-                limit,
-                offset,
-            )
+            if after is None:
+                result = await connection.fetch(
+                    """SELECT s.name, s.description, s.did, s.created_date, s.url
+                                                    FROM starter_packs AS s
+                                                    JOIN mutelists_users AS mu ON s.list_uri = mu.list_uri
+                                                    WHERE mu.subject_did = $1
+                                                    ORDER BY s.created_date DESC
+                                                    LIMIT $2
+                                                    OFFSET $3""",
+                    ident,
+                    limit,
+                    offset,
+                )
+            else:
+                result = await connection.fetch(single_starter_packs_keyset_query, ident, *after, limit)
 
             starter_packs = []
 
             if result:
                 for record in result:
-                    starter_packs.append(
-                        {
-                            "name": record["name"],
-                            "description": record["description"],
-                            "did": record["did"],
-                            "created_date": record["created_date"].isoformat(),
-                            "url": record["url"],
-                        }
-                    )
+                    starter_pack = {
+                        "name": record["name"],
+                        "description": record["description"],
+                        "did": record["did"],
+                        "created_date": record["created_date"].isoformat(),
+                        "url": record["url"],
+                    }
+                    if after is not None:
+                        starter_pack["date_added"] = record["date_added"].isoformat()
+                        starter_pack["uri"] = record["listitem_uri"]
+
+                    starter_packs.append(starter_pack)
 
                 return starter_packs
             else:
@@ -2073,7 +3005,18 @@ env_db_names = [
 
 read_dbs = config_db_names + env_db_names
 
-read_db_iterator = itertools.cycle(read_dbs)
+analytics_db = get_analytics_db()
+
+read_balancer = ReplicaBalancer(
+    read_dbs,
+    connection_pools,
+    max_lag=config.getfloat("replicas", "max_lag_seconds", fallback=30.0),
+    eject_failures=config.getint("replicas", "eject_failures", fallback=3),
+    eject_seconds=config.getfloat("replicas", "eject_seconds", fallback=30.0),
+    alpha=config.getfloat("replicas", "latency_alpha", fallback=0.2),
+)
+
+pool_router = build_pool_router()
 
 
 async def local_db() -> bool:
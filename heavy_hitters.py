@@ -0,0 +1,131 @@
+# heavy_hitters.py
+
+import heapq
+from array import array
+
+from hyperloglog import hash64
+
+# ======================================================================================================================
+# ============================================ Windowed heavy hitters ==================================================
+# A Count-Min Sketch per time slot plus their running sum over the window, so a slot leaving the window is subtracted
+# in one pass. Memory is slots * depth * width counters and top_k candidates, however many keys are counted.
+# Estimates never undercount, they overcount by at most total / width with probability 1 - e^-depth.
+
+
+class CountMinSketch:
+    def __init__(self, width: int = 2048, depth: int = 4) -> None:
+        self.width = width
+        self.depth = depth
+        self.rows = [array("q", bytes(8 * width)) for _ in range(depth)]
+
+    def indexes(self, key_hash: int) -> list[int]:
+        # Double hashing, the row indexes are derived from the two 32 bit halves of one 64 bit hash
+        low = key_hash & 0xFFFFFFFF
+        high = key_hash >> 32
+
+        return [(low + row * high) % self.width for row in range(self.depth)]
+
+    def add(self, indexes: list[int], count: int = 1) -> None:
+        for row, index in zip(self.rows, indexes, strict=True):
+            row[index] += count
+
+    def estimate(self, indexes: list[int]) -> int:
+        return min(row[index] for row, index in zip(self.rows, indexes, strict=True))
+
+    def subtract(self, other: "CountMinSketch") -> None:
+        for row, other_row in zip(self.rows, other.rows, strict=True):
+            for index, count in enumerate(other_row):
+                if count:
+                    row[index] -= count
+
+
+class WindowedHeavyHitters:
+    def __init__(
+        self, window_slots: int = 15, slot_seconds: int = 60, width: int = 2048, depth: int = 4, top_k: int = 100
+    ) -> None:
+        self.window_slots = window_slots
+        self.slot_seconds = slot_seconds
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.slots = {}  # slot number: sketch of the keys counted in that slot
+        self.total = CountMinSketch(width, depth)  # sum of the slot sketches
+        self.candidates = {}  # key: estimate when last counted, at most top_k keys
+        self.heap = []  # (estimate, key) min-heap over the candidates, may hold outdated entries
+        self.current_slot = None
+
+    def slot_of(self, timestamp: float) -> int:
+        return int(timestamp // self.slot_seconds)
+
+    def add(self, key: str, timestamp: float, count: int = 1) -> bool:
+        # Returns False for a timestamp outside the window, a count dated in the future goes to the current slot
+        slot = self.slot_of(timestamp)
+
+        if self.current_slot is not None:
+            if slot <= self.current_slot - self.window_slots:
+                return False
+
+            slot = min(slot, self.current_slot)
+
+        sketch = self.slots.get(slot)
+        if sketch is None:
+            sketch = self.slots[slot] = CountMinSketch(self.width, self.depth)
+
+        indexes = self.total.indexes(hash64(key))
+        sketch.add(indexes, count)
+        self.total.add(indexes, count)
+        self.offer(key, self.total.estimate(indexes))
+
+        return True
+
+    def offer(self, key: str, estimate: int) -> None:
+        candidates = self.candidates
+        heap = self.heap
+
+        if key in candidates or len(candidates) < self.top_k:
+            candidates[key] = estimate
+            heapq.heappush(heap, (estimate, key))
+        else:
+            # Entries of replaced keys or older estimates are dropped when they reach the top of the heap
+            while candidates.get(heap[0][1]) != heap[0][0]:
+                heapq.heappop(heap)
+
+            if estimate <= heap[0][0]:
+                return
+
+            del candidates[heapq.heappop(heap)[1]]
+            candidates[key] = estimate
+            heapq.heappush(heap, (estimate, key))
+
+        if len(heap) > 4 * self.top_k:
+            self.rebuild_heap()
+
+    def rebuild_heap(self) -> None:
+        self.heap = [(estimate, key) for key, estimate in self.candidates.items()]
+        heapq.heapify(self.heap)
+
+    def advance(self, timestamp: float) -> int:
+        # Drops the slots that left the window and re-estimates the candidates, returns how many slots were dropped
+        self.current_slot = self.slot_of(timestamp)
+        expired = [slot for slot in self.slots if slot <= self.current_slot - self.window_slots]
+
+        for slot in expired:
+            self.total.subtract(self.slots.pop(slot))
+
+        if expired:
+            for key in list(self.candidates):
+                estimate = self.total.estimate(self.total.indexes(hash64(key)))
+
+                if estimate > 0:
+                    self.candidates[key] = estimate
+                else:
+                    del self.candidates[key]
+
+            self.rebuild_heap()
+
+        return len(expired)
+
+    def top(self, count: int, min_count: int = 1) -> list[tuple[str, int]]:
+        entries = [(key, estimate) for key, estimate in self.candidates.items() if estimate >= min_count]
+
+        return heapq.nlargest(count, entries, key=lambda item: (item[1], item[0]))
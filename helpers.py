@@ -58,6 +58,25 @@ async def get_time_since(time) -> str:
     return elapsed_time
 
 
+async def get_time_left(start_time, process_time) -> str:
+    if start_time is None or process_time is None:
+        return "not yet determined"
+
+    time_elapsed = datetime.now(timezone.utc) - start_time
+
+    if time_elapsed >= process_time:
+        return "just finished"
+
+    seconds_left = (process_time - time_elapsed).total_seconds()
+    minutes_left = seconds_left / 60
+    remaining_seconds = seconds_left % 60
+
+    if minutes_left > 1:
+        return f"{round(minutes_left)} mins {round(remaining_seconds)} seconds"
+
+    return f"{round(seconds_left)} seconds"
+
+
 async def get_ip_address():
     if not os.environ.get("CLEAR_SKY") or check_override is True:
         logger.info("IP connection: Using config.ini")
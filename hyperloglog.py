@@ -0,0 +1,111 @@
+# hyperloglog.py
+
+import math
+from hashlib import blake2b
+
+# ======================================================================================================================
+# ============================================== HyperLogLog sketches ==================================================
+# Values are hashed to 64 bits with a stable hash, so sketches built by different loads, partitions or processes merge.
+# The top precision bits pick a register, each register keeps the highest rank (leading zeros + 1) of the rest.
+
+register_weights = [2.0**-rank for rank in range(65)]
+
+
+def hash64(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = 14) -> None:
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        self.add_hash(hash64(value))
+
+    def add_hash(self, value_hash: int) -> None:
+        remaining_bits = 64 - self.precision
+        index = value_hash >> remaining_bits
+        rank = remaining_bits - (value_hash & ((1 << remaining_bits) - 1)).bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("HyperLogLog sketches with different precision cannot be merged.")
+
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(map(register_weights.__getitem__, self.registers))
+
+        # Linear counting is more accurate while many registers are still empty
+        empty_registers = self.registers.count(0)
+        if estimate <= 2.5 * size and empty_registers:
+            estimate = size * math.log(size / empty_registers)
+
+        return round(estimate)
+
+    def error_bound(self) -> int:
+        # Two standard errors (about 95% of estimates fall within)
+        return math.ceil(2 * 1.04 / math.sqrt(len(self.registers)) * self.count())
+
+
+class BlockCountSketches:
+    # Distinct blockers and blocked accounts overall and per block_date day ("YYYY-MM-DD"), any range of days is a merge
+    def __init__(self, precision: int = 12) -> None:
+        self.precision = precision
+        self.blocking = HyperLogLog(precision)
+        self.blocked = HyperLogLog(precision)
+        self.days = {}  # day: (blocking sketch, blocked sketch)
+
+    def day(self, day: str) -> tuple[HyperLogLog, HyperLogLog]:
+        daily = self.days.get(day)
+
+        if daily is None:
+            daily = self.days[day] = (HyperLogLog(self.precision), HyperLogLog(self.precision))
+
+        return daily
+
+    def add(self, user_did: str, blocked_did: str, day: str | None) -> None:
+        # Blocks without a date only count towards the overall sketches
+        if user_did is None or blocked_did is None:
+            return
+
+        self.blocking.add(user_did)
+        self.blocked.add(blocked_did)
+
+        if day is None:
+            return
+
+        blocking, blocked = self.day(day)
+        blocking.add(user_did)
+        blocked.add(blocked_did)
+
+    def add_rows(self, rows) -> None:
+        for row in rows:
+            self.add(row[0], row[1], row[2])
+
+    def merge(self, other: "BlockCountSketches") -> None:
+        self.blocking.merge(other.blocking)
+        self.blocked.merge(other.blocked)
+
+        for day, (blocking, blocked) in other.days.items():
+            daily = self.day(day)
+            daily[0].merge(blocking)
+            daily[1].merge(blocked)
+
+    def window(self, first_day: str, last_day: str) -> tuple[HyperLogLog, HyperLogLog]:
+        # Distinct blockers and blocked accounts over an inclusive range of days, merged from the daily sketches
+        blocking = HyperLogLog(self.precision)
+        blocked = HyperLogLog(self.precision)
+
+        for day, (day_blocking, day_blocked) in self.days.items():
+            if first_day <= day <= last_day:
+                blocking.merge(day_blocking)
+                blocked.merge(day_blocked)
+
+        return blocking, blocked
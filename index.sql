@@ -22,9 +22,9 @@ CREATE INDEX idx_users_status_false ON users (status) WHERE status = FALSE;
 
 CREATE INDEX idx_mutelists_uri ON mutelists (uri);
 
-CREATE INDEX idx_mutelists_users_list ON mutelists_users (list);
+CREATE INDEX idx_mutelists_users_list ON mutelists_users (list_uri);
 
-CREATE INDEX idx_mutelists_users_did ON mutelists_users (did);
+CREATE INDEX idx_mutelists_users_did ON mutelists_users (subject_did);
 
 CREATE INDEX users_pds_index ON users (pds);
 
@@ -0,0 +1,23 @@
+-- Pre-aggregated block counts behind the windowed top blocked/blockers lists, and how far blocklists_transaction has
+-- been counted into them (database_handler.update_block_counts).
+
+CREATE TABLE IF NOT EXISTS block_counts_hourly (
+    list_type text NOT NULL,
+    hour timestamp with time zone NOT NULL,
+    did text NOT NULL,
+    count bigint NOT NULL,
+    PRIMARY KEY (list_type, hour, did)
+);
+
+CREATE TABLE IF NOT EXISTS block_counts_daily (
+    list_type text NOT NULL,
+    day date NOT NULL,
+    did text NOT NULL,
+    count bigint NOT NULL,
+    PRIMARY KEY (list_type, day, did)
+);
+
+CREATE TABLE IF NOT EXISTS block_counts_progress (
+    name text PRIMARY KEY,
+    last_serial bigint NOT NULL
+);
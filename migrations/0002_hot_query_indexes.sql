@@ -0,0 +1,45 @@
+-- migrate: no-transaction
+-- Indexes matched to the hot queries of database_handler, each one serves the WHERE and ORDER BY of its query and
+-- includes the selected columns so pages are read from the index. Built CONCURRENTLY to keep ingest writing.
+
+-- get_blocklist: SELECT DISTINCT blocked_did, block_date WHERE user_did = $1 ORDER BY block_date DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS blocklists_user_did_block_date_idx
+    ON blocklists (user_did, block_date DESC, blocked_did DESC);
+
+-- get_single_user_blocks: SELECT DISTINCT user_did, block_date WHERE blocked_did = $1
+-- ORDER BY block_date DESC, user_did DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS blocklists_blocked_did_block_date_idx
+    ON blocklists (blocked_did, block_date DESC, user_did DESC);
+
+-- get_subscribe_blocks: WHERE s.did = $1 ORDER BY s.date_added DESC, s.uri DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS subscribe_blocklists_did_date_added_idx
+    ON subscribe_blocklists (did, date_added DESC, uri DESC) INCLUDE (list_uri);
+
+-- get_subscribe_blocks: the list items of one subscribed list in listitem_uri order
+CREATE INDEX CONCURRENTLY IF NOT EXISTS mutelists_users_list_uri_listitem_uri_idx
+    ON mutelists_users (list_uri, listitem_uri);
+
+-- get_mutelists, get_single_starter_packs: WHERE mu.subject_did = $1 ORDER BY mu.date_added DESC, mu.listitem_uri DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS mutelists_users_subject_did_date_added_idx
+    ON mutelists_users (subject_did, date_added DESC, listitem_uri DESC) INCLUDE (list_uri);
+
+-- get_starter_packs: WHERE did = $1 ORDER BY created_date DESC, uri DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS starter_packs_did_created_date_idx
+    ON starter_packs (did, created_date DESC, uri DESC);
+
+-- get_single_starter_packs: JOIN starter_packs AS s ON s.list_uri = mu.list_uri
+CREATE INDEX CONCURRENTLY IF NOT EXISTS starter_packs_list_uri_idx
+    ON starter_packs (list_uri);
+
+-- get_moderation_list: name ILIKE '%...%' OR description ILIKE '%...%'
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS mutelists_name_trgm_idx
+    ON mutelists USING gin (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS mutelists_description_trgm_idx
+    ON mutelists USING gin (description gin_trgm_ops);
+
+-- get_user_did, identifier_exists_in_db: WHERE handle = $1, named as in index.sql
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_handle
+    ON users (handle);
@@ -0,0 +1,3 @@
+-- serial_ids the block counts progress marker moved past while they were missing from blocklists_transaction, from
+-- transactions that commit out of serial_id order (or rolled back). They are counted once their rows show up.
+ALTER TABLE block_counts_progress ADD COLUMN IF NOT EXISTS gaps bigint[] NOT NULL DEFAULT '{}';
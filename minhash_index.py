@@ -0,0 +1,175 @@
+# minhash_index.py
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+# ======================================================================================================================
+# ============================================= MinHash / LSH index ====================================================
+# Signatures use one permutation hashing: every blocked id is hashed once and falls into one of bands * rows bins,
+# keeping the minimum per bin. Empty bins borrow from the next non-empty bin (rotation densification).
+# Each band of the signature is hashed to a 64-bit key; per band, keys are kept sorted next to their node ids.
+# Banding finds blocklists with a high Jaccard similarity, but matches are scored by containment (the share of the
+# target's blocks a blocker also has), and a large blocklist containing the target has a low Jaccard similarity.
+# The band candidates only seed the top list, an exact containment pass then finds every blocker that can enter it.
+
+EMPTY_BIN = 0xFFFFFFFF
+
+
+def mix32(value: int) -> int:
+    value = (((value >> 16) ^ value) * 0x45D9F3B) & 0xFFFFFFFF
+    value = (((value >> 16) ^ value) * 0x45D9F3B) & 0xFFFFFFFF
+
+    return (value >> 16) ^ value
+
+
+class MinHashIndex:
+    def __init__(self, node_count: int, bands: int, rows: int, seed: int = 1) -> None:
+        self.bands = bands
+        self.rows = rows
+        self.num_bins = bands * rows
+        self.bin_width = (EMPTY_BIN // self.num_bins) + 1
+        self.seed = seed
+        self.node_hashes = array("I", map(self.node_hash, range(node_count)))
+        self.band_keys = [array("q") for _ in range(bands)]
+        self.band_nodes = [array("i") for _ in range(bands)]
+
+    @property
+    def indexed_count(self) -> int:
+        return len(self.band_nodes[0]) if self.band_nodes else 0
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.node_hashes, *self.band_keys, *self.band_nodes]
+
+        return sum(len(item) * item.itemsize for item in arrays)
+
+    @classmethod
+    def build(cls, graph, bands: int, rows: int, min_blocks: int = 1) -> "MinHashIndex":
+        index = cls(graph.node_count, bands, rows)
+
+        for node in range(graph.node_count):
+            if graph.blocking_count(node) < min_blocks:
+                continue
+
+            signature = index.signature(graph.blocking(node))
+
+            for band, key in enumerate(index.keys(signature)):
+                index.band_keys[band].append(key)
+                index.band_nodes[band].append(node)
+
+        for band in range(bands):
+            keys = index.band_keys[band]
+            nodes = index.band_nodes[band]
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            index.band_keys[band] = array("q", map(keys.__getitem__, order))
+            index.band_nodes[band] = array("i", map(nodes.__getitem__, order))
+
+        return index
+
+    def node_hash(self, node: int) -> int:
+        return mix32((node + self.seed * 0x9E3779B9) & 0xFFFFFFFF)
+
+    def signature(self, nodes) -> list[int]:
+        num_bins = self.num_bins
+        node_hashes = self.node_hashes
+        hashed_count = len(node_hashes)
+        bins = [EMPTY_BIN] * num_bins
+
+        for node in nodes:
+            # Nodes added to the graph after the index was built are hashed on the fly
+            value = node_hashes[node] if node < hashed_count else self.node_hash(node)
+            position = value % num_bins
+            value //= num_bins
+            if value < bins[position]:
+                bins[position] = value
+
+        if EMPTY_BIN not in bins:
+            return bins
+
+        signature = bins[:]
+        for position in range(num_bins):
+            if bins[position] != EMPTY_BIN:
+                continue
+
+            for distance in range(1, num_bins):
+                borrowed = bins[(position + distance) % num_bins]
+
+                if borrowed != EMPTY_BIN:
+                    signature[position] = borrowed + distance * self.bin_width
+                    break
+
+        return signature
+
+    def keys(self, signature: list[int]) -> list[int]:
+        rows = self.rows
+
+        return [hash(tuple(signature[band * rows : (band + 1) * rows])) for band in range(self.bands)]
+
+    def candidates(self, nodes) -> Counter:
+        # Candidate nodes and the number of bands they collide in
+        band_hits = Counter()
+
+        for band, key in enumerate(self.keys(self.signature(nodes))):
+            keys = self.band_keys[band]
+            band_hits.update(self.band_nodes[band][bisect_left(keys, key) : bisect_right(keys, key)])
+
+        return band_hits
+
+    def similar_blockers(
+        self,
+        graph,
+        did: str,
+        limit: int = 20,
+        threshold: float = 1,
+        max_candidates: int = 500,
+        exact_budget: int = 1000000,
+    ) -> list[tuple[str, float]] | None:
+        # Same result shape as BlockGraph.similar_blockers, but only candidates are scored (exactly)
+        node = graph.lookup(did)
+
+        if node is None:
+            return None
+
+        blocked = graph.blocking(node)
+
+        if not blocked:
+            return None
+
+        blocked_set = set(blocked)
+        common_counts = Counter()
+
+        for candidate, _band_hits in self.candidates(blocked).most_common(max_candidates + 1):
+            if candidate != node:
+                common_counts[candidate] = len(blocked_set.intersection(graph.blocking(candidate)))
+
+        self.containment_candidates(graph, node, blocked, common_counts, limit, threshold, exact_budget)
+
+        return graph.rank(common_counts, len(blocked), limit, threshold)
+
+    @staticmethod
+    def containment_candidates(graph, node, blocked, common_counts, limit, threshold, exact_budget) -> None:
+        # Prefix filtering: a blocker sharing at least `needed` of the target's blocks blocks at least one of any
+        # len(blocked) - needed + 1 of them, so walking the blocked_by rows of that many of the least blocked accounts
+        # scores every blocker that can beat the current top limit or pass the threshold. exact_budget caps the
+        # blocked_by entries walked, past it recall falls back to the band candidates.
+        total = len(blocked)
+        best = sorted(common_counts.values(), reverse=True)
+        needed = max(best[limit - 1] if len(best) >= limit else 1, int(total * threshold / 100) + 1)
+
+        if needed > total:
+            return
+
+        blocked_set = set(blocked)
+        walked = 0
+
+        for target in sorted(blocked, key=graph.blocked_by_count)[: total - needed + 1]:
+            blockers = graph.blocked_by(target)
+            walked += len(blockers)
+
+            if walked > exact_budget:
+                break
+
+            for other in blockers:
+                if other != node and other not in common_counts:
+                    common_counts[other] = len(blocked_set.intersection(graph.blocking(other)))
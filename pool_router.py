@@ -0,0 +1,32 @@
+# pool_router.py
+
+import itertools
+from types import MappingProxyType
+
+# ======================================================================================================================
+# ============================================= Connection pool routing ================================================
+# Which pools serve each role is resolved once from the database configuration, a lookup is then a dict access and,
+# for roles served by several pools, the next pool of a round-robin cycle. Rebuild the router to change the routing.
+
+pool_roles = ("read", "write", "cursor", "analytics")
+
+
+class PoolRouter:
+    __slots__ = ("next_pool", "pools")
+
+    def __init__(self, pools: dict, pickers: dict | None = None) -> None:
+        # pools, role: pool names, a role without pools routes to None
+        # pickers, role: callable returning the pool name, replaces the round-robin cycle of that role
+        self.pools = MappingProxyType({role: tuple(pools.get(role, ())) for role in pool_roles})
+
+        next_pool = {
+            role: itertools.cycle(names).__next__ if names else lambda: None for role, names in self.pools.items()
+        }
+        next_pool.update(pickers or {})
+        self.next_pool = MappingProxyType(next_pool)
+
+    def route(self, role: str = "read") -> str | None:
+        return self.next_pool[role]()
+
+    def describe(self) -> dict:
+        return {role: list(names) for role, names in self.pools.items()}
@@ -0,0 +1,160 @@
+# replica_balancer.py
+
+import itertools
+import random
+import time
+
+# ======================================================================================================================
+# ============================================== Read replica balancing ================================================
+# Each read is sent to the better of two randomly picked healthy replicas (power of two choices), scored on the query
+# latency and acquire wait averages (EWMA) scaled up by how many of the pool's connections are in use. A replica is
+# out of rotation while its replication lag is over max_lag, or, after eject_failures failures in a row, until a
+# health probe succeeds again. With no healthy replica reads still go round-robin over the pools that exist, and with
+# no pool at all the caller gets None.
+
+
+class ReplicaState:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.latency = None  # EWMA of query time, seconds
+        self.acquire_wait = None  # EWMA of the probe's wait for a connection, seconds
+        self.lag = None  # replication lag in seconds, 0 on a primary
+        self.failures = 0  # failures in a row
+        self.ejected_until = None  # time.monotonic() before which the replica is not probed, None if in rotation
+        self.queries = 0
+        self.errors = 0
+        self.last_probe = None  # time.monotonic() of the last probe
+
+
+class ReplicaBalancer:
+    def __init__(
+        self,
+        names,
+        pools: dict,
+        max_lag: float = 30.0,
+        eject_failures: int = 3,
+        eject_seconds: float = 30.0,
+        alpha: float = 0.2,
+    ) -> None:
+        self.names = tuple(names)
+        self.pools = pools  # pool name: connection pool, only pools that were created are routed to
+        self.max_lag = max_lag
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.alpha = alpha
+        self.replicas = {name: ReplicaState(name) for name in self.names}
+        self.fallback = itertools.cycle(self.names) if self.names else None
+
+    def average(self, previous: float | None, value: float) -> float:
+        return value if previous is None else previous + self.alpha * (value - previous)
+
+    def healthy(self, replica: ReplicaState) -> bool:
+        return (
+            replica.name in self.pools
+            and replica.ejected_until is None
+            and (replica.lag is None or replica.lag <= self.max_lag)
+        )
+
+    def in_use(self, name: str) -> float:
+        # Share of the pool's connections currently checked out
+        pool = self.pools.get(name)
+
+        if pool is None:
+            return 0.0
+
+        max_size = pool.get_max_size()
+
+        return (pool.get_size() - pool.get_idle_size()) / max_size if max_size else 0.0
+
+    def score(self, replica: ReplicaState) -> float:
+        # Lower is better, a replica without measurements yet scores 0 so it gets traffic to measure
+        cost = (replica.latency or 0.0) + (replica.acquire_wait or 0.0)
+
+        return cost / (1.05 - min(self.in_use(replica.name), 1.0))
+
+    def choose(self) -> str | None:
+        healthy = [replica for replica in self.replicas.values() if self.healthy(replica)]
+
+        if len(healthy) == 1:
+            return healthy[0].name
+
+        if healthy:
+            return min(random.sample(healthy, 2), key=self.score).name
+
+        if self.fallback is None:
+            return None
+
+        for _ in self.names:
+            name = next(self.fallback)
+
+            if name in self.pools:
+                return name
+
+        return None
+
+    def record_query(self, name: str, elapsed: float) -> None:
+        replica = self.replicas[name]
+        replica.latency = self.average(replica.latency, elapsed)
+        replica.queries += 1
+
+        if replica.ejected_until is None:
+            replica.failures = 0
+
+    def record_failure(self, name: str) -> bool:
+        # Returns True when this failure ejects the replica
+        replica = self.replicas[name]
+        replica.failures += 1
+        replica.errors += 1
+
+        if replica.ejected_until is None and replica.failures < self.eject_failures:
+            return False
+
+        ejected = replica.ejected_until is None
+        replica.ejected_until = time.monotonic() + self.eject_seconds
+
+        return ejected
+
+    def probe_due(self, name: str) -> bool:
+        ejected_until = self.replicas[name].ejected_until
+
+        return ejected_until is None or time.monotonic() >= ejected_until
+
+    def record_probe(self, name: str, acquire_wait: float, lag: float) -> bool:
+        # Returns True when this probe brings an ejected replica back
+        replica = self.replicas[name]
+        replica.acquire_wait = self.average(replica.acquire_wait, acquire_wait)
+        replica.lag = lag
+        replica.last_probe = time.monotonic()
+        replica.failures = 0
+
+        readmitted = replica.ejected_until is not None
+        replica.ejected_until = None
+
+        return readmitted
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        result = {}
+
+        for name, replica in self.replicas.items():
+            if name not in self.pools:
+                state = "no pool"
+            elif replica.ejected_until is not None:
+                state = "ejected"
+            elif replica.lag is not None and replica.lag > self.max_lag:
+                state = "lagging"
+            else:
+                state = "healthy"
+
+            result[name] = {
+                "state": state,
+                "latency ms": None if replica.latency is None else round(replica.latency * 1000, 2),
+                "acquire wait ms": None if replica.acquire_wait is None else round(replica.acquire_wait * 1000, 2),
+                "replication lag s": None if replica.lag is None else round(replica.lag, 3),
+                "connections in use": round(self.in_use(name), 3),
+                "queries": replica.queries,
+                "errors": replica.errors,
+                "last probe s ago": None if replica.last_probe is None else round(now - replica.last_probe, 1),
+            }
+
+        return result
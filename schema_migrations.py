@@ -0,0 +1,274 @@
+# schema_migrations.py
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+import asyncpg
+
+import database_handler
+from config_helper import config, logger
+from errors import DatabaseConnectionError, InternalServerError
+
+# ======================================================================================================================
+# ================================================ Schema migrations ===================================================
+# migrations/<version>_<name>.sql files are applied in version order on the write db and recorded in schema_migrations
+# with a checksum of their content. A file starting with "-- migrate: no-transaction" runs statement by statement
+# outside a transaction, which CREATE INDEX CONCURRENTLY needs; the others run in one transaction. An advisory lock
+# keeps two instances from migrating at the same time.
+
+migrations_path = config.get("migrations", "path", fallback="") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "migrations"
+)
+apply_on_startup = config.getboolean("migrations", "apply_on_startup", fallback=True)
+migrations_table = "schema_migrations"
+migrations_lock_id = 7248106  # pg_advisory_lock key held while migrating
+no_transaction_marker = "-- migrate: no-transaction"
+
+applied_migrations = {}  # version: checksum
+hot_query_plans = {}  # hot query name: "ok", the expected indexes its plan is missing or the error of the check
+
+migrations_applied = asyncio.Event()
+migrations_status = asyncio.Event()
+
+# Hot queries of database_handler, the arguments their plans are checked with and the (relation, index) reads each
+# plan must contain, an index of None accepts any index scan with an Index Cond on the relation. Sequential scans are
+# disabled for the check so a plan missing one of them means its index does not exist or cannot serve the query.
+sample_did = "did:plc:0"
+sample_after = (datetime.max.replace(tzinfo=timezone.utc), "")
+hot_queries = {
+    "blocklist": (
+        database_handler.blocklist_query,
+        (sample_did, 100, 0),
+        (("blocklists", "blocklists_user_did_block_date_idx"),),
+    ),
+    "single blocklist": (
+        database_handler.single_user_blocks_keyset_query,
+        (sample_did, *sample_after, 100),
+        (("blocklists", "blocklists_blocked_did_block_date_idx"),),
+    ),
+    "blocklist search": (
+        database_handler.blocklist_search_blocking_query,
+        (sample_did, sample_did),
+        (("blocklists", None),),
+    ),
+    "block row": (database_handler.block_row_query, ("",), (("blocklists", "blocklists_pkey"),)),
+    "subscribe blocks": (
+        database_handler.subscribe_blocks_keyset_query,
+        (sample_did, *sample_after, "", 100),
+        (("subscribe_blocklists", "subscribe_blocklists_did_date_added_idx"), ("mutelists_users", None)),
+    ),
+    "mute lists": (
+        database_handler.mutelists_keyset_query,
+        (sample_did, *sample_after, 100),
+        (("mutelists_users", "mutelists_users_subject_did_date_added_idx"),),
+    ),
+    "moderation lists": (
+        database_handler.moderation_list_keyset_query,
+        ("%sample%", *sample_after, 100),
+        (("mutelists", "mutelists_name_trgm_idx"), ("mutelists", "mutelists_description_trgm_idx")),
+    ),
+    "starter packs": (
+        database_handler.starter_packs_keyset_query,
+        (sample_did, *sample_after, 100),
+        (("starter_packs", "starter_packs_did_created_date_idx"),),
+    ),
+    "single starter packs": (
+        database_handler.single_starter_packs_keyset_query,
+        (sample_did, *sample_after, 100),
+        (("mutelists_users", "mutelists_users_subject_did_date_added_idx"), ("starter_packs", None)),
+    ),
+    "handle": (database_handler.user_did_query, ("sample.bsky.social",), (("users", "idx_users_handle"),)),
+}
+
+
+def load_migrations() -> list[tuple[str, str, str, str]]:
+    # (version, name, sql, checksum) of every migration file, in version order
+    migrations = []
+
+    for file_name in sorted(os.listdir(migrations_path)):
+        match = re.fullmatch(r"(\d+)_(\w+)\.sql", file_name)
+        if not match:
+            continue
+
+        with open(os.path.join(migrations_path, file_name), encoding="utf-8") as migration_file:
+            sql = migration_file.read()
+
+        migrations.append((match[1], match[2], sql, hashlib.sha256(sql.encode()).hexdigest()))
+
+    return migrations
+
+
+def split_statements(sql) -> list[str]:
+    # Migrations hold plain DDL, no function bodies or quoted semicolons
+    lines = [line for line in sql.splitlines() if not line.lstrip().startswith("--")]
+
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+
+async def drop_invalid_index(connection, statement) -> None:
+    # A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind that IF NOT EXISTS would skip
+    match = re.match(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)", statement, re.IGNORECASE)
+    if not match:
+        return
+
+    invalid = await connection.fetchval(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)", match[1]
+    )
+
+    if invalid:
+        logger.warning(f"Dropping invalid index {match[1]} left by an interrupted build.")
+        await connection.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match[1]}")
+
+
+async def apply_migration(connection, version, name, sql, checksum) -> None:
+    record = f"INSERT INTO {migrations_table} (version, name, checksum) VALUES ($1, $2, $3)"
+
+    if sql.lstrip().startswith(no_transaction_marker):
+        for statement in split_statements(sql):
+            await drop_invalid_index(connection, statement)
+            await connection.execute(statement)
+
+        await connection.execute(record, version, name, checksum)
+    else:
+        async with connection.transaction():
+            await connection.execute(sql)
+            await connection.execute(record, version, name, checksum)
+
+
+async def apply_migrations() -> int:
+    # Returns how many migrations were applied
+    global applied_migrations
+
+    migrations_status.set()
+
+    try:
+        migrations = await asyncio.to_thread(load_migrations)
+
+        pool_name = database_handler.get_connection_pool("write")
+        async with database_handler.connection_pools[pool_name].acquire() as connection:
+            await connection.execute(
+                f"""CREATE TABLE IF NOT EXISTS {migrations_table} (
+                    version text PRIMARY KEY,
+                    name text NOT NULL,
+                    checksum text NOT NULL,
+                    applied_at timestamp with time zone NOT NULL DEFAULT now()
+                )"""
+            )
+
+            await connection.execute("SELECT pg_advisory_lock($1)", migrations_lock_id)
+            try:
+                rows = await connection.fetch(f"SELECT version, checksum FROM {migrations_table}")
+                applied_migrations = {row["version"]: row["checksum"] for row in rows}
+
+                count = 0
+                for version, name, sql, checksum in migrations:
+                    if version in applied_migrations:
+                        if applied_migrations[version] != checksum:
+                            logger.error(f"Migration {version}_{name} changed after it was applied, not re-applied.")
+
+                        continue
+
+                    logger.info(f"Applying migration {version}_{name}.")
+                    start_time = datetime.now(timezone.utc)
+
+                    await apply_migration(connection, version, name, sql, checksum)
+
+                    applied_migrations[version] = checksum
+                    count += 1
+                    logger.info(f"Migration {version}_{name} applied in {datetime.now(timezone.utc) - start_time}.")
+            finally:
+                await connection.execute("SELECT pg_advisory_unlock($1)", migrations_lock_id)
+
+        migrations_applied.set()
+
+        return count
+    except asyncpg.PostgresError as e:
+        logger.error(f"Postgres error: {e}")
+        raise DatabaseConnectionError
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except AttributeError:
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        raise InternalServerError
+    finally:
+        migrations_status.clear()
+
+
+def plan_nodes(plan):
+    yield plan
+
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def missing_index_reads(plan, expected) -> list[str]:
+    # The expected (relation, index) reads the plan lacks, a bitmap index scan names its index but not its relation
+    nodes = list(plan_nodes(plan))
+    missing = []
+
+    for relation, index in expected:
+        if index is not None:
+            found = any(node.get("Index Name") == index for node in nodes)
+        else:
+            found = any(node.get("Relation Name") == relation and "Index Cond" in node for node in nodes)
+
+        if not found:
+            missing.append(index or f"index on {relation}")
+
+    return missing
+
+
+async def verify_hot_query_plans() -> bool:
+    # Returns True when every hot query plan reads through its expected indexes, on a read db where the queries run
+    try:
+        pool_name = database_handler.get_connection_pool("read")
+        async with database_handler.connection_pools[pool_name].acquire() as connection:
+            for name, (query, args, expected) in hot_queries.items():
+                try:
+                    async with connection.transaction(readonly=True):
+                        await connection.execute("SET LOCAL enable_seqscan = off")
+                        plan = json.loads(await connection.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args))
+
+                    missing = missing_index_reads(plan[0]["Plan"], expected)
+                    hot_query_plans[name] = f"missing: {', '.join(missing)}" if missing else "ok"
+                except asyncpg.PostgresError as e:
+                    hot_query_plans[name] = f"error: {e}"
+    except asyncpg.InterfaceError as e:
+        logger.error(f"interface error: {e}")
+        raise DatabaseConnectionError
+    except (AttributeError, KeyError, OSError):
+        logger.error("db connection issue.")
+        raise DatabaseConnectionError
+
+    missing = [name for name, result in hot_query_plans.items() if result != "ok"]
+
+    if missing:
+        logger.warning(f"Hot queries not served by their indexes: {', '.join(missing)}.")
+    else:
+        logger.info("Every hot query plan uses its indexes.")
+
+    return not missing
+
+
+async def main() -> None:
+    # Applies the pending migrations by hand: python schema_migrations.py
+    await database_handler.create_connection_pools(database_handler.database_config)
+
+    count = await apply_migrations()
+    logger.info(f"{count} migrations applied.")
+
+    if not await verify_hot_query_plans():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
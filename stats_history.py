@@ -0,0 +1,195 @@
+# stats_history.py
+
+import asyncio
+import json
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+from config_helper import config, logger
+
+# ======================================================================================================================
+# ============================================ Statistics history store ================================================
+# Every statistics refresh is appended as one JSON line {"time": epoch seconds, "series": name, "values": {...}}.
+# The file is read once at startup into per-series time/value columns, later points are appended to both.
+# Once a day the history is compacted: points older than history_full_days are downsampled to the last point of each
+# day, points older than history_retention_days are dropped, and the file is rewritten with what is left.
+
+history_path = config.get("statistics", "history_path", fallback="")
+history_max_points = config.getint("statistics", "history_max_points", fallback=500)
+history_full_days = config.getint("statistics", "history_full_days", fallback=30)
+history_retention_days = config.getint("statistics", "history_retention_days", fallback=730)  # 0 keeps every day
+compact_interval = 86400  # Seconds between compactions, also the bucket old points are downsampled to
+
+series_names = ("block_stats", "total_users", "top_blocks", "top_24_blocks")
+
+history_times = {name: array("d") for name in series_names}
+history_values = {name: [] for name in series_names}
+history_lock = asyncio.Lock()
+history_compacted_time = None  # Epoch seconds of the last compaction
+
+
+def add_point(series, point_time, values) -> None:
+    times = history_times[series]
+
+    # Points are kept in time order, an out of order point (clock change) is inserted in place
+    position = len(times) if not times or point_time >= times[-1] else bisect_right(times, point_time)
+    times.insert(position, point_time)
+    history_values[series].insert(position, values)
+
+
+def load_history() -> int:
+    if not history_path or not os.path.exists(history_path):
+        return 0
+
+    with open(history_path, encoding="utf-8") as history_file:
+        for line in history_file:
+            try:
+                point = json.loads(line)
+                series = point["series"]
+                point_time = float(point["time"])
+                values = point["values"]
+            except (ValueError, KeyError, TypeError):
+                # A partially written last line from an interrupted append
+                continue
+
+            if series in history_times:
+                add_point(series, point_time, values)
+
+    if compact_history(datetime.now(timezone.utc).timestamp()):
+        try:
+            write_history()
+        except OSError as e:
+            logger.error(f"Error writing compacted statistics history: {e}")
+
+    return sum(map(len, history_times.values()))
+
+
+def compact_history(now) -> int:
+    # Returns how many points were removed
+    global history_compacted_time
+
+    full_start = now - history_full_days * 86400
+    retention_start = now - history_retention_days * 86400 if history_retention_days > 0 else None
+    removed = 0
+
+    for series in series_names:
+        times = history_times[series]
+        values = history_values[series]
+        kept_times = array("d")
+        kept_values = []
+
+        for index, point_time in enumerate(times):
+            if retention_start is not None and point_time < retention_start:
+                continue
+
+            # An old point on the same day as the previous one replaces it, the last point stands for the day
+            if (
+                point_time < full_start
+                and kept_times
+                and int(kept_times[-1] // compact_interval) == int(point_time // compact_interval)
+            ):
+                kept_times[-1] = point_time
+                kept_values[-1] = values[index]
+
+                continue
+
+            kept_times.append(point_time)
+            kept_values.append(values[index])
+
+        removed += len(times) - len(kept_times)
+        history_times[series] = kept_times
+        history_values[series] = kept_values
+
+    history_compacted_time = now
+
+    return removed
+
+
+def write_history() -> None:
+    os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+    temp_path = f"{history_path}.tmp"
+
+    with open(temp_path, "w", encoding="utf-8") as history_file:
+        for series in series_names:
+            for point_time, values in zip(history_times[series], history_values[series], strict=True):
+                point = {"time": point_time, "series": series, "values": values}
+                history_file.write(json.dumps(point, separators=(",", ":")) + "\n")
+
+        history_file.flush()
+        os.fsync(history_file.fileno())
+
+    os.replace(temp_path, history_path)
+
+
+def write_line(line) -> None:
+    os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+
+    with open(history_path, "a", encoding="utf-8") as history_file:
+        history_file.write(line + "\n")
+
+
+async def record_point(series, values, point_time=None) -> None:
+    if point_time is None:
+        point_time = datetime.now(timezone.utc).timestamp()
+
+    # Decimal averages from the database are stored as floats
+    values = json.loads(json.dumps(values, default=float))
+
+    async with history_lock:
+        add_point(series, point_time, values)
+
+        compacted = False
+        if history_compacted_time is None or point_time - history_compacted_time >= compact_interval:
+            compacted = compact_history(point_time) > 0
+
+        if not history_path:
+            return
+
+        line = json.dumps({"time": point_time, "series": series, "values": values}, separators=(",", ":"))
+
+        try:
+            if compacted:
+                # The rewritten file includes this point
+                await asyncio.to_thread(write_history)
+            else:
+                await asyncio.to_thread(write_line, line)
+        except OSError as e:
+            logger.error(f"Error writing {series} statistics history: {e}")
+
+
+def get_range(series, start=None, end=None, max_points=None) -> list[dict]:
+    # Points between start and end (epoch seconds, inclusive), downsampled to at most max_points evenly sized time
+    # buckets, each represented by its last point
+    times = history_times[series]
+    values = history_values[series]
+
+    first = 0 if start is None else bisect_left(times, start)
+    last = len(times) if end is None else bisect_right(times, end)
+
+    if max_points is None:
+        max_points = history_max_points
+
+    if last - first > max_points > 0:
+        range_start = times[first] if start is None else start
+        range_end = times[last - 1] if end is None else end
+        bucket_size = (range_end - range_start) / max_points or 1
+
+        indexes = []
+        last_bucket = None
+        for index in range(first, last):
+            bucket = min(int((times[index] - range_start) / bucket_size), max_points - 1)
+
+            if bucket == last_bucket:
+                indexes[-1] = index
+            else:
+                indexes.append(index)
+                last_bucket = bucket
+    else:
+        indexes = range(first, last)
+
+    return [
+        {"time": datetime.fromtimestamp(times[index], timezone.utc).isoformat(), "values": values[index]}
+        for index in indexes
+    ]
@@ -0,0 +1,19 @@
+# conftest.py
+
+from pathlib import Path
+
+# Importing config_helper (through utils, database_handler, ...) rewrites config.ini, put it back after the run
+config_path = Path(__file__).resolve().parent.parent / "config.ini"
+config_backup = None
+
+
+def pytest_configure(config) -> None:
+    global config_backup
+
+    if config_path.exists():
+        config_backup = config_path.read_bytes()
+
+
+def pytest_unconfigure(config) -> None:
+    if config_backup is not None:
+        config_path.write_bytes(config_backup)
@@ -0,0 +1,64 @@
+# test_binary_copy.py
+
+from struct import pack
+
+import pytest
+
+from binary_copy import SIGNATURE, BinaryCopyParser
+
+rows = [
+    ["did:plc:alice", "did:plc:bob", "2024-01-02"],
+    ["did:plc:carol", None, "2024-01-03"],
+    ["did:plc:émile", "did:plc:dave", ""],
+]
+
+
+def copy_stream(rows, extension=b"") -> bytes:
+    data = bytearray(SIGNATURE + pack(">ii", 0, len(extension)) + extension)
+
+    for row in rows:
+        data += pack(">h", len(row))
+
+        for value in row:
+            if value is None:
+                data += pack(">i", -1)
+            else:
+                encoded = value.encode()
+                data += pack(">i", len(encoded)) + encoded
+
+    return bytes(data + pack(">h", -1))
+
+
+def test_decodes_whole_stream():
+    parser = BinaryCopyParser()
+
+    assert parser.feed(copy_stream(rows)) == rows
+    assert parser.finished
+    assert parser.row_count == len(rows)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64])
+def test_decodes_rows_split_across_chunks(chunk_size):
+    data = copy_stream(rows, extension=b"\x00\x01\x02")
+    parser = BinaryCopyParser()
+    decoded = []
+
+    for start in range(0, len(data), chunk_size):
+        decoded.extend(parser.feed(data[start : start + chunk_size]))
+
+    assert decoded == rows
+    assert parser.finished
+    assert parser.bytes_read == len(data)
+    assert not parser.buffer
+
+
+def test_ignores_data_after_trailer():
+    parser = BinaryCopyParser()
+
+    assert parser.feed(copy_stream(rows[:1]) + copy_stream(rows[1:])[len(SIGNATURE) + 8 :]) == rows[:1]
+    assert parser.feed(b"\x00\x01") == []
+
+
+def test_rejects_invalid_signature():
+    with pytest.raises(ValueError):
+        BinaryCopyParser().feed(b"PGCOPY\n\xff\r\n\x01" + bytes(8))
@@ -0,0 +1,170 @@
+# test_block_graph.py
+
+import random
+
+import pytest
+
+from block_graph import BlockGraphBuilder, BlockGraphOverlay, load_snapshot, write_snapshot
+
+edges = [
+    ("did:plc:carol", "did:plc:alice"),
+    ("did:plc:alice", "did:plc:bob"),
+    ("did:plc:alice", "did:plc:dave"),
+    ("did:plc:bob", "did:plc:dave"),
+    ("did:plc:alice", "did:plc:bob"),  # the same block stored under another uri
+    ("did:plc:carol", "did:plc:dave"),
+]
+
+
+def build(rows):
+    builder = BlockGraphBuilder()
+    builder.add_rows(rows)
+
+    return builder.build()
+
+
+def edge_set(graph):
+    return {(graph.did(node), graph.did(target)) for node in range(graph.node_count) for target in graph.blocking(node)}
+
+
+def test_build_sorts_dids_and_drops_duplicate_edges():
+    graph = build(edges)
+
+    assert [graph.did(node) for node in range(graph.node_count)] == sorted({did for edge in edges for did in edge})
+    assert graph.edge_count == 5
+    assert edge_set(graph) == set(edges)
+
+
+def test_csr_rows_and_lookup():
+    graph = build(edges)
+    alice = graph.lookup("did:plc:alice")
+    dave = graph.lookup("did:plc:dave")
+
+    assert graph.lookup("did:plc:nobody") is None
+    assert [graph.did(node) for node in graph.blocking(alice)] == ["did:plc:bob", "did:plc:dave"]
+    assert [graph.did(node) for node in graph.blocked_by(dave)] == ["did:plc:alice", "did:plc:bob", "did:plc:carol"]
+    assert graph.blocking_count(alice) == 2
+    assert graph.blocked_by_count(dave) == 3
+    assert graph.blockers(min_blocks=2) == ["did:plc:alice", "did:plc:carol"]
+
+
+def test_rows_without_dids_are_skipped():
+    graph = build([("did:plc:alice", None), (None, "did:plc:bob"), ("did:plc:alice", "did:plc:bob", "ignored")])
+
+    assert graph.node_count == 2
+    assert graph.edge_count == 1
+
+
+def test_similar_blockers():
+    graph = build([*edges, ("did:plc:erin", "did:plc:bob"), ("did:plc:erin", "did:plc:dave")])
+
+    similar = graph.similar_blockers("did:plc:alice")
+
+    assert similar[0] == ("did:plc:erin", 100.0)
+    assert dict(similar) == {"did:plc:erin": 100.0, "did:plc:bob": 50.0, "did:plc:carol": 50.0}
+    assert graph.similar_blockers("did:plc:dave") is None
+    assert graph.similar_blockers("did:plc:nobody") is None
+
+
+def test_overlay_add_and_remove():
+    overlay = BlockGraphOverlay(build(edges))
+    alice = overlay.lookup("did:plc:alice")
+
+    assert overlay.apply("did:plc:alice", "did:plc:carol", delete=False, serial=7)
+    assert not overlay.apply("did:plc:alice", "did:plc:carol", delete=False, serial=8)
+    assert overlay.apply("did:plc:alice", "did:plc:bob", delete=True, serial=9)
+    assert not overlay.apply("did:plc:alice", "did:plc:bob", delete=True, serial=10)
+    assert not overlay.apply("did:plc:nobody", "did:plc:bob", delete=True)
+
+    assert [overlay.did(node) for node in overlay.blocking(alice)] == ["did:plc:carol", "did:plc:dave"]
+    assert overlay.blocking_count(alice) == 2
+    assert overlay.blocked_by_count(overlay.lookup("did:plc:bob")) == 0
+    assert overlay.edge_count == 5
+    assert overlay.change_count == 2
+    assert overlay.did_serials == {"did:plc:alice": 9, "did:plc:carol": 7, "did:plc:bob": 9}
+
+
+def test_overlay_restores_base_row():
+    graph = build(edges)
+    overlay = BlockGraphOverlay(graph)
+    alice = overlay.lookup("did:plc:alice")
+
+    overlay.apply("did:plc:alice", "did:plc:bob", delete=True)
+    overlay.blocking(alice)
+    overlay.apply("did:plc:alice", "did:plc:bob", delete=False)
+
+    assert overlay.blocking_changes == {}
+    assert overlay.blocked_by_changes == {}
+    assert list(overlay.blocking(alice)) == list(graph.blocking(alice))
+
+
+def test_overlay_new_dids():
+    overlay = BlockGraphOverlay(build(edges))
+
+    assert overlay.apply("did:plc:zed", "did:plc:alice", delete=False)
+
+    zed = overlay.lookup("did:plc:zed")
+    assert zed == overlay.node_count - 1
+    assert overlay.did(zed) == "did:plc:zed"
+    assert [overlay.did(node) for node in overlay.blocking(zed)] == ["did:plc:alice"]
+    assert overlay.blocked_by_count(overlay.lookup("did:plc:alice")) == 2
+
+
+def test_overlay_matches_reference_and_compacts():
+    random_source = random.Random(5)
+    dids = [f"did:plc:{index:02d}" for index in range(12)]
+    base = {(random_source.choice(dids), random_source.choice(dids)) for _ in range(40)}
+    overlay = BlockGraphOverlay(build(sorted(base)))
+    reference = set(base)
+
+    for _ in range(300):
+        edge = (random_source.choice(dids), random_source.choice(dids))
+        delete = random_source.random() < 0.5
+
+        changed = overlay.apply(*edge, delete=delete)
+
+        assert changed == ((edge in reference) if delete else (edge not in reference))
+        if delete:
+            reference.discard(edge)
+        else:
+            reference.add(edge)
+
+        if random_source.random() < 0.3:
+            # Reads in between fill the merged row caches that later changes must invalidate
+            overlay.blocking(overlay.lookup(edge[0]))
+            overlay.blocked_by(overlay.lookup(edge[1]))
+
+    assert edge_set(overlay) == reference
+    assert overlay.edge_count == len(reference)
+
+    for did in dids:
+        node = overlay.lookup(did)
+        if node is not None:
+            assert [overlay.did(user) for user in overlay.blocked_by(node)] == sorted(
+                user for user, blocked in reference if blocked == did
+            )
+
+    compacted = overlay.compact()
+    assert edge_set(compacted) == reference
+    assert compacted.edge_count == len(reference)
+
+
+def test_snapshot_round_trip(tmp_path):
+    graph = build(edges)
+    path = str(tmp_path / "blocks.graph")
+
+    write_snapshot(graph, path, 42)
+    loaded, last_serial = load_snapshot(path)
+
+    assert last_serial == 42
+    assert loaded.node_count == graph.node_count
+    assert edge_set(loaded) == edge_set(graph)
+    assert loaded.lookup("did:plc:dave") == graph.lookup("did:plc:dave")
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / "blocks.graph"
+    path.write_bytes(b"not a snapshot" * 8)
+
+    with pytest.raises(ValueError):
+        load_snapshot(str(path))
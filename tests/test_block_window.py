@@ -0,0 +1,66 @@
+# test_block_window.py
+
+from datetime import datetime, timedelta, timezone
+
+from block_window import HourlyBlockWindow, epoch_hour, hour_start
+
+now = datetime(2024, 6, 1, 12, 30, tzinfo=timezone.utc)
+
+
+def test_hour_helpers():
+    assert hour_start(epoch_hour(now)) == datetime(2024, 6, 1, 12, tzinfo=timezone.utc)
+    assert HourlyBlockWindow(hours=24).start(now) == datetime(2024, 5, 31, 13, tzinfo=timezone.utc)
+
+
+def test_counts_and_top():
+    window = HourlyBlockWindow(hours=24)
+    window.advance(now)
+
+    window.apply(now, "did:plc:alice", "did:plc:bob", delete=False)
+    window.apply(now - timedelta(hours=2), "did:plc:carol", "did:plc:bob", delete=False)
+    window.apply(now, "did:plc:alice", "did:plc:dave", delete=False)
+    window.apply(None, "did:plc:alice", "did:plc:erin", delete=False)
+
+    assert window.top("blocked", 2) == [("did:plc:bob", 2), ("did:plc:dave", 1)]
+    assert window.top("blocker", 1) == [("did:plc:alice", 2)]
+    assert window.block_count == 3
+
+
+def test_delete():
+    window = HourlyBlockWindow(hours=24)
+    window.advance(now)
+    window.apply(now, "did:plc:alice", "did:plc:bob", delete=False)
+
+    window.apply(now, "did:plc:alice", "did:plc:bob", delete=True)
+    window.apply(now, "did:plc:alice", "did:plc:bob", delete=True)  # never counted twice, ignored
+
+    assert window.blocked == {}
+    assert window.blockers == {}
+    assert window.block_count == 0
+
+
+def test_blocks_before_the_window_are_ignored():
+    window = HourlyBlockWindow(hours=24)
+    window.advance(now)
+
+    window.apply(now - timedelta(days=2), "did:plc:alice", "did:plc:bob", delete=False)
+    window.add_counts(epoch_hour(now - timedelta(days=2)), [("did:plc:bob", 5)], [("did:plc:alice", 5)])
+
+    assert window.block_count == 0
+
+
+def test_advance_expires_hours():
+    window = HourlyBlockWindow(hours=3)
+    window.advance(now)
+    window.add_counts(epoch_hour(now) - 2, [("did:plc:bob", 4)], [("did:plc:alice", 4)])
+    window.add_counts(epoch_hour(now), [("did:plc:bob", 1), ("did:plc:dave", 2)], [("did:plc:alice", 3)])
+
+    assert window.top("blocked", 1) == [("did:plc:bob", 5)]
+
+    assert window.advance(now + timedelta(hours=1)) == 1
+    assert window.top("blocked", 2) == [("did:plc:dave", 2), ("did:plc:bob", 1)]
+    assert window.top("blocker", 1) == [("did:plc:alice", 3)]
+
+    assert window.advance(now + timedelta(hours=3)) == 1
+    assert window.block_count == 0
+    assert window.blockers == {}
@@ -0,0 +1,57 @@
+# test_heavy_hitters.py
+
+from heavy_hitters import CountMinSketch, WindowedHeavyHitters
+from hyperloglog import hash64
+
+
+def test_count_min_never_undercounts():
+    sketch = CountMinSketch(width=64, depth=4)
+    counts = {f"did:plc:{index}": index % 7 + 1 for index in range(500)}
+
+    for key, count in counts.items():
+        sketch.add(sketch.indexes(hash64(key)), count)
+
+    for key, count in counts.items():
+        assert sketch.estimate(sketch.indexes(hash64(key))) >= count
+
+
+def test_top_keys():
+    hitters = WindowedHeavyHitters(window_slots=5, slot_seconds=60, top_k=5)
+    hitters.advance(0)
+
+    for index in range(200):
+        hitters.add(f"did:plc:{index}", 10)
+    for _ in range(50):
+        hitters.add("did:plc:hot", 10)
+    for _ in range(30):
+        hitters.add("did:plc:warm", 20)
+
+    top = hitters.top(2)
+
+    assert [key for key, _count in top] == ["did:plc:hot", "did:plc:warm"]
+    assert top[0][1] >= 50
+    assert len(hitters.candidates) <= 5
+    assert hitters.top(5, min_count=40) == top[:1]
+
+
+def test_expired_slots_leave_the_window():
+    hitters = WindowedHeavyHitters(window_slots=3, slot_seconds=60, top_k=5)
+    hitters.advance(0)
+
+    for _ in range(10):
+        hitters.add("did:plc:old", 0)
+
+    assert hitters.advance(60) == 0
+    hitters.add("did:plc:new", 60)
+
+    assert hitters.advance(180) == 1
+    assert hitters.top(5) == [("did:plc:new", 1)]
+    assert not hitters.add("did:plc:old", 0)
+
+
+def test_future_counts_go_to_the_current_slot():
+    hitters = WindowedHeavyHitters(window_slots=3, slot_seconds=60)
+    hitters.advance(0)
+
+    assert hitters.add("did:plc:early", 600)
+    assert list(hitters.slots) == [0]
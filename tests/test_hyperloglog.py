@@ -0,0 +1,97 @@
+# test_hyperloglog.py
+
+import pytest
+
+from hyperloglog import BlockCountSketches, HyperLogLog
+
+
+def test_count_within_error_bound():
+    sketch = HyperLogLog(precision=12)
+
+    for index in range(20000):
+        sketch.add(f"did:plc:{index}")
+        sketch.add(f"did:plc:{index}")
+
+    assert abs(sketch.count() - 20000) <= sketch.error_bound()
+
+
+def test_small_counts_are_exact_enough():
+    sketch = HyperLogLog(precision=12)
+
+    for index in range(50):
+        sketch.add(f"did:plc:{index}")
+
+    assert sketch.count() == 50
+    assert HyperLogLog().count() == 0
+
+
+def test_merge_is_union():
+    first = HyperLogLog(precision=10)
+    second = HyperLogLog(precision=10)
+    union = HyperLogLog(precision=10)
+
+    for index in range(3000):
+        first.add(str(index))
+        union.add(str(index))
+    for index in range(2000, 5000):
+        second.add(str(index))
+        union.add(str(index))
+
+    first.merge(second)
+
+    assert first.registers == union.registers
+
+
+def test_merge_needs_same_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+
+
+def test_block_count_window():
+    sketches = BlockCountSketches(precision=12)
+    sketches.add_rows(
+        [
+            ("did:plc:alice", "did:plc:bob", "2024-01-01"),
+            ("did:plc:alice", "did:plc:carol", "2024-01-02"),
+            ("did:plc:dave", "did:plc:bob", "2024-01-03"),
+            ("did:plc:erin", None, "2024-01-02"),
+            ("did:plc:erin", "did:plc:bob", None),
+        ]
+    )
+
+    blocking, blocked = sketches.window("2024-01-01", "2024-01-02")
+    assert (blocking.count(), blocked.count()) == (1, 2)
+
+    blocking, blocked = sketches.window("2024-01-01", "2024-01-31")
+    assert (blocking.count(), blocked.count()) == (2, 2)
+
+    blocking, blocked = sketches.window("2024-02-01", "2024-02-28")
+    assert (blocking.count(), blocked.count()) == (0, 0)
+
+
+def test_block_count_sketches_merge():
+    first = BlockCountSketches(precision=10)
+    second = BlockCountSketches(precision=10)
+    first.add("did:plc:alice", "did:plc:bob", "2024-01-01")
+    second.add("did:plc:carol", "did:plc:bob", "2024-01-01")
+    second.add("did:plc:dave", "did:plc:erin", "2024-01-02")
+
+    first.merge(second)
+
+    assert sorted(first.days) == ["2024-01-01", "2024-01-02"]
+    blocking, blocked = first.window("2024-01-01", "2024-01-02")
+    assert (blocking.count(), blocked.count()) == (3, 2)
+
+
+def test_overall_sketches_count_every_block():
+    sketches = BlockCountSketches(precision=12)
+    sketches.add("did:plc:alice", "did:plc:bob", "2024-01-01")
+    sketches.add("did:plc:carol", "did:plc:bob", None)
+    sketches.add("did:plc:dave", None, "2024-01-01")
+
+    other = BlockCountSketches(precision=12)
+    other.add("did:plc:erin", "did:plc:frank", "2024-03-01")
+    sketches.merge(other)
+
+    assert (sketches.blocking.count(), sketches.blocked.count()) == (3, 2)
+    assert sketches.blocking.error_bound() >= 0
@@ -0,0 +1,121 @@
+# test_minhash_index.py
+
+import random
+
+from block_graph import BlockGraphBuilder
+from minhash_index import EMPTY_BIN, MinHashIndex
+
+
+def build_graph():
+    random_source = random.Random(3)
+    targets = [f"did:plc:target{index}" for index in range(300)]
+    shared = random_source.sample(targets, 40)
+    builder = BlockGraphBuilder()
+
+    # Two users with the same blocklist, one sharing most of it and noise users blocking at random
+    for user in ("did:plc:alice", "did:plc:alice2"):
+        for target in shared:
+            builder.add(user, target)
+    for target in shared[:36]:
+        builder.add("did:plc:close", target)
+    for index in range(50):
+        for target in random_source.sample(targets, 20):
+            builder.add(f"did:plc:noise{index}", target)
+    builder.add("did:plc:single", targets[0])
+
+    return builder.build()
+
+
+def test_signature_is_deterministic():
+    graph = build_graph()
+    index = MinHashIndex(graph.node_count, bands=16, rows=4)
+    alice = graph.blocking(graph.lookup("did:plc:alice"))
+
+    assert len(index.signature(alice)) == 64
+    assert index.signature(alice) == index.signature(list(reversed(alice)))
+    assert index.signature(alice) == index.signature(graph.blocking(graph.lookup("did:plc:alice2")))
+
+
+def test_build_respects_min_blocks():
+    graph = build_graph()
+
+    assert MinHashIndex.build(graph, bands=16, rows=4).indexed_count == len(graph.blockers())
+    assert MinHashIndex.build(graph, bands=16, rows=4, min_blocks=2).indexed_count == len(graph.blockers(2))
+
+
+def test_similar_blockers_finds_near_duplicates():
+    graph = build_graph()
+    index = MinHashIndex.build(graph, bands=16, rows=4)
+
+    similar = dict(index.similar_blockers(graph, "did:plc:alice", limit=5))
+    exact = dict(graph.similar_blockers("did:plc:alice", limit=5))
+
+    assert similar["did:plc:alice2"] == 100.0
+    assert similar["did:plc:close"] == exact["did:plc:close"] == 90.0
+    assert "did:plc:alice" not in similar
+    assert index.similar_blockers(graph, "did:plc:nobody") is None
+
+
+def test_nodes_added_after_build_are_hashed():
+    graph = build_graph()
+    index = MinHashIndex(graph.node_count, bands=4, rows=2)
+    new_node = graph.node_count + 5
+
+    # Hashed on the fly the same as by an index built after the node existed
+    assert index.signature([new_node]) == MinHashIndex(new_node + 1, bands=4, rows=2).signature([new_node])
+    assert EMPTY_BIN not in index.signature([new_node])
+
+
+def test_finds_supersets_banding_misses():
+    random_source = random.Random(11)
+    targets = [f"did:plc:target{index}" for index in range(3000)]
+    builder = BlockGraphBuilder()
+
+    for target in targets[:30]:
+        builder.add("did:plc:alice", target)
+    # Blocks everything alice blocks and 2000 more, a containment match with a Jaccard similarity of about 0.015
+    for target in targets[:2030]:
+        builder.add("did:plc:superset", target)
+    for index in range(40):
+        for target in random_source.sample(targets, 50):
+            builder.add(f"did:plc:noise{index}", target)
+
+    graph = builder.build()
+    index = MinHashIndex.build(graph, bands=16, rows=4)
+    superset = graph.lookup("did:plc:superset")
+
+    assert superset not in index.candidates(graph.blocking(graph.lookup("did:plc:alice")))
+    assert index.similar_blockers(graph, "did:plc:alice", limit=5)[0] == ("did:plc:superset", 100.0)
+
+
+def test_recall_against_exact():
+    random_source = random.Random(7)
+    targets = [f"did:plc:target{index}" for index in range(500)]
+    popular = targets[:50]
+    builder = BlockGraphBuilder()
+
+    # Blocklists of very different sizes drawn with a bias towards popular accounts
+    for user in range(150):
+        size = random_source.choice((5, 20, 60, 250))
+        for target in random_source.sample(popular, min(size // 2, 50)) + random_source.sample(targets, size // 2):
+            builder.add(f"did:plc:user{user}", target)
+
+    graph = builder.build()
+    index = MinHashIndex.build(graph, bands=16, rows=4)
+
+    for user in range(0, 150, 7):
+        did = f"did:plc:user{user}"
+        exact = graph.similar_blockers(did, limit=10)
+        approximate = index.similar_blockers(graph, did, limit=10)
+
+        # Ties at the last place may resolve to other users, the scores must match
+        assert [score for _did, score in approximate] == [score for _did, score in exact]
+        assert set(approximate) <= {(other, score) for other, score in graph.similar_blockers(did, limit=1000)}
+
+
+def test_exact_budget_limits_the_containment_pass():
+    graph = build_graph()
+    index = MinHashIndex.build(graph, bands=16, rows=4)
+
+    assert index.similar_blockers(graph, "did:plc:alice", limit=5, max_candidates=0, exact_budget=0) == []
+    assert index.similar_blockers(graph, "did:plc:alice", limit=5, max_candidates=0)[0][1] == 100.0
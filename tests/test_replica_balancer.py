@@ -0,0 +1,102 @@
+# test_replica_balancer.py
+
+from replica_balancer import ReplicaBalancer
+
+
+class FakePool:
+    def __init__(self, size: int = 10, idle: int = 10, max_size: int = 10) -> None:
+        self.size = size
+        self.idle = idle
+        self.max_size = max_size
+
+    def get_size(self) -> int:
+        return self.size
+
+    def get_idle_size(self) -> int:
+        return self.idle
+
+    def get_max_size(self) -> int:
+        return self.max_size
+
+
+def balancer(names=("read_1", "read_2"), pools=None, **kwargs) -> ReplicaBalancer:
+    if pools is None:
+        pools = {name: FakePool() for name in names}
+
+    return ReplicaBalancer(names, pools, **kwargs)
+
+
+def test_prefers_lower_score():
+    replicas = balancer()
+    replicas.record_query("read_1", 0.5)
+    replicas.record_query("read_2", 0.01)
+
+    assert {replicas.choose() for _ in range(20)} == {"read_2"}
+
+
+def test_busy_pool_scores_worse():
+    replicas = balancer(pools={"read_1": FakePool(idle=0), "read_2": FakePool(idle=10)})
+    replicas.record_query("read_1", 0.1)
+    replicas.record_query("read_2", 0.1)
+
+    assert replicas.choose() == "read_2"
+
+
+def test_ejects_after_failures_and_readmits_on_probe():
+    replicas = balancer(eject_failures=3)
+
+    assert not replicas.record_failure("read_1")
+    assert not replicas.record_failure("read_1")
+    assert replicas.record_failure("read_1")
+    assert not replicas.record_failure("read_1")  # already out of rotation
+
+    assert replicas.status()["read_1"]["state"] == "ejected"
+    assert {replicas.choose() for _ in range(20)} == {"read_2"}
+    assert not replicas.probe_due("read_1")
+
+    assert replicas.record_probe("read_1", acquire_wait=0.001, lag=0.0)
+    assert replicas.status()["read_1"]["state"] == "healthy"
+    assert replicas.replicas["read_1"].failures == 0
+
+
+def test_successful_query_resets_failures():
+    replicas = balancer(eject_failures=2)
+
+    replicas.record_failure("read_1")
+    replicas.record_query("read_1", 0.01)
+
+    assert not replicas.record_failure("read_1")
+
+
+def test_lagging_replica_is_skipped():
+    replicas = balancer(max_lag=5)
+    replicas.record_probe("read_1", acquire_wait=0.0, lag=60)
+
+    assert replicas.status()["read_1"]["state"] == "lagging"
+    assert {replicas.choose() for _ in range(20)} == {"read_2"}
+
+
+def test_falls_back_round_robin_without_healthy_replicas():
+    replicas = balancer(eject_failures=1)
+    replicas.record_failure("read_1")
+    replicas.record_failure("read_2")
+
+    assert [replicas.choose() for _ in range(4)] == ["read_1", "read_2", "read_1", "read_2"]
+
+
+def test_fallback_skips_missing_pools():
+    replicas = balancer(pools={"read_2": FakePool()})
+
+    assert replicas.status()["read_1"]["state"] == "no pool"
+    assert {replicas.choose() for _ in range(4)} == {"read_2"}
+
+    replicas.record_failure("read_2")
+    replicas.record_failure("read_2")
+    replicas.record_failure("read_2")
+
+    assert {replicas.choose() for _ in range(4)} == {"read_2"}
+
+
+def test_no_pool_returns_none():
+    assert balancer(pools={}).choose() is None
+    assert balancer(names=(), pools={}).choose() is None
@@ -0,0 +1,88 @@
+# test_schema_migrations.py
+
+import re
+
+import schema_migrations
+
+
+def test_migrations_load_in_version_order():
+    migrations = schema_migrations.load_migrations()
+    versions = [version for version, _name, _sql, _checksum in migrations]
+
+    assert versions == sorted(versions)
+    assert len(set(versions)) == len(versions)
+    assert all(len(checksum) == 64 for _version, _name, _sql, checksum in migrations)
+
+
+def test_split_statements():
+    sql = """-- migrate: no-transaction
+-- a comment; with a semicolon
+CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx
+    ON a (x);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS b_idx ON b (y);
+"""
+
+    assert schema_migrations.split_statements(sql) == [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx\n    ON a (x)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS b_idx ON b (y)",
+    ]
+
+
+def test_hot_queries_match_their_arguments_and_migrations():
+    created = set()
+    for _version, _name, sql, _checksum in schema_migrations.load_migrations():
+        created.update(re.findall(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)", sql))
+
+    for query, args, expected in schema_migrations.hot_queries.values():
+        assert max(map(int, re.findall(r"\$(\d+)", query))) == len(args)
+
+        for relation, index in expected:
+            assert relation in query
+            assert index is None or index in created or index in ("blocklists_pkey", "idx_users_handle")
+
+
+def test_missing_index_reads():
+    plan = {
+        "Node Type": "Limit",
+        "Plans": [
+            {
+                "Node Type": "Nested Loop",
+                "Plans": [
+                    {
+                        "Node Type": "Index Scan",
+                        "Relation Name": "subscribe_blocklists",
+                        "Index Name": "subscribe_blocklists_did_date_added_idx",
+                        "Index Cond": "(did = $1)",
+                    },
+                    {
+                        "Node Type": "Index Only Scan",
+                        "Relation Name": "mutelists_users",
+                        "Index Name": "idx_mutelists_users_list",
+                        "Index Cond": "(list_uri = s.list_uri)",
+                    },
+                ],
+            },
+        ],
+    }
+
+    missing = schema_migrations.missing_index_reads
+
+    assert missing(plan, [("subscribe_blocklists", None), ("mutelists_users", None)]) == []
+    assert missing(plan, [("subscribe_blocklists", "subscribe_blocklists_did_date_added_idx")]) == []
+    assert missing(plan, [("blocklists", "blocklists_user_did_block_date_idx")]) == [
+        "blocklists_user_did_block_date_idx"
+    ]
+    assert missing(plan, [("blocklists", None)]) == ["index on blocklists"]
+
+
+def test_other_index_scans_do_not_count():
+    plan = {
+        "Node Type": "Index Scan",
+        "Relation Name": "blocklists",
+        "Index Name": "idx_block_date",
+        "Filter": "(user_did = $1)",
+    }
+
+    assert schema_migrations.missing_index_reads(plan, [("blocklists", "blocklists_user_did_block_date_idx")])
+    assert schema_migrations.missing_index_reads(plan, [("blocklists", None)])
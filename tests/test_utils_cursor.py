@@ -0,0 +1,68 @@
+# test_utils_cursor.py
+
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import utils
+
+date = "2024-05-01T12:30:00+00:00"
+
+
+def token(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def test_round_trip():
+    cursor = utils.encode_page_cursor(date, "at://did:plc:alice/app.bsky.graph.block/1")
+
+    assert "=" not in cursor
+    assert utils.decode_page_cursor(cursor) == (
+        datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+        "at://did:plc:alice/app.bsky.graph.block/1",
+    )
+
+
+def test_round_trip_with_two_keys():
+    cursor = utils.encode_page_cursor(date, "at://subscription", "at://listitem")
+
+    assert utils.decode_page_cursor(cursor, 2) == (
+        datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+        "at://subscription",
+        "at://listitem",
+    )
+
+
+def test_empty_cursor_is_first_page():
+    assert utils.decode_page_cursor("") == (utils.page_cursor_start, "")
+    assert utils.decode_page_cursor("", 2) == (utils.page_cursor_start, "", "")
+
+
+@pytest.mark.parametrize(
+    ("cursor", "key_count"),
+    [
+        ("not a cursor", 1),
+        (token(["yesterday", "uri"]), 1),
+        (token(["2024-05-01T12:30:00", "uri"]), 1),  # no time zone
+        (token([date, 5]), 1),
+        (token([date]), 1),
+        (token([date, "uri"]), 2),
+        (token([date, "uri", "uri"]), 1),
+        (token({"date": date}), 1),
+    ],
+)
+def test_invalid_cursor(cursor, key_count):
+    assert utils.decode_page_cursor(cursor, key_count) is None
+
+
+def test_next_page_cursor():
+    items = [{"date_added": date, "uri": f"at://{index}", "listitem_uri": f"at://item/{index}"} for index in range(3)]
+
+    assert utils.next_page_cursor(items, "date_added", 4) is None
+    assert utils.next_page_cursor([], "date_added", 0) is None
+    assert utils.decode_page_cursor(utils.next_page_cursor(items, "date_added", 3))[1] == "at://2"
+
+    cursor = utils.next_page_cursor(items, "date_added", 3, keys=("uri", "listitem_uri"))
+    assert utils.decode_page_cursor(cursor, 2)[1:] == ("at://2", "at://item/2")
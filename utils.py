@@ -1,15 +1,21 @@
 # utils.py
 
 import asyncio
+import base64
+import json
 import re
+from collections import Counter
 from datetime import datetime, timezone
 
 import httpx
-from cachetools import Cache
+from cachetools import Cache, TTLCache
 
 import database_handler
 import on_wire
-from config_helper import logger
+import stats_history
+from block_distribution import BlockCountDistribution
+from config_helper import config, logger
+from errors import DatabaseConnectionError, InternalServerError
 
 # ======================================================================================================================
 # ================================================ cache/global variables ==============================================
@@ -42,6 +48,9 @@ block_stats_total_users_cache = Cache(maxsize=50)  # Every 4 hours
 total_users_cache = Cache(maxsize=50)  # Every 4 hour
 total_active_users_cache = Cache(maxsize=50)  # Every 4 hour
 total_deleted_users_cache = Cache(maxsize=50)  # Every 4 hour
+block_count_distribution_cache = Cache(maxsize=50)  # Every 12 hours
+windowed_top_blocks_cache = TTLCache(maxsize=50, ttl=600)  # Every 5 mins for the configured windows
+distinct_block_counts_cache = TTLCache(maxsize=200, ttl=300)  # (start, end): merged sketch estimates
 
 block_stats_status = asyncio.Event()
 total_users_status = asyncio.Event()
@@ -51,6 +60,39 @@ block_stats_last_update = None
 block_stats_start_time = None
 block_stats_as_of_time = None
 
+# Published block statistics, all derived from the block count distributions
+block_stats_fields = (
+    "total_blocks",
+    "unique_blocked",
+    "unique_blocking",
+    "blocking_1",
+    "blocking_2_and_100",
+    "blocking_101_and_1000",
+    "blocking_greater_than_1000",
+    "average_blocking",
+    "blocked_1",
+    "blocked_2_and_100",
+    "blocked_101_and_1000",
+    "blocked_greater_than_1000",
+    "average_blocked",
+    "total_users",
+)
+block_directions = ("blocking", "blocked")
+block_stats_baseline = None  # Total blocks, total users and both block count distributions of the last full recount
+
+# exact or approximate, only approximate mode keeps the HyperLogLog sketches behind the distinct block counts
+statistics_mode = config.get("statistics", "mode", fallback="exact").lower()
+hll_precision = config.getint("statistics", "hll_precision", fallback=12)
+distinct_max_days = config.getint("statistics", "distinct_max_days", fallback=366)  # Longest range of daily sketches
+block_stats_deltas = Counter()  # Changes since the last full recount, from blocklists_transaction
+block_stats_serial = 0  # Last blocklists_transaction serial_id included in the last full recount
+block_stats_pending = None  # Changes applied while a recount runs, as apply_block_stats_change arguments
+block_distribution_deltas = {direction: BlockCountDistribution() for direction in block_directions}
+
+trending_windows = [window.strip() for window in config.get("trending", "windows", fallback="1h,24h,7d,30d").split(",")]
+block_window_units = {"h": "hour", "d": "day"}
+page_cursor_start = datetime.max.replace(tzinfo=timezone.utc)  # Keyset position before the newest row
+
 total_users_process_time = None
 total_users_last_update = None
 total_users_start_time = None
@@ -268,74 +310,257 @@ async def resolve_top24_block_lists():
     )
 
 
+def parse_block_window(window):
+    # "<n>h" or "<n>d", limited to the hours or days the pre-aggregated counts are kept for
+    if not window or window[-1] not in block_window_units or not window[:-1].isdigit():
+        return None
+
+    unit = block_window_units[window[-1]]
+    length = int(window[:-1])
+    retention = (
+        database_handler.block_counts_hourly_retention
+        if unit == "hour"
+        else database_handler.block_counts_daily_retention
+    )
+
+    if not 0 < length <= retention:
+        return None
+
+    return unit, length
+
+
+async def resolve_block_list_entries(entries, test):
+    resolved = []
+    avatar_ids = {}
+
+    for did, count in entries:
+        resolution = await resolve_did(did, count, test)
+
+        if resolution is None:
+            continue
+
+        resolved.append(resolution)
+        avatar_ids[did] = did if test else await on_wire.get_avatar_id(did)
+
+        if len(resolved) == 20:
+            break
+
+    return resolved, avatar_ids
+
+
+async def update_windowed_top_blocks(window):
+    unit, length = parse_block_window(window)
+
+    blocked, blockers = await database_handler.get_windowed_top_blocks(unit, length)
+
+    test = await database_handler.local_db()
+    resolved_blocked, blocked_avatar_ids = await resolve_block_list_entries(blocked, test)
+    resolved_blockers, blocker_avatar_ids = await resolve_block_list_entries(blockers, test)
+
+    data_lists = {
+        "blocked": resolved_blocked,
+        "blockers": resolved_blockers,
+        "blocked_aid": blocked_avatar_ids,
+        "blockers_aid": blocker_avatar_ids,
+    }
+
+    result = (data_lists, datetime.now(timezone.utc).isoformat())
+    windowed_top_blocks_cache[window] = result
+
+    return result
+
+
+async def get_windowed_top_blocks(window):
+    # Configured windows are kept current by the schedule, any other window is computed on first request
+    result = windowed_top_blocks_cache.get(window)
+
+    if result is None:
+        result = await update_windowed_top_blocks(window)
+
+    return result
+
+
+async def update_trending_windows():
+    for window in trending_windows:
+        if parse_block_window(window) is None:
+            logger.warning(f"Trending window {window} not valid, skipped.")
+
+            continue
+
+        await update_windowed_top_blocks(window)
+
+
+def apply_block_stats_change(serial, blocking_count, blocked_count, delete):
+    # Counts are the user's blocking count and the blocked account's blocked-by count after one block was added/removed
+    if block_stats_pending is not None:
+        # Which side of the recount the change is on is only known once the recount has its serial_id
+        block_stats_pending.append((serial, blocking_count, blocked_count, delete))
+
+        return
+
+    if serial <= block_stats_serial:
+        # Already counted by the last recount
+        return
+
+    step = -1 if delete else 1
+
+    block_stats_deltas["total_blocks"] += step
+
+    for direction, count in (("blocking", blocking_count), ("blocked", blocked_count)):
+        block_distribution_deltas[direction].move(count - step, count)
+
+
+def current_block_distributions():
+    distributions = {}
+
+    for direction in block_directions:
+        distribution = block_stats_baseline[direction].copy()
+        distribution.update(block_distribution_deltas[direction].counts)
+        distributions[direction] = distribution
+
+    return distributions
+
+
+def block_stats_values(total_blocks, distributions, total_users):
+    # Every published count is derived from the two distributions, new bucket schemes need no new queries
+    values = {"total_blocks": total_blocks, "total_users": total_users}
+
+    for direction, distribution in distributions.items():
+        values[f"unique_{direction}"] = distribution.users
+        values[f"average_{direction}"] = distribution.average()
+
+        for bucket, users in distribution.bucket_users().items():
+            values[f"{direction}_{bucket}"] = users
+
+    return values
+
+
+def current_block_stats(distributions=None):
+    if distributions is None:
+        distributions = current_block_distributions()
+
+    return block_stats_values(
+        block_stats_baseline["total_blocks"] + block_stats_deltas["total_blocks"],
+        distributions,
+        block_stats_baseline["total_users"],
+    )
+
+
+def set_block_statistics_cache(values, distributions):
+    number_of_total_blocks_cache["total_blocks"] = values["total_blocks"]
+    number_of_unique_users_blocked_cache["unique_blocked"] = values["unique_blocked"]
+    number_of_unique_users_blocking_cache["unique_blocker"] = values["unique_blocking"]
+    number_block_1_cache["block1"] = values["blocking_1"]
+    number_blocking_2_and_100_cache["block2to100"] = values["blocking_2_and_100"]
+    number_blocking_101_and_1000_cache["block101to1000"] = values["blocking_101_and_1000"]
+    number_blocking_greater_than_1000_cache["blockmore1000"] = values["blocking_greater_than_1000"]
+    average_number_of_blocking_cache["averageblocks"] = values["average_blocking"]
+    number_blocked_1_cache["blocked1"] = values["blocked_1"]
+    number_blocked_2_and_100_cache["blocked2to100"] = values["blocked_2_and_100"]
+    number_blocked_101_and_1000_cache["blocked101to1000"] = values["blocked_101_and_1000"]
+    number_blocked_greater_than_1000_cache["blockedmore1000"] = values["blocked_greater_than_1000"]
+    average_number_of_blocked_cache["averageblocked"] = values["average_blocked"]
+    block_stats_total_users_cache["total_users"] = values["total_users"]
+
+    for direction, distribution in distributions.items():
+        block_count_distribution_cache[direction] = {
+            "percentiles": distribution.percentiles(),
+            "histogram": distribution.log_histogram(),
+        }
+
+
+def publish_block_statistics():
+    global block_stats_as_of_time
+
+    # Recount still running or never completed, nothing to add the changes to yet
+    if block_stats_baseline is None or block_stats_status.is_set():
+        return
+
+    distributions = current_block_distributions()
+    set_block_statistics_cache(current_block_stats(distributions), distributions)
+
+    block_stats_as_of_time = datetime.now(timezone.utc).isoformat()
+
+
 async def update_block_statistics():
     global block_stats_process_time
     global block_stats_last_update
     global block_stats_status
     global block_stats_start_time
     global block_stats_as_of_time
+    global block_stats_baseline
+    global block_stats_serial
+    global block_stats_pending
 
     logger.info("Updating block statsitics.")
 
     block_stats_start_time = datetime.now(timezone.utc)
 
     block_stats_status.set()
-
-    (
-        number_of_total_blocks,
-        number_of_unique_users_blocked,
-        number_of_unique_users_blocking,
-        number_block_1,
-        number_blocking_2_and_100,
-        number_blocking_101_and_1000,
-        number_blocking_greater_than_1000,
-        average_number_of_blocks,
-        number_blocked_1,
-        number_blocked_2_and_100,
-        number_blocked_101_and_1000,
-        number_blocked_greater_than_1000,
-        average_number_of_blocked,
-        total_users,
-    ) = await database_handler.get_block_stats()
-
-    values = (
-        number_of_total_blocks,
-        number_of_unique_users_blocked,
-        number_of_unique_users_blocking,
-        number_block_1,
-        number_blocking_2_and_100,
-        number_blocking_101_and_1000,
-        number_blocking_greater_than_1000,
-        average_number_of_blocks,
-        number_blocked_1,
-        number_blocked_2_and_100,
-        number_blocked_101_and_1000,
-        number_blocked_greater_than_1000,
-        average_number_of_blocked,
-        total_users,
+    block_stats_pending = []
+
+    try:
+        serial, total_blocks, blocking_counts, blocked_counts, total_users = await database_handler.get_block_stats()
+    except (DatabaseConnectionError, InternalServerError):
+        # The previous recount stays the baseline, the changes held back go on top of it
+        pending = block_stats_pending
+        block_stats_pending = None
+        for change in pending:
+            apply_block_stats_change(*change)
+
+        block_stats_status.clear()
+
+        raise
+
+    pending = block_stats_pending
+    block_stats_pending = None
+
+    # The full recount is the correctness check of the incrementally maintained values, compared at the recount's
+    # serial_id once the block cache tail has applied every change up to it
+    expected_values = None
+    if block_stats_baseline is not None and database_handler.all_blocks_last_serial >= serial:
+        for change in pending:
+            if change[0] <= serial:
+                apply_block_stats_change(*change)
+
+        expected_values = current_block_stats()
+
+    block_stats_deltas.clear()
+    for distribution in block_distribution_deltas.values():
+        distribution.counts.clear()
+
+    block_stats_serial = serial
+    for change in pending:
+        apply_block_stats_change(*change)
+
+    baseline = {
+        "total_blocks": total_blocks,
+        "total_users": total_users,
+        "blocking": BlockCountDistribution(blocking_counts),
+        "blocked": BlockCountDistribution(blocked_counts),
+    }
+    values = block_stats_values(
+        total_blocks, {direction: baseline[direction] for direction in block_directions}, total_users
     )
 
-    for value in values:
-        if value is None:
-            logger.warning(f"{value=}")
-
-    number_of_total_blocks_cache["total_blocks"] = number_of_total_blocks
-    number_of_unique_users_blocked_cache["unique_blocked"] = number_of_unique_users_blocked
-    number_of_unique_users_blocking_cache["unique_blocker"] = number_of_unique_users_blocking
-    number_block_1_cache["block1"] = number_block_1
-    number_blocking_2_and_100_cache["block2to100"] = number_blocking_2_and_100
-    number_blocking_101_and_1000_cache["block101to1000"] = number_blocking_101_and_1000
-    number_blocking_greater_than_1000_cache["blockmore1000"] = number_blocking_greater_than_1000
-    average_number_of_blocking_cache["averageblocks"] = average_number_of_blocks
-    number_blocked_1_cache["blocked1"] = number_blocked_1
-    number_blocked_2_and_100_cache["blocked2to100"] = number_blocked_2_and_100
-    number_blocked_101_and_1000_cache["blocked101to1000"] = number_blocked_101_and_1000
-    number_blocked_greater_than_1000_cache["blockedmore1000"] = number_blocked_greater_than_1000
-    average_number_of_blocked_cache["averageblocked"] = average_number_of_blocked
-    block_stats_total_users_cache["total_users"] = total_users
+    if expected_values is not None:
+        drift = {
+            name: values[name] - expected_values[name]
+            for name in block_stats_fields
+            if not name.startswith("average") and values[name] != expected_values[name]
+        }
+
+        if drift:
+            logger.info(f"Block stats drift corrected by recount: {drift}")
+
+    block_stats_baseline = baseline
 
     block_stats_status.clear()
 
+    # Changes applied while the recount ran are kept on top of it
+    distributions = current_block_distributions()
+    set_block_statistics_cache(current_block_stats(distributions), distributions)
+
     end_time = datetime.now(timezone.utc)
 
     if block_stats_start_time is not None:
@@ -345,22 +570,14 @@ async def update_block_statistics():
 
     block_stats_as_of_time = datetime.now(timezone.utc).isoformat()
 
-    return (
-        number_of_total_blocks,
-        number_of_unique_users_blocked,
-        number_of_unique_users_blocking,
-        number_block_1,
-        number_blocking_2_and_100,
-        number_blocking_101_and_1000,
-        number_blocking_greater_than_1000,
-        average_number_of_blocks,
-        number_blocked_1,
-        number_blocked_2_and_100,
-        number_blocked_101_and_1000,
-        number_blocked_greater_than_1000,
-        average_number_of_blocked,
-        total_users,
-    )
+    percentiles = {
+        f"{direction}_{name}": value
+        for direction in block_directions
+        for name, value in baseline[direction].percentiles().items()
+    }
+    await stats_history.record_point("block_stats", dict(values, **percentiles))
+
+    return tuple(values[name] for name in block_stats_fields)
 
 
 async def update_total_users() -> (int, int, int):
@@ -397,11 +614,49 @@ async def update_total_users() -> (int, int, int):
 
     total_users_as_of_time = datetime.now(timezone.utc).isoformat()
 
+    await stats_history.record_point(
+        "total_users",
+        {"total_users": total_count, "active_users": active_count, "deleted_users": deleted_count},
+    )
+
     logger.info("Total users update complete.")
 
     return active_count, total_count, deleted_count
 
 
+def encode_page_cursor(date, *keys) -> str:
+    # Opaque keyset cursor, the date and tie-breaking keys of the last item of a page as url safe base64 of a JSON list
+    token = base64.urlsafe_b64encode(json.dumps([date, *keys], separators=(",", ":")).encode()).decode()
+
+    return token.rstrip("=")
+
+
+def decode_page_cursor(token, key_count=1):
+    # (datetime, *keys) to continue after, an empty token starts at the first page, None for an invalid token or one
+    # with another number of keys
+    if not token:
+        return page_cursor_start, *[""] * key_count
+
+    try:
+        date, *keys = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        after = datetime.fromisoformat(date)
+    except (ValueError, TypeError):
+        return None
+
+    if after.tzinfo is None or len(keys) != key_count or not all(isinstance(key, str) for key in keys):
+        return None
+
+    return after, *keys
+
+
+def next_page_cursor(items, date_key, limit, keys=("uri",)) -> str | None:
+    # None once a page comes back short, there is nothing after it
+    if not items or len(items) < limit:
+        return None
+
+    return encode_page_cursor(items[-1][date_key], *(items[-1][key] for key in keys))
+
+
 async def process_user_block_list(ident, limit, offset):
     block_list = []
 
@@ -419,10 +674,10 @@ async def process_user_block_list(ident, limit, offset):
         return block_list
 
 
-async def process_subscribe_blocks(ident, limit, offset):
+async def process_subscribe_blocks(ident, limit, offset, after=None):
     block_list = {}
 
-    blocked_users = await database_handler.get_subscribe_blocks(ident, limit=limit, offset=offset)
+    blocked_users = await database_handler.get_subscribe_blocks(ident, limit=limit, offset=offset, after=after)
 
     if not blocked_users:
         logger.info(f"{ident} Hasn't subscribed blocked any lists.")
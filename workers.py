@@ -0,0 +1,130 @@
+# workers.py
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config_helper import config, logger
+from errors import InternalServerError
+from minhash_index import MinHashIndex
+
+# ======================================================================================================================
+# ============================================== global variables ======================================================
+max_workers = config.getint("similarity", "max_workers", fallback=2)
+max_concurrent = config.getint("similarity", "max_concurrent", fallback=max_workers)
+
+similarity_mode = config.get("similarity", "mode", fallback="exact").lower()  # exact or approximate
+lsh_bands = config.getint("similarity", "lsh_bands", fallback=16)
+lsh_rows = config.getint("similarity", "lsh_rows", fallback=4)
+lsh_min_blocks = config.getint("similarity", "lsh_min_blocks", fallback=2)
+lsh_max_candidates = config.getint("similarity", "lsh_max_candidates", fallback=500)
+# blocked_by entries the exact containment pass may walk per request, trading latency for recall
+lsh_exact_budget = config.getint("similarity", "lsh_exact_budget", fallback=1000000)
+precompute_min_blocks = config.getint("similarity", "precompute_min_blocks", fallback=1000)
+precompute_batch_size = config.getint("similarity", "precompute_batch_size", fallback=50)
+
+executor = None
+executor_graph = None
+executor_index = None
+similarity_semaphore = asyncio.Semaphore(max_concurrent)
+
+# Never forked from the event loop process, its threads may hold locks the children would inherit. Workers start from a
+# clean interpreter and a snapshot-backed graph pickles as its path, so each worker maps the snapshot file itself.
+mp_context = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+worker_graph = None  # Only set inside worker processes
+worker_index = None  # Only set inside worker processes
+
+
+# ======================================================================================================================
+# ============================================= Worker process functions ===============================================
+def initialize_worker(graph, index) -> None:
+    global worker_graph
+    global worker_index
+
+    worker_graph = graph
+    worker_index = index
+
+
+def similar_blockers(did: str, limit: int) -> list[tuple[str, float]] | None:
+    if worker_index is not None:
+        return worker_index.similar_blockers(
+            worker_graph, did, limit=limit, max_candidates=lsh_max_candidates, exact_budget=lsh_exact_budget
+        )
+
+    return worker_graph.similar_blockers(did, limit=limit)
+
+
+def similar_blockers_batch(dids: list[str], limit: int) -> list[tuple[str, list[tuple[str, float]] | None]]:
+    # One row block of the blocklist overlap product A * A^T, only the top entries of each row are kept
+    return [(did, worker_graph.similar_blockers(did, limit=limit)) for did in dids]
+
+
+def similar_blocked(did: str, limit: int) -> list[tuple[str, float]] | None:
+    return worker_graph.similar_blocked(did, limit=limit)
+
+
+# ======================================================================================================================
+# ============================================== Event loop functions ==================================================
+def build_similarity_index(graph) -> MinHashIndex | None:
+    if similarity_mode != "approximate":
+        return None
+
+    return MinHashIndex.build(graph, lsh_bands, lsh_rows, lsh_min_blocks)
+
+
+# Only called with a new base graph, never the overlay, the workers serve it until the next compaction or load
+def start_workers(graph, index=None) -> None:
+    global executor
+    global executor_graph
+    global executor_index
+
+    previous_executor = executor
+
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=mp_context,
+        initializer=initialize_worker,
+        initargs=(graph, index),
+    )
+    executor_graph = graph
+    executor_index = index
+
+    logger.info(f"Similarity workers started: {max_workers} processes, {max_concurrent} concurrent requests.")
+
+    if previous_executor is not None:
+        # Requests already running against the previous graph are allowed to finish
+        previous_executor.shutdown(wait=False)
+
+
+async def run_similarity(func, *args):
+    if executor is None:
+        logger.error("Similarity workers not started.")
+
+        raise InternalServerError
+
+    # Waiting here rather than in the executor queue means a disconnected client is cancelled before any work starts.
+    # Once submitted, the slot is held until the worker finishes, cancelling the request does not stop the worker.
+    await similarity_semaphore.acquire()
+
+    loop = asyncio.get_running_loop()
+    submitted = False
+
+    try:
+        future = executor.submit(func, *args)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(similarity_semaphore.release))
+        submitted = True
+
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        logger.error("Similarity worker pool broken, restarting workers.")
+
+        start_workers(executor_graph, executor_index)
+
+        raise InternalServerError
+    finally:
+        if not submitted:
+            similarity_semaphore.release()